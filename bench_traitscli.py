@@ -0,0 +1,651 @@
+"""
+Benchmarks for traitscli.
+
+Run all benchmarks::
+
+  python bench_traitscli.py
+
+or only some of them::
+
+  python bench_traitscli.py server
+
+"""
+
+import os
+import sys
+import time
+import subprocess
+from contextlib import contextmanager
+
+BENCHMARKS = []
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def benchmark(func):
+    """Register `func` as a benchmark named after the function."""
+    BENCHMARKS.append(func)
+    return func
+
+
+def best_of(func, number=1, repeat=3):
+    """Return the best time per call (in seconds) of `func`."""
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        for _ in range(number):
+            func()
+        times.append((time.time() - start) / number)
+    return min(times)
+
+
+def report(name, seconds, baseline=None):
+    line = '  {0:<40} {1:10.3f} ms'.format(name, seconds * 1e3)
+    if baseline:
+        line += '  (x{0:.2f})'.format(baseline / seconds)
+    print line
+
+
+def call_quietly(command):
+    with open(os.devnull, 'w') as devnull:
+        subprocess.check_call(command, cwd=HERE, stdout=devnull)
+
+
+@contextmanager
+def cli_server(target, path):
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'traitscli_server', '--serve', target, path],
+        cwd=HERE)
+    try:
+        while not os.path.exists(path):
+            time.sleep(0.01)
+        yield
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+@benchmark
+def server(number=20):
+    """Latency of ``sample.py --yes``: plain execution vs. server."""
+    import tempfile
+    plain = best_of(
+        lambda: call_quietly([sys.executable, 'sample.py', '--yes']),
+        number=number)
+    report('plain execution', plain)
+    path = os.path.join(tempfile.mkdtemp(), 'sample.sock')
+    with cli_server('sample:SampleCLI', path):
+        client = best_of(
+            lambda: call_quietly([sys.executable, '-m', 'traitscli_server',
+                                  path, '--yes']),
+            number=number)
+    report('traitscli_server client', client, plain)
+
+
+def make_nested_class(num, name='NestedCLI'):
+    """Make a CLI class with `num` nested sub-objects ``s0``, ``s1``, ..."""
+    from traits.api import Bool, Float, Instance, Int, Str
+    from traitscli import TraitsCLIBase
+
+    class Sub(TraitsCLIBase):
+        int = Int(config=True)
+        float = Float(config=True)
+        str = Str(config=True)
+        bool = Bool(config=True)
+
+    attrs = dict(('s{0}'.format(i), Instance(Sub, args=(), config=True))
+                 for i in range(num))
+    return type(name, (TraitsCLIBase,), attrs)
+
+
+def legacy_loader_conf(cls, path, _open=open):
+    """`TraitsCLIBase.loader_conf` as of traitscli 0.1 (ConfigParser)."""
+    import ConfigParser
+    from traits.api import Bool, CBool
+    from traitscli import flattendict, trait_simple_type
+    config = ConfigParser.ConfigParser()
+    with _open(path) as file:
+        config.readfp(file)
+    traits = flattendict(cls.config_traits())
+    param = {}
+    for sect in config.sections():
+        prefix = '' if sect == cls.cli_conf_root_section else sect + '.'
+        for option in config.options(sect):
+            key = prefix + option
+            trait_type = traits[key].trait_type
+            if isinstance(trait_type, (Bool, CBool)):
+                param[key] = config.getboolean(sect, option)
+            else:
+                val = config.get(sect, option)
+                stype = trait_simple_type(trait_type)
+                param[key] = stype(val) if stype else val
+    return param
+
+
+@benchmark
+def loader_conf(sections=(100, 1000, 5000)):
+    """Conf loader: ConfigParser based (v0.1) vs. single-pass reader."""
+    import tempfile
+    for num in sections:
+        cls = make_nested_class(num)
+        (fd, path) = tempfile.mkstemp(suffix='.conf')
+        with os.fdopen(fd, 'w') as file:
+            for i in range(num):
+                file.write('[s{0}]\nint = {0}\nfloat = 0.5\n'
+                           'str = value {0}\nbool = yes\n'.format(i))
+        try:
+            assert legacy_loader_conf(cls, path) == cls.loader_conf(path)
+            legacy = best_of(lambda: legacy_loader_conf(cls, path))
+            report('ConfigParser, {0} sections'.format(num), legacy)
+            report('read_conf, {0} sections'.format(num),
+                   best_of(lambda: cls.loader_conf(path)), legacy)
+        finally:
+            os.unlink(path)
+
+
+@benchmark
+def loader_py(lines=(1000, 20000)):
+    """Python paramfile: compile every time vs. cached code object."""
+    import shutil
+    import tempfile
+    from traitscli import TraitsCLIBase
+
+    class Cached(TraitsCLIBase):
+        cli_py_cache = True
+
+    tmpdir = tempfile.mkdtemp()
+    os.environ['TRAITSCLI_CACHE_DIR'] = tmpdir
+    try:
+        for num in lines:
+            path = os.path.join(tmpdir, 'param{0}.py'.format(num))
+            with open(path, 'w') as file:
+                for i in range(num):
+                    file.write('a{0} = dict(x={0}, y=[{0}, "{0}"])\n'
+                               .format(i))
+            nocache = best_of(lambda: TraitsCLIBase.loader_py(path))
+            report('compile, {0} lines'.format(num), nocache)
+            report('cached, {0} lines'.format(num),
+                   best_of(lambda: Cached.loader_py(path)), nocache)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+@benchmark
+def backends(num=2000):
+    """Paramfile decoders: pure-Python vs. accelerated backends."""
+    import json
+    import yaml
+    import tempfile
+    from traitscli import paramfile_backends
+    data = dict(('key{0}'.format(i),
+                 {'int': i, 'float': i / 3.0, 'str': 'v' * (i % 20),
+                  'list': range(i % 10)})
+                for i in range(num))
+    writers = dict(
+        json=lambda file: json.dump(data, file),
+        yaml=lambda file: yaml.safe_dump(data, file),
+    )
+    try:
+        import msgpack
+        writers['msgpack'] = lambda file: msgpack.pack(data, file)
+    except ImportError:
+        pass
+    for (fmt, write) in sorted(writers.items()):
+        (fd, path) = tempfile.mkstemp()
+        with os.fdopen(fd, 'wb') as file:
+            write(file)
+        try:
+            baseline = None
+            for backend in reversed(paramfile_backends(fmt)):
+                if not backend.available():
+                    report('{0}: {1} (not installed)'.format(
+                        fmt, backend.name), float('nan'))
+                    continue
+
+                def load():
+                    with open(path, 'rb') as file:
+                        backend.load(file)
+
+                elapsed = best_of(load)
+                report('{0}: {1}'.format(fmt, backend.name),
+                       elapsed, baseline)
+                baseline = baseline or elapsed
+        finally:
+            os.unlink(path)
+
+
+@benchmark
+def parser(num=50, size=100000):
+    """Parser build: eager help strings (v0.1) vs. lazy help strings."""
+    from traits.api import Dict, List
+    from traitscli import TraitsCLIBase
+    attrs = {}
+    for i in range(num):
+        attrs['l{0}'.format(i)] = List(range(size), config=True)
+        attrs['d{0}'.format(i)] = Dict(
+            dict((str(j), j) for j in range(size // 10)), config=True)
+    cls = type('LargeDefaultCLI', (TraitsCLIBase,), attrs)
+    traits = cls.class_traits(config=True)
+
+    def eager():
+        cls.get_argparser()
+        for v in traits.itervalues():
+            '{0} (default: {1})'.format(v.desc or '', v.default)
+
+    baseline = best_of(eager)
+    report('eager help, {0} large defaults'.format(2 * num), baseline)
+    report('lazy help, {0} large defaults'.format(2 * num),
+           best_of(cls.get_argparser), baseline)
+    report('lazy help + format_help()',
+           best_of(lambda: cls.get_argparser().format_help()), baseline)
+
+
+@benchmark
+def enum(size=50000, number=100):
+    """Enum with many values: argparse choices vs. EnumChoices."""
+    from traits.api import Enum
+    from traitscli import TraitsCLIBase, hidestderr
+    values = ['dataset-{0:05}'.format(i) for i in range(size)]
+    cls = type('LargeEnumCLI', (TraitsCLIBase,),
+               dict(dataset=Enum(values, config=True)))
+    plain = TraitsCLIBase.ArgumentParser()
+    plain.add_argument('--dataset', choices=values)
+    large = cls.get_argparser()
+    args = ['--dataset', values[-1]]
+
+    def invalid(parser):
+        try:
+            with hidestderr():
+                parser.parse_args(['--dataset', 'datset-01234'])
+        except SystemExit:
+            pass
+
+    for (name, func) in [
+            ('valid value', lambda parser: parser.parse_args(args)),
+            ('invalid value', invalid),
+            ('format_usage', lambda parser: parser.format_usage())]:
+        baseline = best_of(lambda: func(plain), number=number)
+        report('choices: {0}'.format(name), baseline)
+        report('EnumChoices: {0}'.format(name),
+               best_of(lambda: func(large), number=number), baseline)
+
+
+def legacy_parse_dict_like_options(argiter):
+    """`parse_dict_like_options` as of traitscli 0.1."""
+    options = []
+    positional = []
+    argiter = iter(argiter)
+    while True:
+        try:
+            arg = argiter.next()
+        except StopIteration:
+            return (options, positional)
+        if arg.startswith('--') and len(arg) > 2 and arg[2].isalpha() \
+           and '[' in arg:
+            key = arg[2:]
+            if '=' in key:
+                options.append(tuple(key.split('=', 1)))
+            else:
+                options.append((key, argiter.next()))
+        else:
+            positional.append(arg)
+
+
+@benchmark
+def tokenizer(sizes=(100000, 200000, 400000)):
+    """Dict-like option tokenizer: v0.1 vs. single-pass tokenizer."""
+    from traitscli import parse_dict_like_options
+    for num in sizes:
+        args = []
+        for i in range(num // 4):
+            args.extend(['--sub{0}.int'.format(i), str(i),
+                         "--sub{0}.dict['k']={0}".format(i),
+                         'file{0}.txt'.format(i)])
+        baseline = best_of(lambda: legacy_parse_dict_like_options(args),
+                           repeat=5)
+        report('v0.1, {0} tokens'.format(num), baseline)
+        report('single-pass, {0} tokens'.format(num),
+               best_of(lambda: parse_dict_like_options(args), repeat=5),
+               baseline)
+
+
+@benchmark
+def fast_parser(num=10000, given=200):
+    """Many options: argparse vs. FastArgumentParser."""
+    from traits.api import Bool, Float, Int, Str
+    from traitscli import TraitsCLIBase, FastArgumentParser
+    types = [Int, Float, Bool, Str]
+    attrs = dict(('o{0}'.format(i), types[i % 4](config=True))
+                 for i in range(num))
+    slow = type('ManyOptionsCLI', (TraitsCLIBase,), attrs)
+    fast = type('FastManyOptionsCLI', (slow,),
+                dict(ArgumentParser=FastArgumentParser))
+    args = []
+    for i in range(0, given, 4):
+        args.extend(['--o{0}'.format(i), str(i), '--o{0}'.format(i + 1),
+                     '0.5', '--o{0}'.format(i + 2), '--o{0}=s'.format(i + 3)])
+
+    baseline = best_of(slow.get_argparser)
+    report('argparse: build, {0} options'.format(num), baseline)
+    report('FastArgumentParser: build', best_of(fast.get_argparser),
+           baseline)
+    (slow_parser, fast_parser) = (slow.get_argparser(), fast.get_argparser())
+    (expected, actual) = (vars(slow_parser.parse_args(args)),
+                          vars(fast_parser.parse_args(args)))
+    del expected['func'], actual['func']  # bound to different classes
+    assert expected == actual
+    baseline = best_of(lambda: slow_parser.parse_args(args), number=10)
+    report('argparse: parse {0} options'.format(given), baseline)
+    report('FastArgumentParser: parse',
+           best_of(lambda: fast_parser.parse_args(args), number=10),
+           baseline)
+
+
+def legacy_applyargs(func, **kwds):
+    """Hand-off from `parse_and_run` to `run` as of traitscli 0.1."""
+    from traitscli import _UNSPECIFIED
+    return func(**dict((k, v) for (k, v) in kwds.iteritems()
+                       if v is not _UNSPECIFIED))
+
+
+@benchmark
+def plumbing(num=10000):
+    """Parsed options to `run`: keyword arguments vs. ParsedOptions."""
+    from traits.api import Int
+    from traitscli import TraitsCLIBase, ParsedOptions
+    attrs = dict(('o{0}'.format(i), Int(config=True)) for i in range(num))
+    cls = type('ManyOptionsCLI', (TraitsCLIBase,), attrs)
+    ns = cls.get_argparser().parse_args(['--o1', '1', '--o2', '2'])
+
+    def legacy():
+        kwds = dict(vars(ns), func=cls.run)
+        legacy_applyargs(__dict_like_options=[], **kwds)
+
+    baseline = best_of(legacy, number=10)
+    report('keyword arguments, {0} options'.format(num), baseline)
+    report('ParsedOptions',
+           best_of(lambda: ParsedOptions.from_dict(vars(ns)).apply(),
+                   number=10),
+           baseline)
+
+
+@benchmark
+def commands(num=200, options=50):
+    """Multi-command tool: build all parsers vs. only the selected one."""
+    import shutil
+    import tempfile
+    from traitscli import multi_command_argparser
+    tmpdir = tempfile.mkdtemp()
+    names = ['bench_command_{0}'.format(i) for i in range(num)]
+    for name in names:
+        with open(os.path.join(tmpdir, name + '.py'), 'w') as file:
+            file.write('from traits.api import Int\n'
+                       'from traitscli import TraitsCLIBase\n'
+                       'class CLI(TraitsCLIBase):\n')
+            for j in range(options):
+                file.write('    o{0} = Int(config=True)\n'.format(j))
+    pairs = [(name, name + ':CLI') for name in names]
+    args = [names[-1], '--o1', '1']
+    sys.path.insert(0, tmpdir)
+
+    def run(**kwds):
+        for name in names:
+            sys.modules.pop(name, None)
+        multi_command_argparser(pairs, **kwds).parse_args(args)
+
+    try:
+        eager = best_of(run)
+        report('all parsers, {0} commands'.format(num), eager)
+        report('selected parser', best_of(lambda: run(args=args)), eager)
+    finally:
+        sys.path.remove(tmpdir)
+        shutil.rmtree(tmpdir)
+
+
+@benchmark
+def discovery(number=5):
+    """Entry point discovery: scan distributions vs. on-disk cache."""
+    import shutil
+    import tempfile
+    code = ('import traitscli; '
+            'traitscli.discover_commands("console_scripts")')
+    tmpdir = tempfile.mkdtemp()
+    os.environ['TRAITSCLI_CACHE_DIR'] = tmpdir
+
+    def scan():
+        shutil.rmtree(os.path.join(tmpdir, 'entry_points'),
+                      ignore_errors=True)
+        call_quietly([sys.executable, '-c', code])
+
+    try:
+        baseline = best_of(scan, number=number)
+        report('pkg_resources scan (new process)', baseline)
+        report('cached (new process)',
+               best_of(lambda: call_quietly([sys.executable, '-c', code]),
+                       number=number),
+               baseline)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+PIPELINE_TOOL = """
+import sys
+from traits.api import Dict, Str
+from traitscli import TraitsCLIBase, multi_command_cli
+
+class Stage(TraitsCLIBase):
+    table = Dict(config=True)
+    paramfile = Str(cli_paramfile=True, config=True)
+
+multi_command_cli([('prepare', Stage), ('train', Stage), ('evaluate', Stage)],
+                  pipeline=sys.argv[1] == 'pipeline', args=sys.argv[2:])
+"""
+
+
+@benchmark
+def pipeline(size=100000):
+    """Three commands sharing a paramfile: processes vs. one pipeline."""
+    import json
+    import shutil
+    import tempfile
+    tmpdir = tempfile.mkdtemp()
+    param = os.path.join(tmpdir, 'param.json')
+    tool = [sys.executable, '-c', PIPELINE_TOOL]
+    with open(param, 'w') as file:
+        json.dump(dict(table=dict(('k{0}'.format(i), i)
+                                  for i in range(size))), file)
+    stages = ['prepare', 'train', 'evaluate']
+
+    def processes():
+        for name in stages:
+            call_quietly(tool + ['single', name, '--paramfile', param])
+
+    def one_pipeline():
+        args = []
+        for name in stages:
+            args.extend(['--', name, '--paramfile', param])
+        call_quietly(tool + ['pipeline'] + args[1:])
+
+    try:
+        baseline = best_of(processes)
+        report('3 processes, {0} entries'.format(size), baseline)
+        report('pipeline', best_of(one_pipeline), baseline)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+@benchmark
+def sweep(num=200000):
+    """Select a record of a sweep file: decode all vs. offset index."""
+    import json
+    import shutil
+    import tempfile
+    from cStringIO import StringIO
+    from traitscli import paramfile_backend, sweep_record
+    tmpdir = tempfile.mkdtemp()
+    path = os.path.join(tmpdir, 'sweep.ndjson')
+    with open(path, 'w') as file:
+        for i in range(num):
+            file.write(json.dumps(dict(lr=i * 1e-5, seed=i, name=str(i),
+                                       layers=[i % 7] * 8)) + '\n')
+    load = paramfile_backend('json').load
+    index = num // 2
+
+    def decode_all():
+        with open(path) as file:
+            return [load(StringIO(line)) for line in file][index]
+
+    def build_index():
+        os.unlink(path + '.idx')
+        return sweep_record(path, index)
+
+    try:
+        assert decode_all() == sweep_record(path, index)
+        baseline = best_of(decode_all)
+        report('decode all, {0} records'.format(num), baseline)
+        report('build index + one record', best_of(build_index), baseline)
+        report('cached index + one record',
+               best_of(lambda: sweep_record(path, index), number=100),
+               baseline)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+@benchmark
+def queue(num=100000, tasks=2000, workers=4):
+    """Work queue: enqueue throughput and tasks/s with worker processes."""
+    import shutil
+    import tempfile
+    from traitscli_queue import WorkQueue
+    tmpdir = tempfile.mkdtemp()
+    path = os.path.join(tmpdir, 'queue.sqlite')
+    try:
+        start = time.time()
+        WorkQueue(path).enqueue({'int': i} for i in range(num))
+        report('enqueue {0} configurations'.format(num),
+               time.time() - start)
+        start = time.time()
+        WorkQueue(path).enqueue({'int': i} for i in range(num))
+        report('enqueue again (all skipped)', time.time() - start)
+
+        path = os.path.join(tmpdir, 'tasks.sqlite')
+        WorkQueue(path).enqueue({'inum': i} for i in range(tasks))
+        start = time.time()
+        with open(os.devnull, 'w') as devnull:
+            procs = [subprocess.Popen(
+                [sys.executable, '-m', 'traitscli_queue', 'work', path,
+                 'sample:SampleCLI'], cwd=HERE, stdout=devnull)
+                for _ in range(workers)]
+            for proc in procs:
+                proc.wait()
+        elapsed = time.time() - start
+        assert WorkQueue(path).counts()['done'] == tasks
+        report('{0} tasks by {1} workers (per task)'.format(
+            tasks, workers), elapsed / tasks)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+@benchmark
+def validate(num=500):
+    """Checking a configuration: instantiation vs. validate_config."""
+    cls = make_nested_class(num)
+    params = dict(('s{0}'.format(i), dict(int=i, float=0.5, str='x',
+                                          bool=True))
+                  for i in range(num))
+
+    def instantiate():
+        cls().setattrs(params)
+
+    baseline = best_of(instantiate, number=5)
+    report('instantiate + setattrs, {0} sub-objects'.format(num), baseline)
+    start = time.time()
+    assert cls.validate_config(params) == []
+    report('validate_config (first call, compiling)', time.time() - start,
+           baseline)
+    report('validate_config',
+           best_of(lambda: cls.validate_config(params), number=5),
+           baseline)
+
+
+@benchmark
+def validate_tree(num=5000):
+    """Validating a directory of paramfiles: instances vs. validators."""
+    import json
+    import shutil
+    import tempfile
+    import multiprocessing
+    from traitscli_validate import iter_paramfiles, validate_tree
+    from sample import SampleCLI
+    tmpdir = tempfile.mkdtemp()
+    try:
+        for i in range(num):
+            subdir = os.path.join(tmpdir, str(i % 100))
+            if not os.path.isdir(subdir):
+                os.mkdir(subdir)
+            with open(os.path.join(subdir, '{0}.json'.format(i)), 'w') as f:
+                json.dump({'inum': i, 'fnum': 0.5, 'string': 'x',
+                           'choice': 'b'}, f)
+
+        def instantiate():
+            for path in iter_paramfiles(tmpdir, ['json']):
+                SampleCLI().load_paramfile(path)
+
+        baseline = best_of(instantiate, repeat=1)
+        report('instance per file, {0} files'.format(num), baseline)
+        jobs = multiprocessing.cpu_count()
+        for n in sorted(set([1, jobs])):
+            report('validate_tree, {0} process(es)'.format(n),
+                   best_of(lambda: list(validate_tree(
+                       tmpdir, 'sample:SampleCLI', n)), repeat=1),
+                   baseline)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+IMPORT_BUDGET = 0.02
+"""Seconds ``import traitscli`` should take after `traits.api`."""
+
+
+@benchmark
+def startup(number=20):
+    """Cold-start of ``python sample.py --yes`` and what it imports."""
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)  # measure with .pyc files
+
+    def python(*args):
+        with open(os.devnull, 'w') as devnull:
+            subprocess.check_call((sys.executable,) + args, cwd=HERE,
+                                  stdout=devnull, env=env)
+
+    python('-c', 'import traitscli')  # write .pyc
+    baseline = best_of(lambda: python('-c', 'pass'), repeat=number)
+    report('python -c pass', baseline)
+    for (name, args) in [
+            ('import traits.api', ('-c', 'import traits.api')),
+            ('import traitscli', ('-c', 'import traitscli')),
+            ('sample.py --yes', ('sample.py', '--yes')),
+    ]:
+        report(name, best_of(lambda: python(*args), repeat=number))
+    code = ('import time, traits.api, argparse; t = time.time(); '
+            'import traitscli; print time.time() - t')
+    elapsed = min(
+        float(subprocess.check_output([sys.executable, '-c', code],
+                                      cwd=HERE, env=env))
+        for _ in range(number))
+    report('import traitscli after traits.api', elapsed)
+    if elapsed > IMPORT_BUDGET:
+        print '  over budget of {0:.0f} ms!'.format(IMPORT_BUDGET * 1e3)
+
+
+def main(args=None):
+    if args is None:
+        args = sys.argv[1:]
+    for func in BENCHMARKS:
+        if args and func.__name__ not in args:
+            continue
+        print '{0}: {1}'.format(func.__name__, func.__doc__)
+        func()
+
+
+if __name__ == '__main__':
+    main()
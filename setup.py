@@ -18,7 +18,8 @@ data = parse_traitscli()
 setup(
     name='traitscli',
     version=data['__version__'],
-    py_modules=['traitscli'],
+    py_modules=['traitscli', 'traitscli_server', 'traitscli_completion',
+                'traitscli_queue', 'traitscli_validate'],
     author=data['__author__'],
     author_email='aka.tkf@gmail.com',
     url='https://github.com/tkf/traitscli',
@@ -1,3 +1,9 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
 from argparse import ArgumentParser
 import unittest
 from contextlib import contextmanager
@@ -5,14 +11,36 @@ from contextlib import contextmanager
 from traits.api import (
     HasTraits,
     Str, Int, Float, Bool, List, Dict,
-    Instance, Callable, Type,
-    Event,
+    Instance, Callable, Type, Enum,
+    Event, Any,
 )
 
-from traitscli import TraitsCLIBase, multi_command_cli, flattendict
+from traitscli import (
+    TraitsCLIBase, multi_command_cli, flattendict,
+    DirectoryMemoStore, SQLiteMemoStore,
+    TraitsCLIAttributeError, read_conf, FastArgumentParser,
+    ParsedOptions, parse_and_run, takes_parsed_options,
+)
 from sample import SampleCLI
 
 
+_orig_environ = None
+
+
+def setup_module():
+    # Keep caches written by tests (see `traitscli.cache_dir`) out of
+    # the home directory.
+    global _orig_environ
+    _orig_environ = os.environ.copy()
+    os.environ['TRAITSCLI_CACHE_DIR'] = tempfile.mkdtemp()
+
+
+def teardown_module():
+    shutil.rmtree(os.environ['TRAITSCLI_CACHE_DIR'])
+    os.environ.clear()
+    os.environ.update(_orig_environ)
+
+
 class ArgumentParserExitCalled(Exception):
     pass
 
@@ -175,6 +203,15 @@ class TestDictLikeOptions(TestCaseBase):
         self.assert_invalid_args(['--dict["k"]', 'undefined_name'])
         self.assert_invalid_args(['--dict["k"]; print 1', '"x"'])
         self.assert_invalid_args(['--dict["k"] + 2', '"x"'])
+        self.assert_invalid_args(['--dict["k"]'])
+
+    def test_subscript_with_equal_sign(self):
+        obj = self.run_cli(["--dict['a=b']=1"])
+        self.assertEqual(obj.dict, {'a=b': 1})
+
+    def test_normal_option_with_bracket(self):
+        obj = self.run_cli(['--list=[1, 2]'])
+        self.assertEqual(obj.list, [1, 2])
 
 
 class TestMultiCommandCLI(TestCaseBase):
@@ -210,6 +247,35 @@ class TestMultiCommandCLI(TestCaseBase):
         self.assert_invalid_args(['cmd_2', '--dict', '{}'])  # cmd_1 option
 
 
+class TestNestedMultiCommandCLI(TestMultiCommandCLI):
+
+    def run_cli(self, args):
+        pairs = [('cmd_1', self.cliclass_1),
+                 ('group', [('cmd_2', self.cliclass_2),
+                            ('missing', 'no_such_module:SomeCLI')])]
+        return multi_command_cli(pairs, args)
+
+    def test_run_2_empty_args(self):
+        ret = self.run_cli(['group', 'cmd_2', '--float', '1.5'])
+        self.assertTrue(isinstance(ret, self.cliclass_2))
+        self.assertEqual(ret.float, 1.5)
+
+    def test_invalid_args(self):
+        self.assert_invalid_args(['--invalid', 'x'])  # no sub-command
+        self.assert_invalid_args(['group'])
+        self.assert_invalid_args(['group', 'cmd_1'])
+        self.assert_invalid_args(['cmd_2'])
+        self.assert_invalid_args(['group', 'cmd_2', '--dict', '{}'])
+
+    def test_lazy_import(self):
+        self.assertRaises(ImportError, self.run_cli, ['group', 'missing'])
+
+    def test_string_target(self):
+        ret = multi_command_cli(
+            [('named', 'test_traitscli:NamedSubObject')], ['named'])
+        self.assertTrue(isinstance(ret, NamedSubObject))
+
+
 class TestDottedName(unittest.TestCase):
 
     class cliclass(TraitsCLIBase):
@@ -528,3 +594,1692 @@ class TestParamFileLoader(object):
         for (ext, datalist) in self.samples.iteritems():
             for index in range(len(datalist)):
                 yield (self.check_paramfile_loader, ext, index)
+
+
+class TestCLIServer(unittest.TestCase):
+
+    target = 'sample:SampleCLI'
+    startup_timeout = 30
+
+    def setUp(self):
+        self.here = os.path.dirname(os.path.abspath(__file__))
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'cli.sock')
+        self.server = subprocess.Popen(
+            [sys.executable, '-m', 'traitscli_server', '--serve',
+             self.target, self.path],
+            cwd=self.here, stderr=subprocess.PIPE)
+        deadline = time.time() + self.startup_timeout
+        while not os.path.exists(self.path):
+            if self.server.poll() is not None or time.time() > deadline:
+                self.tearDown()
+                self.fail('Server did not start:\n' +
+                          self.server.stderr.read())
+            time.sleep(0.01)
+
+    def tearDown(self):
+        if self.server.poll() is None:
+            self.server.terminate()
+        self.server.wait()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def call(self, args):
+        proc = subprocess.Popen(
+            [sys.executable, '-m', 'traitscli_server', self.path] + args,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=self.here)
+        (out, err) = proc.communicate()
+        return (proc.returncode, out, err)
+
+    def test_run(self):
+        (status, out, err) = self.call(['--inum', '3', '--string', 'x'])
+        self.assertEqual(status, 0)
+        lines = set(' '.join(l.split()) for l in out.splitlines())
+        self.assertTrue("inum : 3" in lines)
+        self.assertTrue("string : 'x'" in lines)
+
+    def test_invalid_args(self):
+        (status, out, err) = self.call(['--inum', 'x'])
+        self.assertEqual(status, 2)
+        self.assertTrue("invalid int value: 'x'" in err)
+
+
+class TestConfigDump(unittest.TestCase):
+
+    class cliclass(TestingCLIBase):
+        class subcliclass(TestingTraitsBase):
+            int = Int(config=True)
+            list = List(Str, config=True)
+        str = Str(config=True)
+        float = Float(config=True)
+        bool = Bool(config=True)
+        dict = Dict(config=True)
+        sub = Instance(subcliclass, args=(), config=True)
+        paramfile = Str(cli_paramfile=True, config=True)
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def make_instance(self):
+        return self.cliclass(**{
+            'str': 'some string', 'float': 0.1, 'bool': True,
+            'dict': {'a': [1, 2], 'b': {'c': None}},
+            'sub.int': 2, 'sub.list': ['x', 'y'],
+        })
+
+    def test_snapshot(self):
+        snapshot = self.make_instance().config_snapshot()
+        self.assertEqual(
+            list(snapshot),
+            ['bool', 'dict', 'float', 'str', 'sub.int', 'sub.list'])
+        self.assertEqual(type(snapshot['dict']), dict)
+        self.assertEqual(type(snapshot['sub.list']), list)
+
+    def test_fingerprint(self):
+        fp = self.make_instance().config_fingerprint()
+        self.assertEqual(fp, self.make_instance().config_fingerprint())
+        obj = self.make_instance()
+        obj.sub.list.append('z')
+        self.assertNotEqual(fp, obj.config_fingerprint())
+        obj.paramfile = 'ignored.json'
+        obj.sub.list.pop()
+        self.assertEqual(fp, obj.config_fingerprint())
+
+    def check_roundtrip(self, ext):
+        path = os.path.join(self.tmpdir, 'param.' + ext)
+        orig = self.make_instance()
+        orig.dump_config(path)
+        obj = self.cliclass()
+        obj.load_paramfile(path)
+        self.assertEqual(obj.config_snapshot(), orig.config_snapshot())
+
+    def test_roundtrip_json(self):
+        self.check_roundtrip('json')
+
+    def test_roundtrip_yaml(self):
+        self.check_roundtrip('yaml')
+
+    def test_roundtrip_conf(self):
+        self.check_roundtrip('conf')
+
+    def test_roundtrip_conf_strings(self):
+        class cliclass(self.cliclass):
+            any = Any(config=True)
+        path = os.path.join(self.tmpdir, 'param.conf')
+        for value in ['a\nb', '50%', '%(x)s', ' x ', '', "'q'", 'a ; b',
+                      '#x', '1', '[1]']:
+            orig = cliclass(str=value, any=value, sub=dict(list=[value]))
+            orig.dump_config(path)
+            obj = cliclass()
+            obj.load_paramfile(path)
+            self.assertEqual((obj.str, obj.any, obj.sub.list),
+                             (value, value, [value]))
+
+    def test_roundtrip_msgpack(self):
+        try:
+            import msgpack
+        except ImportError:
+            from nose import SkipTest
+            raise SkipTest('msgpack is not installed')
+        import warnings
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            self.check_roundtrip('msgpack')
+
+    def test_json_dump_is_fingerprinted(self):
+        import hashlib
+        path = os.path.join(self.tmpdir, 'param.json')
+        obj = self.make_instance()
+        obj.dump_config(path)
+        with open(path) as file:
+            content = file.read().rstrip('\n')
+        self.assertEqual(hashlib.sha256(content).hexdigest(),
+                         obj.config_fingerprint())
+
+
+class MemoTestingMixIn(object):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.calls = calls = []
+
+        class cliclass(TestingCLIBase):
+            int = Int(config=True)
+            cli_memo = self.make_store()
+
+            def do_run(self):
+                calls.append(self.int)
+                return [self.int] * 3
+
+        self.cliclass = cliclass
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_memoized(self):
+        self.assertEqual(self.cliclass.cli(['--int', '1']).cli_result,
+                         [1, 1, 1])
+        self.assertEqual(self.cliclass.cli(['--int', '1']).cli_result,
+                         [1, 1, 1])
+        self.assertEqual(self.calls, [1])
+        self.cliclass.cli(['--int', '2'])
+        self.assertEqual(self.calls, [1, 2])
+
+    def test_code_version(self):
+        self.cliclass.cli([])
+        self.cliclass.cli_code_version = '2'
+        self.cliclass.cli([])
+        self.cliclass.cli([])
+        self.assertEqual(self.calls, [0, 0])
+
+    def test_evict_by_size(self):
+        store = self.cliclass.cli_memo
+        store.max_size = 2500
+        for i in range(10):
+            store.set(str(i) * 4, 'x' * 1000)
+        store.get('9999')
+        self.assertRaises(KeyError, store.get, '0000')
+
+    def test_evict_by_age(self):
+        store = self.cliclass.cli_memo
+        store.set('key', 1)
+        store.max_age = -1
+        self.assertRaises(KeyError, store.get, 'key')
+        store.evict()
+        store.max_age = None
+        self.assertRaises(KeyError, store.get, 'key')
+
+
+class TestDirectoryMemoStore(MemoTestingMixIn, unittest.TestCase):
+
+    def make_store(self):
+        return DirectoryMemoStore(self.tmpdir)
+
+    def test_corrupt_file(self):
+        store = self.cliclass.cli_memo
+        store.set('key', [1] * 100)
+        path = store._path('key')
+        with open(path, 'r+b') as file:
+            file.truncate(10)
+        self.assertRaises(KeyError, store.get, 'key')
+        self.assertFalse(os.path.exists(path))
+
+    def test_file_mode(self):
+        store = self.cliclass.cli_memo
+        umask = os.umask(0o022)
+        try:
+            store.set('key', 1)
+        finally:
+            os.umask(umask)
+        self.assertEqual(os.stat(store._path('key')).st_mode & 0o777, 0o644)
+
+
+class TestSQLiteMemoStore(MemoTestingMixIn, unittest.TestCase):
+
+    def make_store(self):
+        return SQLiteMemoStore(os.path.join(self.tmpdir, 'memo.sqlite'))
+
+
+class TestConfLoader(unittest.TestCase):
+
+    class cliclass(TestingCLIBase):
+        class subcliclass(TestingTraitsBase):
+            int = Int(config=True)
+            str = Str(config=True)
+        int = Int(config=True)
+        bool = Bool(config=True)
+        list = List(config=True)
+        str = Str(config=True)
+        a = Instance(subcliclass, args=(), config=True)
+        b = Instance(subcliclass, args=(), config=True)
+
+    def load(self, source):
+        from textwrap import dedent
+        return read_conf(dedent(source).splitlines(True),
+                         self.cliclass, 'param.conf')
+
+    def assert_error(self, source, message):
+        try:
+            self.load(source)
+        except TraitsCLIAttributeError as e:
+            self.assertTrue(e.message.startswith(message), e.message)
+        else:
+            self.fail('TraitsCLIAttributeError is not raised')
+
+    def test_syntax(self):
+        param = self.load(
+            """\
+            # comment
+            [root]
+            int: 1  ; inline comment
+            bool = on
+            list = [1,
+              2, 3]
+            str = ""
+            [a]
+            int = 2
+            str = semicolon;not a comment
+            """)
+        self.assertEqual(param, {
+            'int': 1, 'bool': True, 'list': [1, 2, 3], 'str': '',
+            'a.int': 2, 'a.str': 'semicolon;not a comment'})
+
+    def test_non_simple_traits(self):
+        # Values of non-simple traits are evaluated as Python literals
+        # (they were raw strings in traitscli 0.1).  Enum values are
+        # looked up by their string representation.
+        class CLI(self.cliclass):
+            any = Any(config=True)
+            strenum = Enum(['1', '2'], config=True)
+            intenum = Enum([1, 2], config=True)
+
+        param = read_conf(
+            ['[root]\n', 'any = [1]\n', 'strenum = 2\n', 'intenum = 2\n',
+             'list = not a literal\n'], CLI)
+        self.assertEqual(param, {'any': [1], 'strenum': '2', 'intenum': 2,
+                                 'list': 'not a literal'})
+        self.assertEqual([k for (k, _) in CLI.validate_config(param)],
+                         ['list'])
+
+    def test_default_section(self):
+        param = self.load(
+            """\
+            [DEFAULT]
+            int = 1
+            [a]
+            [b]
+            int = 2
+            """)
+        self.assertEqual(param, {'a.int': 1, 'b.int': 2})
+
+    def test_errors(self):
+        self.assert_error("int = 1\n", "param.conf:1: file contains no")
+        self.assert_error("[root]\n\nint = x\n",
+                          "param.conf:3: invalid value 'x' for 'int'")
+        self.assert_error("[root]\nbool = maybe\n",
+                          "param.conf:2: invalid value 'maybe' for 'bool'")
+        self.assert_error("[a]\nunknown = 1\n",
+                          "param.conf:2: Key 'a.unknown' is not")
+        self.assert_error("[root]\nno value\n",
+                          "param.conf:2: parsing error")
+
+    def test_loader_conf_via_cli(self):
+        path = os.path.join(tempfile.mkdtemp(), 'param.conf')
+        try:
+            with open(path, 'w') as file:
+                file.write('[root]\nint = x\n')
+            obj = self.cliclass()
+            self.assertRaises(TraitsCLIAttributeError,
+                              obj.load_paramfile, path)
+        finally:
+            shutil.rmtree(os.path.dirname(path))
+
+
+class TestPythonParamFile(unittest.TestCase):
+
+    class cliclass(TestingCLIBase):
+        int = Int(config=True)
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.orig_environ = os.environ.copy()
+        os.environ['TRAITSCLI_CACHE_DIR'] = os.path.join(self.tmpdir, 'c')
+        self.path = os.path.join(self.tmpdir, 'param.py')
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.orig_environ)
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, source):
+        with open(self.path, 'w') as file:
+            file.write(source)
+
+    def load(self, **kwds):
+        class cliclass(self.cliclass):
+            pass
+        for (k, v) in kwds.items():
+            setattr(cliclass, k, v)
+        return cliclass.loader_py(self.path)
+
+    def test_cache(self):
+        self.write('int = 1\n')
+        self.assertEqual(self.load(cli_py_cache=True), {'int': 1})
+        cached = os.listdir(os.path.join(self.tmpdir, 'c', 'pycode'))
+        self.assertEqual(len(cached), 1)
+        self.assertEqual(self.load(cli_py_cache=True), {'int': 1})
+        self.write('int = 22\n')  # file size is changed
+        self.assertEqual(self.load(cli_py_cache=True), {'int': 22})
+        self.assertEqual(self.load(), {'int': 22})
+
+    def test_no_cache_by_default(self):
+        self.write('int = 1\n')
+        self.assertEqual(self.load(), {'int': 1})
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir, 'c')))
+
+    def test_isolated(self):
+        self.write('import os\nint = 1\n')
+        self.assertEqual(self.load(cli_py_isolated=True), {'int': 1})
+
+    def test_isolated_error(self):
+        self.write('int = undefined_name\n')
+        self.assertRaises(TraitsCLIAttributeError,
+                          self.load, cli_py_isolated=True)
+
+    def test_isolated_timeout(self):
+        self.write('while True:\n    pass\n')
+        start = time.time()
+        self.assertRaises(TraitsCLIAttributeError,
+                          self.load, cli_py_isolated=True,
+                          cli_py_timeout=0.5)
+        self.assertTrue(time.time() - start < 10)
+
+    def test_isolated_memory_limit(self):
+        self.write('int = len(" " * 2 ** 30)\n')
+        self.assertRaises(TraitsCLIAttributeError,
+                          self.load, cli_py_isolated=True,
+                          cli_py_memory_limit=2 ** 29)
+
+
+class TestWriteAtomic(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.umask = os.umask(0o022)
+
+    def tearDown(self):
+        os.umask(self.umask)
+        shutil.rmtree(self.tmpdir)
+
+    def test_mode(self):
+        from traitscli import write_atomic
+        path = os.path.join(self.tmpdir, 'file')
+        write_atomic(path, 'a')
+        self.assertEqual(os.stat(path).st_mode & 0o777, 0o644)
+        os.chmod(path, 0o640)
+        write_atomic(path, 'b')
+        self.assertEqual(os.stat(path).st_mode & 0o777, 0o640)
+        self.assertEqual(open(path).read(), 'b')
+
+
+class TestParamFileDispatch(unittest.TestCase):
+
+    class cliclass(TestingCLIBase):
+        class subcliclass(TestingTraitsBase):
+            int = Int(config=True)
+        int = Int(config=True)
+        sub = Instance(subcliclass, args=(), config=True)
+
+    sources = dict(
+        json='{"int": 1, "sub.int": 2}',
+        yaml='# comment\nint: 1\nsub.int: 2\n',
+        conf='[root]\nint = 1\n[sub]\nint = 2\n',
+        py='int = 1\nsub = dict(int=2)\n',
+    )
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def load(self, name, source):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'w') as file:
+            file.write(source)
+        obj = self.cliclass()
+        obj.load_paramfile(path)
+        return obj
+
+    def check_sniff(self, fmt):
+        obj = self.load('param', self.sources[fmt])
+        self.assertEqual(obj.int, 1)
+        self.assertEqual(obj.sub.int, 2)
+
+    def test_sniff(self):
+        for fmt in self.sources:
+            self.check_sniff(fmt)
+
+    def test_registered_extension(self):
+        obj = self.load('param.cfg', self.sources['conf'])
+        self.assertEqual(obj.sub.int, 2)
+
+    def test_unknown_format(self):
+        self.assertRaises(TraitsCLIAttributeError,
+                          self.load, 'param.unknown', '<xml/>')
+
+    def test_yaml_python_tags_rejected(self):
+        import yaml
+        for tag in ['!!python/tuple [1, 2]',
+                    '!!python/object/apply:os.getcwd []']:
+            self.assertRaises(yaml.YAMLError,
+                              self.load, 'param.yaml', 'int: ' + tag)
+
+    def test_backend_priority(self):
+        from traitscli import (
+            register_paramfile_backend, paramfile_backend,
+            _paramfile_backends, _paramfile_backend_cache)
+
+        @register_paramfile_backend('json', 'unavailable', priority=1000)
+        def unavailable():
+            import no_such_module
+
+        @register_paramfile_backend('json', 'dummy', priority=999)
+        def dummy():
+            return lambda file: {'int': 100}
+
+        try:
+            self.assertEqual(paramfile_backend('json').name, 'dummy')
+            self.assertEqual(self.load('param.json', '{}').int, 100)
+        finally:
+            _paramfile_backends['json'] = [
+                b for b in _paramfile_backends['json']
+                if b.name not in ('unavailable', 'dummy')]
+            _paramfile_backend_cache.clear()
+
+
+class TestCompressedParamFile(unittest.TestCase):
+
+    class cliclass(TestingCLIBase):
+        class subcliclass(TestingTraitsBase):
+            int = Int(config=True)
+        str = Str(config=True)
+        list = List(config=True)
+        sub = Instance(subcliclass, args=(), config=True)
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def check_roundtrip(self, name, compression):
+        from traitscli import _paramfile_compressions
+        if not _paramfile_compressions[compression].available():
+            from nose import SkipTest
+            raise SkipTest('{0} is not supported'.format(compression))
+        path = os.path.join(self.tmpdir, name)
+        orig = self.cliclass(**{'str': 'x', 'list': [1, 2], 'sub.int': 3})
+        orig.dump_config(path)
+        with open(path, 'rb') as file:
+            self.assertEqual(
+                file.read(len(_paramfile_compressions[compression].magic)),
+                _paramfile_compressions[compression].magic)
+        obj = self.cliclass()
+        obj.load_paramfile(path)
+        self.assertEqual(obj.config_snapshot(), orig.config_snapshot())
+
+        # Detect compression and format without extension:
+        os.rename(path, os.path.join(self.tmpdir, 'param'))
+        obj = self.cliclass()
+        obj.load_paramfile(os.path.join(self.tmpdir, 'param'))
+        self.assertEqual(obj.config_snapshot(), orig.config_snapshot())
+
+    def test_json_gz(self):
+        self.check_roundtrip('param.json.gz', 'gz')
+
+    def test_conf_bz2(self):
+        self.check_roundtrip('param.conf.bz2', 'bz2')
+
+    def test_yaml_xz(self):
+        self.check_roundtrip('param.yaml.xz', 'xz')
+
+    def test_json_zst(self):
+        self.check_roundtrip('param.json.zst', 'zst')
+
+    def test_shared(self):
+        from traitscli import shared_paramfiles, load_shared_paramfile
+        path = os.path.join(self.tmpdir, 'param.json.gz')
+        self.cliclass(str='x').dump_config(path)
+        calls = []
+
+        class CLI(self.cliclass):
+            @staticmethod
+            def loader_json(path, _open=open):
+                calls.append(path)
+                return TraitsCLIBase.loader_json(path, _open=_open)
+
+        with shared_paramfiles():
+            for _ in range(2):
+                param = load_shared_paramfile(
+                    CLI.dispatch_paramfile_loader(path), path)
+                self.assertEqual(param['str'], 'x')
+        self.assertEqual(calls, [path])
+
+
+@contextmanager
+def environ(**kwds):
+    orig = os.environ.copy()
+    os.environ.update(kwds)
+    try:
+        yield
+    finally:
+        os.environ.clear()
+        os.environ.update(orig)
+
+
+class TestEnvironCLI(TestCaseBase, ParamFileTestingMixIn):
+
+    class cliclass(TestingCLIBase):
+        class subcliclass(TestingTraitsBase):
+            float = Float(config=True)
+            bool = Bool(config=True)
+        int = Int(config=True)
+        str = Str(config=True)
+        sub = Instance(subcliclass, args=(), config=True)
+        paramfile = Str(cli_paramfile=True, config=True)
+        cli_env_prefix = 'TRAITSCLI_TEST_'
+
+    def test_environ(self):
+        with environ(TRAITSCLI_TEST_INT='1',
+                     TRAITSCLI_TEST_SUB__FLOAT='0.5',
+                     TRAITSCLI_TEST_SUB__BOOL='yes',
+                     TRAITSCLI_TEST_UNKNOWN='ignored'):
+            self.assert_attributes(dict(
+                int=1, str='', paramfile='',
+                sub=dict(float=0.5, bool=True)))
+
+    def test_priority(self):
+        with environ(TRAITSCLI_TEST_INT='1', TRAITSCLI_TEST_STR='env',
+                     TRAITSCLI_TEST_PARAMFILE='param.dummy'):
+            with self.dummy_loader(['param.dummy'],
+                                   [dict(int=2, str='file')]):
+                self.assert_attributes(
+                    dict(int=1, str='cli', paramfile='param.dummy',
+                         sub=dict(float=0.0, bool=False)),
+                    ['--str', 'cli'])
+
+    def test_invalid_value(self):
+        with environ(TRAITSCLI_TEST_INT='x'):
+            self.assert_invalid_args([])
+
+
+class TestConfigOrigins(TestCaseBase):
+
+    class cliclass(TestingCLIBase):
+        class subcliclass(TestingTraitsBase):
+            lr = Float(config=True)
+            dict = Dict(config=True)
+        int = Int(config=True)
+        str = Str(config=True)
+        sub = Instance(subcliclass, args=(), config=True)
+        paramfile = Str(cli_paramfile=True, config=True)
+        cli_env_prefix = 'TRAITSCLI_TEST_'
+
+        def _anytrait_changed(self, name, old, new):
+            self.__dict__.setdefault('changes', []).append(name)
+
+        def do_run(self):
+            pass
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.conf = os.path.join(self.tmpdir, 'param.conf')
+        with open(self.conf, 'w') as file:
+            file.write('[root]\nint = 1\nstr = file\n\n[sub]\nlr = 0.5\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_origins(self):
+        with environ(TRAITSCLI_TEST_STR='env'):
+            obj = self.run_cli(['--paramfile', self.conf, '--int', '2',
+                                "--sub.dict['a']=1"])
+        self.assertEqual(obj.int, 2)
+        self.assertEqual(obj.str, 'env')
+        self.assertEqual(obj.sub.lr, 0.5)
+        self.assertEqual(obj.sub.dict, {'a': 1})
+        self.assertEqual(obj.config_origin('int'), 'option --int')
+        self.assertEqual(obj.config_origin('str'),
+                         'environment variable TRAITSCLI_TEST_STR')
+        self.assertEqual(obj.config_origin('sub.lr'),
+                         'paramfile {0}:6'.format(self.conf))
+        self.assertEqual(obj.config_origin('sub.dict'),
+                         "dict-like option --sub.dict['a']")
+        self.assertEqual(obj.config_origin('paramfile'), 'option --paramfile')
+
+    def test_set_once(self):
+        obj = self.run_cli(['--paramfile', self.conf, '--int', '2'])
+        self.assertEqual(sorted(obj.changes), ['int', 'paramfile', 'str'])
+
+    def test_dict_like_option_does_not_touch_default(self):
+        obj = self.run_cli(["--sub.dict['a']=1"])
+        self.assertEqual(obj.sub.dict, {'a': 1})
+        self.assertEqual(self.cliclass().sub.dict, {})
+
+    def test_show_config_origins(self):
+        from StringIO import StringIO
+        orig = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            obj = self.run_cli(['--show-config-origins', '--int', '2'])
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = orig
+        self.assertIsNone(obj.cli_result)
+        self.assertIn('int       : option --int\n', output)
+        self.assertIn('sub.lr    : default\n', output)
+        self.assertIn('--show-config-origins',
+                      self.cliclass.get_argparser().format_help())
+
+    def test_show_config_origins_not_abbreviated(self):
+        with self.assertRaises(ArgumentParserExitCalled):
+            self.run_cli(['--show', '--int', '2'])
+
+    def test_builtin_option_does_not_shadow(self):
+        class CLI(TestingCLIBase):
+            show_config_origins = Bool(config=True)
+
+        with self.assertRaises(ArgumentParserExitCalled):
+            CLI.cli(['--show-config-origins', '1'])
+
+    def test_load_paramfile_override(self):
+        loaded = []
+
+        class CLI(self.cliclass):
+            def load_paramfile(self, path):
+                loaded.append(path)
+                super(CLI, self).load_paramfile(path)
+
+        obj = CLI.cli(['--paramfile', self.conf])
+        self.assertEqual(loaded, [self.conf])
+        self.assertEqual(obj.int, 1)
+        self.assertEqual(obj.config_origin('int'),
+                         'paramfile {0}:2'.format(self.conf))
+
+    def test_load_all_paramfiles_override(self):
+        class CLI(self.cliclass):
+            def load_all_paramfiles(self):
+                pass
+
+        obj = CLI.cli(['--paramfile', self.conf])
+        self.assertEqual(obj.int, 0)
+
+
+class TestLazySubObject(unittest.TestCase):
+
+    def setUp(self):
+        created = self.created = []
+
+        class SubObject(TraitsCLIBase):
+            int = Int(config=True)
+
+            def __init__(self, **kwds):
+                created.append(self)
+                super(SubObject, self).__init__(**kwds)
+
+        class CLI(TraitsCLIBase):
+            ArgumentParser = ArgumentParserNoExit
+            eager = Instance(SubObject, args=(), config=True)
+            lazy = Instance(SubObject, config=True)
+            named = Instance('test_traitscli.NamedSubObject', config=True)
+
+            def do_run(self):
+                pass
+
+        self.cliclass = CLI
+
+    def test_untouched(self):
+        obj = self.cliclass.cli([])
+        self.assertEqual(self.created, [])
+        self.assertIsNone(obj.lazy)
+        self.assertIsNone(obj.named)
+
+    def test_create_on_configure(self):
+        obj = self.cliclass.cli(['--lazy.int', '1', '--named.str', 'a'])
+        self.assertEqual(len(self.created), 1)
+        self.assertEqual(obj.lazy.int, 1)
+        self.assertEqual(obj.named.str, 'a')
+
+    def test_create_on_access(self):
+        obj = self.cliclass.cli([])
+        self.assertEqual(obj.eager.int, 0)
+        self.assertEqual(len(self.created), 1)
+
+    def test_snapshot(self):
+        obj = self.cliclass.cli(['--lazy.int', '1'])
+        self.assertEqual(obj.config_snapshot(),
+                         {'eager.int': 0, 'lazy.int': 1})
+
+    def test_help(self):
+        help = self.cliclass.get_argparser().format_help()
+        self.assertIn('--lazy.int', help)
+        self.assertIn('--named.str', help)
+        self.assertEqual(self.created, [])
+
+
+class NamedSubObject(TraitsCLIBase):
+    str = Str(config=True)
+
+
+class CompletionSubCLI(TraitsCLIBase):
+    rate = Float(config=True)
+    mode = Enum(['fast', 'slow'], config=True)
+
+
+class CompletionTrainCLI(TraitsCLIBase):
+    epochs = Int(config=True)
+    verbose = Bool(config=True)
+    paramfile = Str(cli_paramfile=True, config=True)
+    sub = Instance(CompletionSubCLI, args=(), config=True)
+    cli_sweep = True
+
+
+class TestCompletion(unittest.TestCase):
+
+    commands = [('train', CompletionTrainCLI), ('sample', SampleCLI)]
+
+    def complete_bash(self, *words):
+        from traitscli_completion import completion_script
+        script = completion_script('bash', self.commands, 'tool')
+        code = '\n'.join([
+            script,
+            'COMP_WORDS=(tool {0})'.format(' '.join(words)),
+            'COMP_CWORD={0}'.format(len(words)),
+            '_traitscli_tool',
+            'printf "%s\\n" "${COMPREPLY[@]}"',
+        ])
+        tmpdir = tempfile.mkdtemp()
+        try:
+            for name in ['a.json', 'b.yaml', 'c.txt', 'd.json.gz']:
+                open(os.path.join(tmpdir, name), 'w').close()
+            proc = subprocess.Popen(['bash', '-c', code], cwd=tmpdir,
+                                    stdout=subprocess.PIPE)
+            output = proc.communicate()[0]
+        finally:
+            shutil.rmtree(tmpdir)
+        self.assertEqual(proc.returncode, 0)
+        return sorted(filter(None, output.splitlines()))
+
+    def test_bash_commands(self):
+        self.assertEqual(self.complete_bash('t'), ['train'])
+        self.assertEqual(self.complete_bash('train', '--sub.'),
+                         ['--sub.mode', '--sub.rate'])
+        self.assertEqual(self.complete_bash('sample', '--cho'), ['--choice'])
+
+    def test_bash_values(self):
+        self.assertEqual(self.complete_bash('train', '--sub.mode', ''),
+                         ['fast', 'slow'])
+        self.assertEqual(self.complete_bash('sample', '--choice', ''),
+                         ['a', 'b', 'c'])
+        self.assertEqual(self.complete_bash('train', '--epochs', ''), [])
+        self.assertEqual(self.complete_bash('train', '--paramfile', ''),
+                         ['a.json', 'b.yaml', 'd.json.gz'])
+        self.assertEqual(self.complete_bash('train', '--sweep-file', ''),
+                         ['a.json', 'b.yaml', 'c.txt', 'd.json.gz'])
+        self.assertEqual(self.complete_bash('train', '--task-index', ''), [])
+
+    def test_bash_builtin_options(self):
+        self.assertEqual(self.complete_bash('train', '--s'),
+                         ['--show-config-origins', '--sub.mode',
+                          '--sub.rate', '--sweep-file'])
+        self.assertEqual(self.complete_bash('sample', '--s'),
+                         ['--show-config-origins', '--string'])
+        self.assertEqual(self.complete_bash('sample', '--ch'),
+                         ['--check', '--choice'])
+
+    def test_bash_nested(self):
+        self.commands = [('model', [('train', CompletionTrainCLI)]),
+                         ('sample', 'sample:SampleCLI')]
+        self.assertEqual(self.complete_bash('model', ''),
+                         ['--help', 'train'])
+        self.assertEqual(self.complete_bash('model', 'train', '--sub.mode',
+                                            ''),
+                         ['fast', 'slow'])
+        self.assertEqual(self.complete_bash('sample', '--cho'), ['--choice'])
+
+    def test_zsh_fish(self):
+        from traitscli_completion import completion_script
+        zsh = completion_script('zsh', self.commands, 'tool')
+        self.assertIn('--sub.mode) compadd -- fast slow; return;;', zsh)
+        self.assertIn('compdef _traitscli_tool tool', zsh)
+        fish = completion_script('fish', self.commands, 'tool')
+        self.assertIn("complete -c tool -n 'test (_traitscli_tool_path) = "
+                      "\"/train\"' -l sub.mode -x -a 'fast slow'", fish)
+        self.assertIn("-a 'train sample'", fish)
+        self.assertIn('--sweep-file) _files; return;;', zsh)
+        self.assertIn("-l sweep-file -x -a "
+                      "'(__fish_complete_path (commandline -ct))'", fish)
+
+
+class TestLazyHelp(unittest.TestCase):
+
+    def test_not_formatted_until_rendered(self):
+        formatted = []
+
+        class Default(object):
+            def __str__(self):
+                formatted.append(self)
+                return 'default'
+
+        class CLI(TraitsCLIBase):
+            value = Instance(Default, Default(), config=True)
+            percent = Str('100%', config=True)
+
+        parser = CLI.get_argparser()
+        parser.parse_args([])
+        self.assertEqual(formatted, [])
+        help = parser.format_help()
+        self.assertEqual(len(formatted), 1)
+        self.assertIn('(default: default)', help)
+        self.assertIn('(default: 100%)', help)
+
+    def test_defaults_help_formatter(self):
+        from argparse import ArgumentDefaultsHelpFormatter
+
+        class CLI(TraitsCLIBase):
+            value = List(range(1000), config=True)
+
+        parser = CLI.get_argparser()
+        parser.formatter_class = ArgumentDefaultsHelpFormatter
+        help = parser.format_help()
+        self.assertIn('(default: [0, 1, 2, 3, 4, 5, ...])', help)
+
+
+class TestLargeEnum(TestCaseBase):
+
+    class cliclass(TestingCLIBase):
+        dataset = Enum(['ds{0:04}'.format(i) for i in range(5000)],
+                       config=True)
+        number = Enum(range(1000), config=True)
+        small = Enum(['a', 'b'], config=True)
+
+    def test_valid(self):
+        self.assert_attributes(
+            dict(dataset='ds4321', number=10, small='b'),
+            ['--dataset', 'ds4321', '--number', '10', '--small', 'b'])
+
+    def test_invalid(self):
+        with self.assertRaises(ArgumentParserExitCalled) as cm:
+            self.run_cli(['--dataset', 'ds00042'])
+        message = cm.exception.args[1]
+        self.assertIn("invalid choice: 'ds00042'", message)
+        self.assertIn("did you mean 'ds0042'", message)
+        self.assert_invalid_args(['--small', 'c'])
+        with self.assertRaises(ArgumentParserExitCalled) as cm:
+            self.run_cli(['--small', 'c'])
+        self.assertIn("invalid choice: 'c' (choose from 'a', 'b')",
+                      cm.exception.args[1])
+
+    def test_small_int_enum(self):
+        class CLI(TestingCLIBase):
+            number = Enum(range(10), config=True)
+
+        self.assertEqual(CLI.cli(['--number', '3']).number, 3)
+        self.assertIn('--number {0,1,2,3,4,5,6,7,8,9}',
+                      CLI.get_argparser().format_help())
+
+    def test_compact_help(self):
+        help = self.cliclass.get_argparser().format_help()
+        self.assertIn('--dataset {ds0000,ds0001,ds0002,...}', help)
+        self.assertNotIn('ds4999', help)
+        self.assertIn('--small {a,b}', help)
+
+
+class FastArgumentParserNoExit(ArgumentParserNoExit, FastArgumentParser):
+    pass
+
+
+def fast_parser_variant(base):
+    """Make a subclass of test case `base` using `FastArgumentParser`."""
+    attrs = {}
+    if base.cliclass is not None:
+        attrs['cliclass'] = type(base.cliclass.__name__, (base.cliclass,),
+                                 dict(ArgumentParser=FastArgumentParserNoExit))
+    return type(base.__name__ + 'FastParser', (base,), attrs)
+
+
+TestSampleCLIFastParser = fast_parser_variant(TestSampleCLI)
+TestEvalTypeFastParser = fast_parser_variant(TestEvalType)
+TestDictLikeOptionsFastParser = fast_parser_variant(TestDictLikeOptions)
+TestNestedCLIFastParser = fast_parser_variant(TestNestedCLI)
+TestMetaDataCLIFastParser = fast_parser_variant(TestMetaDataCLI)
+TestPositionalBooleanCLIFastParser = fast_parser_variant(
+    TestPositionalBooleanCLI)
+TestParamFileCLIFastParser = fast_parser_variant(TestParamFileCLI)
+TestLargeEnumFastParser = fast_parser_variant(TestLargeEnum)
+
+
+class TestMultiCommandCLIFastParser(TestMultiCommandCLI):
+
+    def run_cli(self, args):
+        pairs = [('cmd_1', self.cliclass_1),
+                 ('cmd_2', self.cliclass_2)]
+        return multi_command_cli(pairs, args,
+                                 ArgumentParser=FastArgumentParserNoExit)
+
+
+class TestFastArgumentParser(unittest.TestCase):
+
+    def make_parser(self, ArgumentParser=FastArgumentParserNoExit):
+        parser = ArgumentParser(prog='prog')
+        parser.add_argument('--int', type=int)
+        parser.add_argument('--flag', action='store_true')
+        parser.add_argument('pos')
+        return parser
+
+    def test_fast_path(self):
+        parser = self.make_parser()
+        self.assertIsNotNone(parser._fast_plan())
+        ns = parser.parse_args(['--int=-1', 'x', '--flag'])
+        self.assertEqual(vars(ns), dict(int=-1, flag=True, pos='x'))
+        ns = parser.parse_args(['--int', '-1', '--', '-x'])
+        self.assertEqual(vars(ns), dict(int=-1, flag=False, pos='-x'))
+
+    def test_errors(self):
+        parser = self.make_parser()
+        for args in [[], ['--int'], ['--int', '--flag', 'x'],
+                     ['--flag=1', 'x'], ['--in', '1', 'x'], ['x', 'y']]:
+            self.assertRaises(ArgumentParserExitCalled,
+                              parser.parse_args, args)
+
+    def test_fallback(self):
+        parser = self.make_parser()
+        parser.add_argument('--list', nargs='*')
+        self.assertIsNone(parser._fast_plan())
+        ns = parser.parse_args(['--list', 'a', 'b', '--', 'x'])
+        self.assertEqual(ns.list, ['a', 'b'])
+        self.assertEqual(ns.pos, 'x')
+
+    def test_help(self):
+        self.assertEqual(
+            self.make_parser().format_help(),
+            self.make_parser(ArgumentParserNoExit).format_help())
+
+
+class ManyOptionsCLI(TraitsCLIBase):
+    dict = Dict(config=True)
+    locals().update(('o{0}'.format(i), Int(config=True))
+                    for i in range(1000))
+
+
+class TestParsedOptions(unittest.TestCase):
+
+    def make_parser(self, func):
+        parser = ArgumentParserNoExit()
+        parser.add_argument('--a', default=0)
+        parser.add_argument('--b', default=None)
+        parser.set_defaults(func=func)
+        return parser
+
+    def test_legacy_func(self):
+        calls = []
+        parser = self.make_parser(lambda **kwds: calls.append(kwds))
+        parse_and_run(parser, ['--b', 'x', "--d['k']=1"])
+        self.assertEqual(calls, [
+            {'a': 0, 'b': 'x', '__dict_like_options': [("d['k']", '1')]}])
+
+    def test_takes_parsed_options(self):
+        calls = []
+
+        @takes_parsed_options
+        def func(options):
+            calls.append(options)
+
+        parser = self.make_parser(func)
+        parse_and_run(parser, ['--b', 'x'])
+        [options] = calls
+        self.assertIsInstance(options, ParsedOptions)
+        self.assertEqual(options.kwds, {'a': 0, 'b': 'x'})
+        self.assertEqual(options.dict_like_options, [])
+
+    def test_run_keywords(self):
+        obj = ManyOptionsCLI.run(
+            o1=1, __dict_like_options=[("dict['k']", '2')])
+        self.assertEqual((obj.o0, obj.o1, obj.dict), (0, 1, {'k': 2}))
+
+    def test_no_copy_of_unspecified_options(self):
+        parser = ManyOptionsCLI.get_argparser()
+        dct = vars(parser.parse_args(['--o1', '1', '--o2', '2']))
+        options = ParsedOptions.from_dict(dct)
+        self.assertEqual(options.kwds, {'o1': 1, 'o2': 2})
+        # Unspecified options must not be copied per invocation: the
+        # record must be much smaller than the 1000-entry namespace.
+        self.assertLess(sys.getsizeof(options.kwds) +
+                        sys.getsizeof(options.builtins),
+                        sys.getsizeof(dct) // 8)
+
+    def test_attribute_called_func(self):
+        class CLI(TestingCLIBase):
+            func = Int(config=True)
+
+        obj = CLI.cli(['--func', '3'])
+        self.assertEqual(obj.func, 3)
+        self.assertEqual(CLI.run(func=4).func, 4)
+
+
+class TestDiscoverCommands(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.sitedir = os.path.join(self.tmpdir, 'site')
+        self.distdir = os.path.join(self.sitedir, 'plugin-1.0.dist-info')
+        os.makedirs(self.distdir)
+        with open(os.path.join(self.distdir, 'METADATA'), 'w') as file:
+            file.write('Metadata-Version: 2.0\nName: plugin\n'
+                       'Version: 1.0\n')
+        self.write_entry_points('sample = sample:SampleCLI')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write_entry_points(self, *lines):
+        path = os.path.join(self.distdir, 'entry_points.txt')
+        with open(path, 'w') as file:
+            file.write('[tool.commands]\n' + '\n'.join(lines) + '\n')
+        # Make sure that modification time changes:
+        mtime = os.stat(path).st_mtime + len(lines)
+        os.utime(path, (mtime, mtime))
+
+    def discover(self):
+        from traitscli import discover_commands
+        with environ(TRAITSCLI_CACHE_DIR=self.tmpdir):
+            return discover_commands('tool.commands', [self.sitedir])
+
+    def test_discover(self):
+        self.assertEqual(self.discover(), [('sample', 'sample:SampleCLI')])
+        ret = multi_command_cli(self.discover(), ['sample', '--yes'])
+        self.assertTrue(isinstance(ret, SampleCLI))
+
+    def test_cache(self):
+        import json
+        self.discover()
+        [cachepath] = [
+            os.path.join(dirpath, name)
+            for (dirpath, _, names) in os.walk(self.tmpdir)
+            for name in names if name.endswith('.json')]
+        with open(cachepath) as file:
+            cache = json.load(file)
+        cache['commands'] = [['cached', 'x:Y']]
+        with open(cachepath, 'w') as file:
+            json.dump(cache, file)
+        self.assertEqual(self.discover(), [('cached', 'x:Y')])
+
+        self.write_entry_points('a = a:A', 'b = b.c:D.E')
+        self.assertEqual(self.discover(), [('a', 'a:A'), ('b', 'b.c:D.E')])
+
+
+class PipelinePrepareCLI(TraitsCLIBase):
+    ArgumentParser = ArgumentParserNoExit
+    size = Int(config=True)
+    paramfile = Str(cli_paramfile=True, config=True)
+    loaded = []
+
+    @staticmethod
+    def loader_json(path):
+        PipelinePrepareCLI.loaded.append(path)
+        return TraitsCLIBase.loader_json(path)
+
+    def do_run(self):
+        return range(self.size)
+
+
+class PipelineTrainCLI(PipelinePrepareCLI):
+    prepared = Instance(PipelinePrepareCLI, cli_pipe=True)
+    scale = Int(1, config=True)
+
+    def do_run(self):
+        return [x * self.scale for x in self.prepared.cli_result]
+
+
+class TestPipeline(unittest.TestCase):
+
+    commands = [('prepare', PipelinePrepareCLI),
+                ('train', PipelineTrainCLI)]
+
+    def run_pipeline(self, args):
+        return multi_command_cli(self.commands, args, pipeline=True)
+
+    def test_pipe(self):
+        (prepare, train) = self.run_pipeline(
+            ['prepare', '--size', '3', '--', 'train', '--scale', '2'])
+        self.assertIs(train.prepared, prepare)
+        self.assertEqual(train.cli_result, [0, 2, 4])
+
+    def test_latest_instance(self):
+        objs = self.run_pipeline(
+            ['prepare', '--size', '1', '--', 'train', '--',
+             'train', "--scale", '3'])
+        self.assertIs(objs[2].prepared, objs[1])
+        self.assertEqual(objs[2].cli_result, [0])
+
+    def test_shared_paramfile(self):
+        import json
+        (fd, path) = tempfile.mkstemp(suffix='.json')
+        with os.fdopen(fd, 'w') as file:
+            json.dump({'size': 2}, file)
+        PipelinePrepareCLI.loaded = []
+        try:
+            (prepare, train) = self.run_pipeline(
+                ['prepare', '--paramfile', path, '--',
+                 'train', '--paramfile', path])
+        finally:
+            os.unlink(path)
+        self.assertEqual((prepare.size, train.size), (2, 2))
+        self.assertEqual(PipelinePrepareCLI.loaded, [path])
+
+    def test_invalid_args(self):
+        self.assertRaises(ArgumentParserExitCalled,
+                          self.run_pipeline, ['prepare', '--'])
+        self.assertRaises(ArgumentParserExitCalled, self.run_pipeline,
+                          ['prepare', '--', 'train', '--invalid', '1'])
+
+
+class SweepCLI(TestingCLIBase):
+    int = Int(config=True)
+    str = Str(config=True)
+    sub = Instance(NamedSubObject, args=(), config=True)
+    cli_sweep = True
+
+
+class TestSweepFile(TestCaseBase):
+
+    cliclass = SweepCLI
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'sweep.ndjson')
+        self.write(['{"int": 0}', '', '{"int": 1, "sub": {"str": "x"}}',
+                    '{"str": "two"}'])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, lines):
+        with open(self.path, 'w') as file:
+            file.write('\n'.join(lines) + '\n')
+
+    def run_task(self, index, *args):
+        return self.run_cli(['--sweep-file', self.path,
+                             '--task-index', str(index)] + list(args))
+
+    def test_select_record(self):
+        obj = self.run_task(1)
+        self.assertEqual((obj.int, obj.str, obj.sub.str), (1, '', 'x'))
+        obj = self.run_task(2)
+        self.assertEqual((obj.int, obj.str), (0, 'two'))
+        self.assertEqual(obj.config_origin('str'),
+                         'sweep file {0} (record 2)'.format(self.path))
+
+    def test_help(self):
+        help = self.cliclass.get_argparser().format_help()
+        self.assertIn('--sweep-file PATH', help)
+        self.assertIn('--task-index N', help)
+        help = TestingCLIBase.get_argparser().format_help()
+        self.assertNotIn('--sweep-file', help)
+
+    def test_option_overrides_record(self):
+        obj = self.run_task(1, '--int', '10')
+        self.assertEqual(obj.int, 10)
+
+    def test_index_rebuilt(self):
+        self.run_task(0)
+        self.assertTrue(os.path.exists(self.path + '.idx'))
+        self.write(['{"int": 5}'])
+        os.utime(self.path, (0, 0))
+        self.assertEqual(self.run_task(0).int, 5)
+        self.assert_invalid_args(['--sweep-file', self.path,
+                                  '--task-index', '1'])
+
+    def test_index_built_once(self):
+        import threading
+        import traitscli
+        from traitscli import sweep_index
+        orig = traitscli._build_sweep_index
+        calls = []
+
+        def build(*args):
+            calls.append(args)
+            time.sleep(0.1)
+            return orig(*args)
+
+        cache = os.path.join(self.tmpdir, 'cache')
+        traitscli._build_sweep_index = build
+        try:
+            with environ(TRAITSCLI_CACHE_DIR=cache):
+                threads = [threading.Thread(target=sweep_index,
+                                            args=(self.path,))
+                           for _ in range(4)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                self.assertEqual(sweep_index(self.path),
+                                 (self.path + '.idx', 3))
+        finally:
+            traitscli._build_sweep_index = orig
+        self.assertEqual(len(calls), 1)
+        self.assertFalse(os.path.exists(cache))
+        self.assertEqual(sorted(os.listdir(self.tmpdir)),
+                         ['sweep.ndjson', 'sweep.ndjson.idx'])
+
+    def test_index_in_cache_dir(self):
+        from traitscli import sweep_index
+        cache = os.path.join(self.tmpdir, 'cache')
+        os.mkdir(self.path + '.idx')  # not writable even by root
+        with environ(TRAITSCLI_CACHE_DIR=cache):
+            (idxpath, num) = sweep_index(self.path)
+            self.assertEqual(sweep_index(self.path), (idxpath, num))
+        self.assertEqual(num, 3)
+        self.assertEqual(os.path.dirname(os.path.dirname(idxpath)), cache)
+
+    def test_invalid(self):
+        self.assert_invalid_args(['--task-index', '0'])
+        self.assert_invalid_args(['--sweep-file', self.path,
+                                  '--task-index', 'x'])
+        self.write(['{"unknown": 1}', '[1]', '{'])
+        for i in range(3):
+            self.assert_invalid_args(['--sweep-file', self.path,
+                                      '--task-index', str(i)])
+
+
+class ValidateSubCLI(TraitsCLIBase):
+    lr = Float(config=True)
+    created = []
+
+    def __init__(self, **kwds):
+        super(ValidateSubCLI, self).__init__(**kwds)
+        ValidateSubCLI.created.append(self)
+
+
+class ValidateCLI(TestingCLIBase):
+    int = Int(config=True)
+    list = List(Int, config=True)
+    dict = Dict(Str, Int, config=True)
+    sub = Instance(ValidateSubCLI, config=True)
+    paramfile = Str(cli_paramfile=True, config=True)
+    events = []
+
+    def _int_changed(self, new):
+        ValidateCLI.events.append(('changed', new))
+
+    def do_run(self):
+        ValidateCLI.events.append(('run', self.int))
+
+
+class TestValidateConfig(TestCaseBase):
+
+    cliclass = ValidateCLI
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'param.json')
+        ValidateCLI.events[:] = []
+        ValidateSubCLI.created[:] = []
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def check_errors(self, args):
+        with self.assertRaises(ArgumentParserExitCalled) as cm:
+            self.run_cli(['--check'] + args)
+        return cm.exception.args[0]
+
+    def check_valid(self, args):
+        from StringIO import StringIO
+        (orig, sys.stdout) = (sys.stdout, StringIO())
+        try:
+            with self.assertRaises(SystemExit) as cm:
+                self.run_cli(['--check'] + args)
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = orig
+        self.assertEqual((cm.exception.code, output), (0, 'OK\n'))
+
+    def test_validate_config(self):
+        errors = ValidateCLI.validate_config({
+            'int': 1.5, 'list': [1, 'a'], 'dict': {'a': 1, 'b': 'c'},
+            'sub': {'lr': 'x'}, 'unknown': 0,
+        })
+        self.assertEqual([k for (k, _) in errors],
+                         ['dict', 'int', 'list', 'sub.lr', 'unknown'])
+        self.assertIn("value of key 'b'", dict(errors)['dict'])
+        self.assertIn('item 1', dict(errors)['list'])
+        self.assertEqual(ValidateCLI.validate_config(
+            {'int': 1, 'list': [1], 'sub': {'lr': 0.5}}), [])
+        self.assertEqual(ValidateCLI.validate_config({'sub': 1})[0][0],
+                         'sub')
+        self.assertEqual((ValidateCLI.events, ValidateSubCLI.created),
+                         ([], []))
+
+    def test_check_valid(self):
+        with open(self.path, 'w') as file:
+            file.write('{"sub": {"lr": 0.5}, "list": [1]}')
+        self.check_valid(['--paramfile', self.path, '--int', '1',
+                          "--dict['a']=1"])
+        self.assertEqual((ValidateCLI.events, ValidateSubCLI.created),
+                         ([], []))
+
+    def test_check_collects_errors(self):
+        with open(self.path, 'w') as file:
+            file.write('{"int": "x", "sub": {"lr": "y", "unknown": 1}}')
+        message = self.check_errors(['--paramfile', self.path,
+                                     "--dict['a']='b'"])
+        lines = message.splitlines()
+        self.assertEqual(lines[0], 'Invalid configuration:')
+        self.assertEqual([l.split(':')[0].strip() for l in lines[1:]],
+                         ['dict', 'int', 'sub.lr', 'sub.unknown'])
+        self.assertIn("(dict-like option --dict['a'])", lines[1])
+        self.assertIn('(paramfile {0})'.format(self.path), lines[2])
+        self.assertEqual((ValidateCLI.events, ValidateSubCLI.created),
+                         ([], []))
+
+    def test_check_option_overrides_paramfile(self):
+        with open(self.path, 'w') as file:
+            file.write('{"int": "x"}')
+        self.check_valid(['--paramfile', self.path, '--int', '1'])
+
+
+class QueueCLI(TraitsCLIBase):
+    int = Int(config=True)
+    sub = Instance(NamedSubObject, args=(), config=True)
+    ran = []
+
+    def do_run(self):
+        if self.int < 0:
+            raise ValueError('negative int')
+        QueueCLI.ran.append((self.int, self.sub.str))
+
+
+class TestWorkQueue(unittest.TestCase):
+
+    def setUp(self):
+        from traitscli_queue import WorkQueue
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'queue.sqlite')
+        self.queue = WorkQueue(self.path)
+        QueueCLI.ran = []
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_work(self):
+        from traitscli_queue import work
+        configs = [{'int': 1}, {'int': -1}, {'int': 2, 'sub': {'str': 'a'}},
+                   {'int': 3, 'sub.str': 'b'}]
+        self.assertEqual(self.queue.enqueue(configs), 4)
+        self.assertEqual(work(self.queue, 'test_traitscli:QueueCLI'), 4)
+        self.assertEqual(QueueCLI.ran, [(1, ''), (2, 'a'), (3, 'b')])
+        self.assertEqual(self.queue.counts(), dict(
+            pending=0, running=0, done=3, failed=1, killed=0))
+        [(params, error)] = self.queue.failures()
+        self.assertEqual(params, {'int': -1})
+        self.assertIn('ValueError: negative int', error)
+
+        # Done configurations are skipped; failed ones are retried:
+        self.assertEqual(self.queue.enqueue(configs), 1)
+        self.assertEqual(work(self.queue, QueueCLI), 1)
+        self.assertEqual(len(QueueCLI.ran), 3)
+
+    def test_enqueue_count(self):
+        configs = [{'int': 1}, {'int': 2}, {'int': 1}]
+        self.assertEqual(self.queue.enqueue(configs, chunk_size=2), 2)
+        self.assertEqual(self.queue.enqueue(configs), 0)
+
+    def test_unknown_key(self):
+        from traitscli_queue import work
+        self.queue.enqueue([{'int': 1, 'unknown': 2}])
+        self.assertEqual(work(self.queue, QueueCLI), 1)
+        self.assertEqual(QueueCLI.ran, [])
+        [(params, error)] = self.queue.failures()
+        self.assertIn('Non-configurable key is given: unknown', error)
+
+    def test_lease_expiry(self):
+        from traitscli_queue import WorkQueue
+        queue = WorkQueue(self.path, lease=0)
+        queue.enqueue([{'int': 1}])
+        task = queue.claim('crashed')
+        self.assertEqual(task.attempts, 1)
+        time.sleep(0.01)
+        self.assertEqual(queue.reclaim(), 1)
+        self.assertEqual(queue.counts()['pending'], 1)
+        task = self.queue.claim('alive')
+        self.assertEqual(task.attempts, 2)
+        self.assertIsNone(self.queue.claim('other'))
+        self.assertFalse(queue.complete(task.key, 'crashed'))
+        self.assertTrue(self.queue.heartbeat(task.key, 'alive'))
+        self.assertTrue(self.queue.complete(task.key, 'alive'))
+
+    def test_main(self):
+        from traitscli_queue import main
+        configs = os.path.join(self.tmpdir, 'configs.ndjson')
+        with open(configs, 'w') as file:
+            file.write('{"int": 1}\n\n{"int": 2}\n')
+        from StringIO import StringIO
+        (orig, sys.stdout) = (sys.stdout, StringIO())
+        try:
+            main(['enqueue', self.path, configs])
+            main(['work', self.path, 'test_traitscli:QueueCLI',
+                  '--max-tasks', '1'])
+            main(['status', self.path])
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = orig
+        self.assertIn('2 added', output)
+        self.assertIn('done     1', output)
+        self.assertEqual(QueueCLI.ran, [(1, '')])
+        self.assertEqual(self.queue.counts()['pending'], 1)
+
+    def test_status_is_read_only(self):
+        from traitscli_queue import WorkQueue, main
+        WorkQueue(self.path, lease=0).enqueue([{'int': 1}])
+        WorkQueue(self.path, lease=0).claim('crashed')
+        time.sleep(0.01)
+        (orig, sys.stdout) = (sys.stdout, open(os.devnull, 'w'))
+        try:
+            main(['status', self.path])
+        finally:
+            sys.stdout = orig
+        self.assertEqual(self.queue.counts()['running'], 1)
+
+    def test_status_of_missing_queue(self):
+        from traitscli_queue import main
+        path = os.path.join(self.tmpdir, 'no-such-queue.sqlite')
+        (orig, sys.stderr) = (sys.stderr, open(os.devnull, 'w'))
+        try:
+            self.assertRaises(SystemExit, main, ['status', path])
+        finally:
+            sys.stderr = orig
+        self.assertFalse(os.path.exists(path))
+
+
+class SupervisedCLI(TraitsCLIBase):
+    mode = Str(config=True)
+    out = Str(config=True)
+
+    def do_run(self):
+        if self.mode == 'hang':
+            time.sleep(60)
+        elif self.mode == 'crash':
+            os.kill(os.getpid(), 9)
+        elif self.mode == 'alloc':
+            ' ' * (512 * 1024 ** 2)
+        with open(os.path.join(self.out, str(os.getpid())), 'a') as file:
+            file.write(self.mode + '\n')
+
+
+class TestSupervise(unittest.TestCase):
+
+    def setUp(self):
+        from traitscli_queue import WorkQueue
+        self.tmpdir = tempfile.mkdtemp()
+        self.queue = WorkQueue(os.path.join(self.tmpdir, 'queue.sqlite'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def supervise(self, modes, **kwds):
+        from traitscli_queue import supervise
+        self.queue.enqueue(dict(mode=m, out=self.tmpdir) for m in modes)
+        return supervise(self.queue, SupervisedCLI, **kwds)
+
+    def outputs(self):
+        return dict((name, open(os.path.join(self.tmpdir, name)).read())
+                    for name in os.listdir(self.tmpdir)
+                    if name.isdigit())
+
+    def test_killed_tasks(self):
+        killed = self.supervise(['ok1', 'hang', 'crash', 'ok2'],
+                                workers=2, timeout=0.5)
+        self.assertEqual(sorted(k['reason'] for k in killed),
+                         ['killed by signal 9', 'timeout (0.5 sec)'])
+        self.assertEqual(self.queue.counts()['done'], 2)
+        self.assertEqual(
+            sorted(t['params']['mode'] for t in self.queue.killed()),
+            ['crash', 'hang'])
+        self.assertEqual(sorted(''.join(self.outputs().values()).split()),
+                         ['ok1', 'ok2'])
+
+    def test_memory_limit(self):
+        self.supervise(['alloc', 'ok'], memory_limit=256 * 1024 ** 2)
+        [(params, error)] = self.queue.failures()
+        self.assertEqual(params['mode'], 'alloc')
+        self.assertIn('MemoryError', error)
+        self.assertEqual(self.queue.counts()['done'], 1)
+
+    def test_recycle(self):
+        killed = self.supervise(['a', 'b', 'c', 'd', 'e'],
+                                max_tasks_per_child=2)
+        self.assertEqual(killed, [])
+        self.assertEqual(sorted(map(len, self.outputs().values())),
+                         [2, 4, 4])
+
+    def test_crash_loop(self):
+        from traitscli_queue import WorkQueue, supervise
+        # Workers cannot open a directory as the database:
+        queue = WorkQueue(self.tmpdir)
+        (orig, sys.stderr) = (sys.stderr, open(os.devnull, 'w'))
+        try:
+            with self.assertRaises(RuntimeError):
+                supervise(queue, SupervisedCLI, workers=2, max_crashes=3)
+        finally:
+            sys.stderr = orig
+
+    def test_recycle_by_rss(self):
+        self.supervise(['a', 'b', 'c'], max_rss=1)
+        self.assertEqual(sorted(map(len, self.outputs().values())),
+                         [2, 2, 2])
+
+
+class TestValidateTree(unittest.TestCase):
+
+    files = {
+        'a.json': '{"int": 1, "sub": {"lr": 0.5}}',
+        'b.json': '{"int": "x", "list": [1, "a"]}',
+        'sub/c.json': '{',
+        'sub/d.json': '[1]',
+        'sub/e.txt': 'not a parameter file',
+        '.git/f.json': '{"int": "x"}',
+    }
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        for (name, data) in self.files.items():
+            path = os.path.join(self.tmpdir, name)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as file:
+                file.write(data)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def validate(self, jobs):
+        from traitscli_validate import validate_tree
+        results = validate_tree(self.tmpdir, 'test_traitscli:ValidateCLI',
+                                jobs)
+        return dict((os.path.relpath(r['path'], self.tmpdir), r)
+                    for r in results)
+
+    def check_results(self, results):
+        self.assertEqual(sorted(results),
+                         ['a.json', 'b.json', 'sub/c.json', 'sub/d.json'])
+        self.assertEqual(results['a.json']['errors'], [])
+        self.assertTrue(results['a.json']['ok'])
+        self.assertEqual([e['name'] for e in results['b.json']['errors']],
+                         ['int', 'list'])
+        for name in ['sub/c.json', 'sub/d.json']:
+            self.assertFalse(results[name]['ok'])
+            [error] = results[name]['errors']
+            self.assertIsNone(error['name'])
+
+    def test_serial(self):
+        self.check_results(self.validate(1))
+
+    def test_pool(self):
+        self.check_results(self.validate(2))
+
+    def test_main(self):
+        import json
+        from cStringIO import StringIO
+        from traitscli_validate import main
+        (stdout, stderr) = (sys.stdout, sys.stderr)
+        sys.stdout = out = StringIO()
+        sys.stderr = StringIO()
+        try:
+            with self.assertRaises(SystemExit) as cm:
+                main([self.tmpdir, 'test_traitscli:ValidateCLI',
+                      '--jobs', '2', '--only-failures'])
+            self.assertIn('3 of 4 files are invalid', sys.stderr.getvalue())
+        finally:
+            (sys.stdout, sys.stderr) = (stdout, stderr)
+        self.assertEqual(cm.exception.code, 1)
+        results = map(json.loads, out.getvalue().splitlines())
+        self.assertEqual(len(results), 3)
+        self.assertFalse(any(r['ok'] for r in results))
+
+
+class TestImportBudget(unittest.TestCase):
+
+    """
+    Importing traitscli should cost little on top of `traits.api`.
+
+    Absolute wall-clock time depends on the machine, so it is only
+    compared with the time to import `traits.api` in the same process.
+    Run ``python bench_traitscli.py startup`` for the numbers.
+
+    """
+
+    def python(self, code):
+        env = dict(os.environ)
+        env.pop('PYTHONDONTWRITEBYTECODE', None)
+        return subprocess.check_output(
+            [sys.executable, '-c', code],
+            cwd=os.path.dirname(os.path.abspath(__file__)), env=env)
+
+    def imported_by(self, code):
+        return set(self.python(
+            'import os, sys, traits.api, argparse\n'
+            'before = set(sys.modules)\n'
+            'sys.stdout = open(os.devnull, "w")\n'
+            '{0}\n'
+            'sys.__stdout__.write(" ".join(\n'
+            '    k for (k, v) in sys.modules.items()\n'
+            '    if v is not None and k not in before))'
+            .format(code)).split())
+
+    def test_no_extra_modules(self):
+        self.assertEqual(self.imported_by('import traitscli'),
+                         set(['traitscli']))
+
+    def test_import_time(self):
+        self.python('import traitscli')  # write .pyc files first
+        ratios = []
+        for _ in range(3):
+            (base, cost) = map(float, self.python(
+                'import time\n'
+                't0 = time.time(); import traits.api\n'
+                't1 = time.time(); import traitscli\n'
+                'print t1 - t0, time.time() - t1').split())
+            ratios.append(cost / base)
+        self.assertLess(min(ratios), 0.5)
+
+    def test_lazy_modules(self):
+        self.assertNotIn('ast', self.imported_by(
+            'from sample import SampleCLI; SampleCLI.cli(["--yes"])'))
+        self.assertIn('ast', self.imported_by(
+            'from test_traitscli import ValidateCLI\n'
+            'try: ValidateCLI.cli(["--check", "--dict[\'a\']=1"])\n'
+            'except SystemExit: pass'))
@@ -95,7 +95,7 @@ Example run::
 
   $ python sample.py --help
   usage: sample.py [-h] [--choice {a,b,c}] [--fnum FNUM] [--inum INUM] [--no]
-                   [--string STRING] [--yes]
+                   [--string STRING] [--yes] [--show-config-origins] [--check]
 
   Sample CLI using `traitscli`.
 
@@ -106,13 +106,18 @@ Example run::
     sample.py --choice x           # => raise error (x is not in {a, b, c})
 
   optional arguments:
-    -h, --help        show this help message and exit
-    --choice {a,b,c}  (default: a)
-    --fnum FNUM       (default: 0.0)
-    --inum INUM       (default: 0)
-    --no              (default: True)
-    --string STRING   (default: )
-    --yes             yes flag for sample CLI (default: False)
+    -h, --help            show this help message and exit
+    --choice {a,b,c}      (default: a)
+    --fnum FNUM           (default: 0.0)
+    --inum INUM           (default: 0)
+    --no                  (default: True)
+    --string STRING       (default: )
+    --yes                 yes flag for sample CLI (default: False)
+
+  traitscli options:
+    --show-config-origins
+                          print where each attribute is configured and exit
+    --check               validate the configuration and exit
 
   $ python sample.py --yes --choice a
   string : ''
@@ -124,7 +129,7 @@ Example run::
 
   $ python sample.py --inum invalid_argument
   usage: sample.py [-h] [--choice {a,b,c}] [--fnum FNUM] [--inum INUM] [--no]
-                   [--string STRING] [--yes]
+                   [--string STRING] [--yes] [--show-config-origins] [--check]
   sample.py: error: argument --inum: invalid int value: 'invalid_argument'
 
 
@@ -134,13 +139,15 @@ Example run::
 __version__ = '0.1.0'
 __author__ = 'Takafumi Arakaki'
 __license__ = 'BSD License'
-__all__ = ['TraitsCLIBase', 'multi_command_cli', 'flattendict']
+__all__ = ['TraitsCLIBase', 'multi_command_cli', 'multi_command_argparser',
+           'flattendict', 'DirectoryMemoStore', 'SQLiteMemoStore']
 
 
 import os
 import re
 import argparse
-import ast
+import weakref
+import functools
 from contextlib import contextmanager
 
 from traits.api import (
@@ -172,6 +179,87 @@ def trait_simple_type(trait):
             return ty
 
 
+class DictLikeOption(tuple):
+
+    """
+    ``(lhs, value)`` pair for dict-like option ``--lhs=value``.
+
+    It is a record with ``__slots__ = ()`` (like a namedtuple) which
+    compares equal to the plain tuples returned by
+    :func:`parse_dict_like_options`.  The tokenizer does not make
+    instances of this class: unlike plain tuples of strings, instances
+    of a tuple subclass stay tracked by the garbage collector, which
+    slows down tokenizing very long argument lists.  Wrap a pair by
+    this class where its parts are needed by name.
+
+    >>> opt = DictLikeOption("sub.dict['k']", '1')
+    >>> opt
+    ("sub.dict['k']", '1')
+    >>> (opt.name, opt.subscript, opt.value)
+    ('sub.dict', "['k']", '1')
+
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, lhs, value):
+        return tuple.__new__(cls, (lhs, value))
+
+    lhs = property(lambda self: self[0])
+    value = property(lambda self: self[1])
+
+    @property
+    def name(self):
+        """Dotted name of the attribute (the part before ``[``)."""
+        return self[0].split('[', 1)[0]
+
+    @property
+    def subscript(self):
+        """Subscript part (the part from ``[``)."""
+        return self[0][self[0].index('['):]
+
+
+class LazyRegexp(object):
+
+    """
+    Regular expression which is compiled when it is first used.
+
+    Compiling all module level regular expressions takes noticeable
+    time at import; most of them are needed only by some commands.
+
+    >>> regexp = LazyRegexp('a+')
+    >>> regexp.compiled is None
+    True
+    >>> regexp.match('aab').group()
+    'aa'
+
+    Methods of the compiled object are stored in the instance once
+    they are looked up, so that calling them later costs no more than
+    calling those of the compiled object.
+
+    >>> regexp.match == regexp.compiled.match
+    True
+    >>> 'match' in vars(regexp)
+    True
+
+    """
+
+    def __init__(self, pattern, flags=0):
+        self.pattern = pattern
+        self.flags = flags
+        self.compiled = None
+
+    def __getattr__(self, name):
+        if self.compiled is None:
+            self.compiled = re.compile(self.pattern, self.flags)
+        attr = getattr(self.compiled, name)
+        setattr(self, name, attr)
+        return attr
+
+
+_dict_like_option_re = LazyRegexp(r'--([A-Za-z_][\w.]*)(\[.*)$', re.DOTALL)
+
+
 def parse_dict_like_options(argiter):
     """
     Parse dict-like option (--dict['key']) in `argiter`.
@@ -185,24 +273,46 @@ def parse_dict_like_options(argiter):
     >>> parse_dict_like_options(['--a[k]', 'b'])
     ([('a[k]', 'b')], [])
 
+    Dotted names of nested attributes can be used.  The option ends at
+    the first ``]=``, so the subscript may contain ``=``.  Arguments
+    after ``--`` are not parsed.
+
+    >>> parse_dict_like_options(["--sub.d['x=y']=1", '--', '--a[k]=b'])
+    ([("sub.d['x=y']", '1')], ['--', '--a[k]=b'])
+
+    Each argument is examined only once (most of them only by cheap
+    string tests), so that this function runs in linear time of the
+    number of arguments.  Options are returned as plain tuples, which
+    the garbage collector stops tracking; use :class:`DictLikeOption`
+    to access their parts by name.
+
     """
     options = []
     positional = []
+    add_option = options.append
+    add_positional = positional.append
+    match = _dict_like_option_re.match
     argiter = iter(argiter)
-    while True:
+    for arg in argiter:
+        # Cheap tests first; most arguments are not dict-like options.
+        m = arg[:2] == '--' and '[' in arg and match(arg)
+        if not m:
+            add_positional(arg)
+            if arg == '--':
+                positional.extend(argiter)
+            continue
+        (name, rest) = m.groups()
+        pos = rest.find(']=')
+        if pos >= 0:
+            add_option((name + rest[:pos + 1], rest[pos + 2:]))
+            continue
         try:
-            arg = argiter.next()
+            value = next(argiter)
         except StopIteration:
-            return (options, positional)
-        if arg.startswith('--') and len(arg) > 2 and arg[2].isalpha() \
-           and '[' in arg:
-            key = arg[2:]
-            if '=' in key:
-                options.append(tuple(key.split('=', 1)))
-            else:
-                options.append((key, argiter.next()))
-        else:
-            positional.append(arg)
+            raise InvalidDictLikeOptionError(
+                'Dict-like option {0} requires a value'.format(arg))
+        add_option((name + rest, value))
+    return (options, positional)
 
 
 def names_in_dict_like_options(dopts):
@@ -220,7 +330,7 @@ class TraitsCLIAttributeError(Exception):
 
     def __init__(self, message):
         self.args = (message,)
-        self.message
+        self.message = message
 
 
 class InvalidDictLikeOptionError(TraitsCLIAttributeError):
@@ -230,7 +340,94 @@ class InvalidDictLikeOptionError(TraitsCLIAttributeError):
 _UNSPECIFIED = object()
 
 
-def parse_and_run(parser, args=None):
+def takes_parsed_options(func):
+    """
+    Mark `func` to be called with a :class:`ParsedOptions` object.
+
+    :func:`parse_and_run` calls ``func(options)`` instead of
+    ``func(**kwds)`` when `func` (typically set to `Namespace.func`)
+    is decorated by this function.
+
+    """
+    func.takes_parsed_options = True
+    return func
+
+
+class ParsedOptions(object):
+
+    """
+    Options given in command line, passed from parser to `func`.
+
+    >>> options = ParsedOptions.from_dict(
+    ...     {'a': 1, 'b': _UNSPECIFIED, '__show_config_origins': True})
+    >>> options.kwds
+    {'a': 1}
+    >>> options.builtins
+    {'show_config_origins': True}
+
+    Options which are not specified in command line (i.e., their
+    value is ``_UNSPECIFIED``) are dropped, so that they do not
+    override values from parameter files.  Options whose name starts
+    with ``__`` are hidden options added by traitscli (see
+    :func:`add_builtin_argument`); they are stored in `builtins`
+    without the ``__`` prefix.
+
+    """
+
+    __slots__ = ('func', 'kwds', 'dict_like_options', 'builtins',
+                 'previous')
+
+    def __init__(self, func=None, kwds=None, dict_like_options=(),
+                 builtins=None, previous=()):
+        self.func = func
+        self.kwds = {} if kwds is None else kwds
+        self.dict_like_options = dict_like_options
+        self.builtins = {} if builtins is None else builtins
+        self.previous = previous
+
+    @classmethod
+    def from_dict(cls, dct, dict_like_options=(), previous=()):
+        """
+        Make an instance from `dct` (``vars(ns)`` or `run` keywords).
+
+        `dct` itself is not modified.  ``__func`` and
+        ``__dict_like_options`` in `dct` are stored in the
+        corresponding attributes.  `previous` is the instances made by
+        the earlier commands of a pipeline.
+
+        >>> options = ParsedOptions.from_dict({'__func': len, 'func': 1})
+        >>> (options.func, options.kwds)
+        (<built-in function len>, {'func': 1})
+
+        """
+        kwds = {}
+        builtins = {}
+        for (key, value) in dct.iteritems():
+            if value is _UNSPECIFIED:
+                continue
+            if key[:2] == '__':
+                builtins[key[2:]] = value
+            else:
+                kwds[key] = value
+        func = builtins.pop('func', None)
+        dict_like_options = builtins.pop('dict_like_options',
+                                         dict_like_options)
+        return cls(func, kwds, dict_like_options, builtins, previous)
+
+    def apply(self):
+        """
+        Call :attr:`func` with these options and return its result.
+        """
+        func = self.func
+        if getattr(func, 'takes_parsed_options', False):
+            return func(self)
+        kwds = dict(self.kwds)
+        for (key, value) in self.builtins.iteritems():
+            kwds['__' + key] = value
+        return func(__dict_like_options=self.dict_like_options, **kwds)
+
+
+def parse_and_run(parser, args=None, previous=()):
     """
     Parse command line `args` using `parser` and run function of it.
 
@@ -239,13 +436,20 @@ def parse_and_run(parser, args=None):
 
     * It has `func` attribute which is an callable object.
       (i.e., you should set it by ``parser.set_default(func=some_callable)``.)
+      Parsers made by traitscli use ``__func`` instead, so that it
+      does not conflict with an attribute called `func`.
     * The callable `ns.func` can take rest of attributes defined in
       the `Namespace` object.
     * The callable `ns.func` can also take `__dict_like_options`
       keyword argument.  This is the first part of the tuple returned
       by `parse_dict_like_options`.
 
-    `ns.func` is typically `TraitsCLIBase.run`.
+    If `ns.func` is decorated by :func:`takes_parsed_options`, it is
+    called with a :class:`ParsedOptions` object instead of keyword
+    arguments.  `previous` is passed to it as
+    :attr:`ParsedOptions.previous`.
+
+    `ns.func` is typically `TraitsCLIBase.run_options`.
     It is set in `TraitsCLIBase.add_parser`.
 
     """
@@ -253,26 +457,23 @@ def parse_and_run(parser, args=None):
         import sys
         args = sys.argv[1:]
 
-    def applyargs(func, **kwds):
-        # Strip off unspecified arguments so that attributes set by
-        # parameter file will not be override default values.
-        # See `TraitsCLIBase.run` (actually, it's `func` here) for
-        # the timing of `TraitsCLIBase.load_all_paramfiles`.
-        return func(**dict((k, v) for (k, v) in kwds.iteritems()
-                           if v is not _UNSPECIFIED))
-
-    (dopts, args) = parse_dict_like_options(args)
     try:
+        (dopts, args) = parse_dict_like_options(args)
         ns = parser.parse_args(args)
-        return applyargs(__dict_like_options=dopts, **vars(ns))
+        options = ParsedOptions.from_dict(vars(ns), dopts, previous)
+        if options.func is None:  # parser not made by traitscli
+            options.func = options.kwds.pop('func')
+        return options.apply()
     except TraitsCLIAttributeError as e:
         parser.exit(e.message)
 
 
-def assert_expr(code, valuetype=ast.expr):
+def assert_expr(code, valuetype=None):
     """
     Raise an error when `code` is not an expression.
 
+    `valuetype` is the type of the expression (default: `ast.expr`).
+
     >>> assert_expr('0')
     >>> assert_expr('a[1]')
     >>> assert_expr('a[1] + b.c')
@@ -286,6 +487,7 @@ def assert_expr(code, valuetype=ast.expr):
       ...
     TraitsCLIAttributeError: `print 1` is not an expression.
     Only expression is allowed.
+    >>> import ast
     >>> assert_expr('1 + 2', ast.Subscript)  #doctest: +NORMALIZE_WHITESPACE
     Traceback (most recent call last):
       ...
@@ -293,6 +495,9 @@ def assert_expr(code, valuetype=ast.expr):
     <class '_ast.Subscript'>
 
     """
+    import ast
+    if valuetype is None:
+        valuetype = ast.expr
     nodes = list(ast.iter_child_nodes(ast.parse(code)))
     num = len(nodes)
     if num == 0:
@@ -342,6 +547,71 @@ def flattendict(dct):
     return flatten
 
 
+def canonical_value(value):
+    """
+    Convert `value` to a plain Python object with deterministic form.
+
+    Traits containers are converted to builtin ones, tuples to lists
+    and sets to sorted lists.
+
+    >>> canonical_value({'b': (1, 2), 'a': set([3, 1])}) == {
+    ...     'b': [1, 2], 'a': [1, 3]}
+    True
+
+    """
+    if isinstance(value, dict):
+        return dict((k, canonical_value(v)) for (k, v) in value.iteritems())
+    elif isinstance(value, (list, tuple)):
+        return map(canonical_value, value)
+    elif isinstance(value, (set, frozenset)):
+        return sorted(map(canonical_value, value))
+    return value
+
+
+def _json_default(obj):
+    if isinstance(obj, complex):
+        return repr(obj)
+    if hasattr(obj, '__module__') and hasattr(obj, '__name__'):
+        # classes and functions (`Type` and `Callable` traits)
+        return '{0}.{1}'.format(obj.__module__, obj.__name__)
+    raise TypeError('{0!r} is not JSON serializable'.format(obj))
+
+
+def canonical_json(value):
+    """
+    Serialize `value` to JSON string with sorted keys and no spaces.
+
+    >>> canonical_json({'b': [1, 2], 'a': {'d': 1, 'c': None}})
+    '{"a":{"c":null,"d":1},"b":[1,2]}'
+
+    """
+    import json
+    return json.dumps(value, sort_keys=True, separators=(',', ':'),
+                      default=_json_default)
+
+
+def import_object(target):
+    """
+    Import an object specified by ``'package.module:name'`` string.
+
+    The part after the colon can be a dotted name to access nested
+    attributes.  Non-string `target` is returned as-is.
+
+    >>> import_object('os.path:join') is os.path.join
+    True
+    >>> import_object('os:path.join') is os.path.join
+    True
+    >>> import_object(os) is os
+    True
+
+    """
+    if not isinstance(target, basestring):
+        return target
+    (modname, attrs) = target.split(':', 1)
+    module = __import__(modname, fromlist=['__name__'])
+    return getdottedattr(module, attrs)
+
+
 def splitdottedname(dottedname):
     return (dottedname if isinstance(dottedname, (tuple, list))
             else dottedname.split('.'))
@@ -395,202 +665,2216 @@ def setdottedattr(object, dottedname, value):
     setattr(getdottedattr(object, names[:-1]), names[-1], value)
 
 
-def cleanup_dict(dct,
-                 allow=re.compile('^[a-zA-Z_][a-zA-Z0-9_]*$'),
-                 deny=re.compile('^_.*_$')):
-    """
-    Clean up dictionary using allowed and denied regular expression of
-    keys.
-
-    >>> d = {'a':1, 'b':2, '0':3 , '__hidden__':4}
-    >>> dnew = cleanup_dict(d)
-    >>> sorted(dnew)
-    ['a', 'b']
-    >>> [dnew[k] for k in sorted(dnew)]
-    [1, 2]
-    >>> dnew = cleanup_dict(d, allow=None)
-    >>> sorted(dnew)
-    ['0', 'a', 'b']
-    >>> [dnew[k] for k in sorted(dnew)]
-    [3, 1, 2]
-    >>> dnew = cleanup_dict(d, deny=None)
-    >>> sorted(dnew)
-    ['__hidden__', 'a', 'b']
-    >>> [dnew[k] for k in sorted(dnew)]
-    [4, 1, 2]
-    >>> dnew = cleanup_dict(d, allow='a|0')
-    >>> sorted(dnew)
-    ['0', 'a']
-    >>> [dnew[k] for k in sorted(dnew)]
-    [3, 1]
-
+def sub_config_class(trait_type):
     """
-    if isinstance(allow, basestring):
-        allow = re.compile(allow)
-    if isinstance(deny, basestring):
-        deny = re.compile(deny)
-    if allow is None:
-        isallowed = lambda x: True
-    else:
-        isallowed = allow.match
-    if deny is None:
-        isdenied = lambda x: False
-    else:
-        isdenied = deny.match
-
-    return dict([
-        (k, dct[k]) for k in dct
-        if isinstance(k, basestring) and isallowed(k) and not isdenied(k)])
+    Return the class of the sub-object configured via `trait_type`.
 
+    It is the class of `Instance` trait if it is a subclass of
+    `HasTraits`, otherwise `None`.  The class can be given as a
+    (dotted) string; it is imported but no instance is created.
 
-@contextmanager
-def hidestderr():
-    try:
-        import sys
-        orig = sys.stderr
-        sys.stderr = open(os.devnull, 'w')
-        yield
-        sys.stderr.close()
-    finally:
-        sys.stderr = orig
-
+    >>> sub_config_class(Instance(TraitsCLIBase, args=())).__name__
+    'TraitsCLIBase'
+    >>> sub_config_class(Instance('traitscli.TraitsCLIBase')).__name__
+    'TraitsCLIBase'
+    >>> sub_config_class(Int()) is None
+    True
 
-def add_parser(cls, parser, prefix=''):
     """
-    Call `parser.add_argument` based on class traits of `cls`.
+    if not isinstance(trait_type, Instance):
+        return None
+    klass = trait_type.klass
+    if isinstance(klass, basestring):
+        klass = trait_type.find_class(klass)
+    if isinstance(klass, type) and issubclass(klass, HasTraits):
+        return klass
 
-    This classmethod is called from :meth:`get_argparser`.
 
+def getsubobject(object, dottedname):
     """
-    traits = cls.class_traits(config=True)
-    for k in sorted(traits):
-        v = traits[k]
+    `getdottedattr` which creates sub-objects set to `None`.
 
-        if (isinstance(v.trait_type, Instance) and
-                issubclass(v.trait_type.klass, HasTraits)):
-            if issubclass(v.trait_type.klass, TraitsCLIBase):
-                adder = v.trait_type.klass.add_parser
-            else:
-                adder = lambda *args: add_parser(v.trait_type.klass, *args)
-            adder(parser, prefix + k + '.')
-            # set_defaults is called here and it's redundant...
-            # but as there is no harm, let it be like this for now.
-            continue
-
-        dest = name = '{0}{1}'.format(prefix, k)
-        argkwds = dict(
-            help='{0} (default: {1})'.format(v.desc or '', v.default),
-        )
-        if not v.cli_positional:
-            name = '--{0}'.format(dest)
-        for arg_key in ['required', 'metavar']:
-            attr_val = getattr(v, 'cli_{0}'.format(arg_key))
-            if attr_val is not None:
-                argkwds[arg_key] = attr_val
-        stype = trait_simple_type(v.trait_type)
-        if stype:
-            argkwds['type'] = stype
-        elif isinstance(v.trait_type, (Bool, CBool)) and \
-             not v.cli_positional:
-            argkwds.update(
-                action='store_const',
-                const=not v.trait_type.default_value,
-            )
-        elif isinstance(v.trait_type, Enum):
-            argkwds['choices'] = v.trait_type.values
-        else:
-            argkwds['type'] = eval_for_parser
-        parser.add_argument(name, default=_UNSPECIFIED, **argkwds)
-    if issubclass(cls, TraitsCLIBase):
-        parser.set_defaults(func=cls.run)
-    return parser
+    Configurable `Instance` traits without default (e.g.,
+    ``Instance(SubObject, config=True)``) are `None` until some
+    attribute under them is configured.  This function creates such
+    sub-objects on the way, using `sub_config_class`.
 
+    >>> class SubObject(TraitsCLIBase):
+    ...     a = Int(config=True)
+    ...
+    >>> class SampleCLI(TraitsCLIBase):
+    ...     sub = Instance(SubObject, config=True)
+    ...
+    >>> obj = SampleCLI()
+    >>> obj.sub is None
+    True
+    >>> getsubobject(obj, 'sub').a
+    0
+    >>> obj.sub is None
+    False
 
-def config_traits(cls, **metadata):
     """
-    Return configurable traits as a (possibly nested) dict.
+    for name in splitdottedname(dottedname):
+        parent = object
+        object = getattr(parent, name)
+        if object is None and isinstance(parent, HasTraits):
+            trait = parent.trait(name)
+            klass = trait and sub_config_class(trait.trait_type)
+            if klass is not None:
+                object = klass()
+                setattr(parent, name, object)
+    return object
 
-    The returned dict can be nested if this class has `Instance`
-    trait of :class:`TraitsCLIBase`.  Use :func:`flattendict` to
-    get a flat dictionary with dotted keys.
 
-    It is equivalent to ``cls.class_traits(config=True)`` if
-    ``cls`` has no `Instance` trait.
+def class_default(cls, dottedname):
+    """
+    `getdottedattr` for a class; return the default value of an attribute.
+
+    No instance is created.  Defaults of attributes of sub-objects
+    are taken from the class given by `sub_config_class`.
 
     >>> class SubObject(TraitsCLIBase):
-    ...     int = Int(config=True)
+    ...     a = Int(1, config=True)
     ...
     >>> class SampleCLI(TraitsCLIBase):
-    ...     nonconfigurable = Int()
-    ...     int = Int(config=True)
-    ...     sub = Instance(SubObject, args=(), config=True)
+    ...     sub = Instance(SubObject, config=True)
     ...
-    >>> traits = SampleCLI.config_traits()
-    >>> traits                                         # doctest: +SKIP
-    {'int': <traits.traits.CTrait at ...>,
-     'sub': {'int': <traits.traits.CTrait at ...>}}
-    >>> traits['int'].trait_type                   # doctest: +ELLIPSIS
-    <traits.trait_types.Int object at ...>
-    >>> traits['sub']['int'].trait_type            # doctest: +ELLIPSIS
-    <traits.trait_types.Int object at ...>
+    >>> class_default(SampleCLI, 'sub.a')
+    1
+    >>> class_default(SampleCLI, 'sub') is None
+    True
 
     """
-    traits = {}
-    for (k, v) in cls.class_traits(config=True).iteritems():
-        if (isinstance(v.trait_type, Instance) and
-                issubclass(v.trait_type.klass, HasTraits)):
-            if issubclass(v.trait_type.klass, TraitsCLIBase):
-                traits[k] = v.trait_type.klass.config_traits()
-            else:
-                traits[k] = config_traits(v.trait_type.klass)
+    value = None
+    for name in splitdottedname(dottedname):
+        if cls is None:
+            raise AttributeError(name)
+        trait = cls.class_traits().get(name)
+        if trait is None:
+            value = getattr(cls, name)
+            cls = None
         else:
-            traits[k] = v
-    return traits
+            value = trait.default
+            cls = sub_config_class(trait.trait_type)
+    return value
 
 
-class TraitsCLIBase(HasTraits):
-
+def literal_or_string(value):
     """
-    CLI generator base class.
+    Evaluate `value` as a Python literal if possible.
 
-    Usage.  You will need to define:
+    >>> literal_or_string('[1, 2]')
+    [1, 2]
+    >>> literal_or_string('a')
+    'a'
 
-    1. Parameters (traits).  When it has ``config=True`` metadata, it is
-       configurable via command line argument.
-       See: `Defining Traits: Initialization and Validation`_
-       section in `Traits user manual`_.
+    """
+    import ast
+    try:
+        return ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return value
 
-    2. :meth:`do_run` method.  This method gets no argument (except `self`).
-       Do whatever this class needs to do based on its attributes.
-       :meth:`cli` function sets attributes based on command line options
-       and then call :meth:`do_run` method.
 
+_conf_boolean_states = {
+    '1': True, 'yes': True, 'true': True, 'on': True,
+    '0': False, 'no': False, 'false': False, 'off': False,
+}
 
-    **Examples**
 
-    To make class attribute configurable from command line options,
-    set metadata ``config=True``:
+def parse_bool(value):
+    """
+    Convert string to bool in the same way as `ConfigParser`.
 
-    >>> class SampleCLI(TraitsCLIBase):
-    ...     int = Int(config=True)
-    ...
-    >>> obj = SampleCLI.cli(['--int', '1'])
-    >>> obj.int
-    1
+    >>> parse_bool('Yes'), parse_bool('off')
+    (True, False)
 
+    """
+    try:
+        return _conf_boolean_states[value.lower()]
+    except KeyError:
+        raise ValueError('Not a boolean: {0}'.format(value))
 
-    For dict and list type attribute, you can modify it using
-    subscript access:
 
-    >>> class SampleCLI(TraitsCLIBase):
-    ...     dict = Dict(config=True)
-    ...
-    >>> obj = SampleCLI.cli(['--dict["k"]', '1'])
-    >>> obj.dict['k']
+def trait_converter(trait_type):
+    """
+    Return a function to convert a string to a value for `trait_type`.
+
+    It is used for strings in conf/ini files and environment
+    variables.  Values of `Enum` traits are looked up by their string
+    representation, so that ``'1'`` stays a string for ``Enum(['1',
+    '2'])`` and becomes an integer for ``Enum([1, 2])``.  Strings for
+    other non-simple traits (e.g., `List` and `Any`) are evaluated as
+    Python literals when possible (see :func:`literal_or_string`).
+
+    >>> trait_converter(Enum(['1', '2']))('1')
+    '1'
+    >>> trait_converter(Enum([1, 2]))('1')
     1
+    >>> trait_converter(Enum(['1', '2']))("'2'")  # quoted by dumper_conf
+    '2'
+    >>> trait_converter(List())('[1]')
+    [1]
 
+    """
+    if isinstance(trait_type, (Bool, CBool)):
+        return parse_bool
+    if isinstance(trait_type, Enum):
+        index = dict((str(v), v) for v in trait_type.values)
 
-    You don't need to quote string if dict/list attribute set
+        def convert(value):
+            if value in index:
+                return index[value]
+            return literal_or_string(value)
+        return convert
+    return trait_simple_type(trait_type) or literal_or_string
+
+
+def trait_validator(trait):
+    """
+    Return a function to check a value against `trait` (a `CTrait`).
+
+    The function returns `None` if the value is valid and an error
+    message otherwise.  No object is needed to check the value and
+    items of `List` and keys and values of `Dict` are checked as well.
+    Values which cannot be checked without an object (the validator of
+    the trait raises an exception other than `TraitError`) are not
+    regarded as valid; the message tells the exception.
+
+    >>> check = trait_validator(Int().as_ctrait())
+    >>> check(1) is None
+    True
+    >>> check('a')
+    "must be an integer (int or long), but 'a' was given"
+    >>> check = trait_validator(List(Int).as_ctrait())
+    >>> check([0, 'a'])
+    "item 1 must be an integer (int or long), but 'a' was given"
+    >>> from traits.api import TraitType
+    >>> class NeedsObject(TraitType):
+    ...     def validate(self, obj, name, value):
+    ...         return obj.convert(value)
+    ...
+    >>> message = trait_validator(NeedsObject().as_ctrait())(1)
+    >>> message.startswith('cannot be checked: AttributeError:')
+    True
+
+    """
+    from traits.api import TraitError
+    trait_type = trait.trait_type
+    items = None
+    if isinstance(trait_type, List):
+        check_item = trait_validator(trait_type.item_trait)
+
+        def items(value):
+            for (i, item) in enumerate(value):
+                message = check_item(item)
+                if message:
+                    return 'item {0} {1}'.format(i, message)
+    elif isinstance(trait_type, Dict):
+        check_key = trait_validator(trait_type.key_trait)
+        check_value = trait_validator(trait_type.value_trait)
+
+        def items(value):
+            for (key, item) in value.iteritems():
+                message = check_key(key)
+                if message:
+                    return 'key {0}'.format(message)
+                message = check_value(item)
+                if message:
+                    return 'value of key {0!r} {1}'.format(key, message)
+
+    def check(value):
+        try:
+            trait.validate(None, None, value)
+        except TraitError:
+            return 'must be {0}, but {1} was given'.format(
+                trait.full_info(None, None, value),
+                _short_repr_class()(80).repr(value))
+        except Exception as e:
+            return 'cannot be checked: {0}: {1}'.format(
+                type(e).__name__, e)
+        if items is not None:
+            return items(value)
+
+    return check
+
+
+def flatten_param(param, prefixes, prefix=''):
+    """
+    Yield ``(dotted_name, value)`` of a nested parameter dict `param`.
+
+    Only the dictionaries for the keys in `prefixes` (dotted names of
+    configurable sub-objects) are flattened.
+
+    >>> sorted(flatten_param({'a': {'b': 1}, 'c': {'d': 2}}, ['a']))
+    [('a.b', 1), ('c', {'d': 2})]
+
+    """
+    for (key, value) in param.iteritems():
+        key = prefix + key
+        if isinstance(value, dict) and key in prefixes:
+            for item in flatten_param(value, prefixes, key + '.'):
+                yield item
+        else:
+            yield (key, value)
+
+
+class ConfigSchema(object):
+
+    """
+    Information derived from configurable traits of a class.
+
+    Use :func:`config_schema` to get the (cached) instance.
+
+    """
+
+    def __init__(self, cls):
+        self.cls = cls
+        if issubclass(cls, TraitsCLIBase):
+            self.traits = flattendict(cls.config_traits())
+        else:
+            self.traits = flattendict(config_traits(cls))
+        """Dotted name to trait mapping."""
+        self.converters = dict((k, trait_converter(v.trait_type))
+                               for (k, v) in self.traits.iteritems())
+        """Dotted name to string converter mapping."""
+        self.environ_keys = dict((k.replace('.', '__').upper(), k)
+                                 for k in self.traits)
+        """Environment variable name (without prefix) to dotted name."""
+        self.names = frozenset(cls.class_trait_names(config=True))
+        """Names of (non-nested) configurable attributes."""
+        prefixes = set()
+        for key in self.traits:
+            while '.' in key:
+                key = key.rsplit('.', 1)[0]
+                prefixes.add(key)
+        self.prefixes = frozenset(prefixes)
+        """Dotted names of configurable sub-objects."""
+        self._validators = None
+
+    @property
+    def validators(self):
+        """
+        Dotted name to validator (see :func:`trait_validator`) mapping.
+
+        Configurable sub-objects (:attr:`prefixes`) have validators as
+        well.  Validators are compiled when this is first accessed.
+
+        """
+        if self._validators is None:
+            validators = dict((k, trait_validator(v))
+                              for (k, v) in self.traits.iteritems())
+            for key in self.prefixes:
+                validators[key] = trait_validator(self.prefix_trait(key))
+            self._validators = validators
+        return self._validators
+
+    def prefix_trait(self, dottedname):
+        """Return the `Instance` trait of a configurable sub-object."""
+        (cls, trait) = (self.cls, None)
+        for name in splitdottedname(dottedname):
+            trait = cls.class_traits()[name]
+            cls = sub_config_class(trait.trait_type)
+        return trait
+
+
+_config_schema_cache = weakref.WeakKeyDictionary()
+
+
+def config_schema(cls):
+    """
+    Return the :class:`ConfigSchema` of class `cls` (cached).
+    """
+    try:
+        return _config_schema_cache[cls]
+    except KeyError:
+        schema = _config_schema_cache[cls] = ConfigSchema(cls)
+        return schema
+
+
+class LocatedParam(dict):
+
+    """
+    Parameter dictionary which knows where each value is defined.
+
+    :attr:`locations` maps keys to line numbers.  It is returned by
+    :func:`read_conf` and used by :class:`ConfigResolver`.
+
+    """
+
+    def __init__(self, *args, **kwds):
+        super(LocatedParam, self).__init__(*args, **kwds)
+        self.locations = {}
+
+
+class ConfigResolver(object):
+
+    """
+    Merge configuration sources into one flat mapping.
+
+    Sources are given by :meth:`add` (and :meth:`add_dict_like_options`)
+    in the order of increasing priority.  Nested dictionaries for
+    configurable sub-objects are flattened to dotted keys, so that
+    :attr:`values` holds only the final value of each key and it can
+    be applied by a single :meth:`TraitsCLIBase.setattrs` call.
+
+    Where each value comes from is recorded in a compact form: a list
+    of sources :attr:`sources` and a mapping from key to the index of
+    the source and the location in it (:attr:`origins`).  Human
+    readable description is made only when :meth:`origin` is called.
+
+    >>> class SubObject(TraitsCLIBase):
+    ...     lr = Float(config=True)
+    >>> class SampleCLI(TraitsCLIBase):
+    ...     n_iter = Int(config=True)
+    ...     sub = Instance(SubObject, args=(), config=True)
+    ...
+    >>> resolver = ConfigResolver(SampleCLI())
+    >>> resolver.add('paramfile', 'param.json',
+    ...              {'n_iter': 1, 'sub': {'lr': 0.5}})
+    >>> resolver.add('argument', None, {'n_iter': 2})
+    >>> sorted(resolver.values.items())
+    [('n_iter', 2), ('sub.lr', 0.5)]
+    >>> resolver.origin('n_iter')
+    'option --n_iter'
+    >>> resolver.origin('sub.lr')
+    'paramfile param.json'
+
+    `obj` can be a class as well.  Then default values of its traits
+    are used as the current values (see :func:`class_default`).
+
+    >>> resolver = ConfigResolver(SampleCLI)
+    >>> resolver.current('n_iter')
+    0
+
+    """
+
+    def __init__(self, obj):
+        self.obj = obj
+        self.schema = config_schema(obj if isinstance(obj, type)
+                                    else type(obj))
+        self.values = {}
+        """Dotted name to the final value mapping."""
+        self.sources = []
+        """List of ``(kind, location)`` of each source."""
+        self.origins = {}
+        """Dotted name to ``(source index, detail)`` mapping."""
+
+    def add_source(self, kind, location=None):
+        self.sources.append((kind, location))
+        return len(self.sources) - 1
+
+    def flatten(self, param):
+        return flatten_param(param, self.schema.prefixes)
+
+    def set(self, key, value, index, detail=None):
+        if key in self.schema.prefixes:
+            # The whole sub-object overrides its attributes set so far.
+            start = key + '.'
+            for k in [k for k in self.values if k.startswith(start)]:
+                del self.values[k]
+                del self.origins[k]
+        self.values[key] = value
+        self.origins[key] = (index, detail)
+
+    def add(self, kind, location, param, only_configurable=False):
+        """
+        Add parameters `param` (a possibly nested dict) as a new source.
+
+        `kind` is one of ``'paramfile'``, ``'environ'``, ``'argument'``
+        (or any other string) and `location` is a path, prefix, etc.
+        If `param` has a `locations` attribute (see
+        :class:`LocatedParam`), it is recorded as well.
+
+        """
+        schema = self.schema
+        index = self.add_source(kind, location)
+        locations = getattr(param, 'locations', {})
+        for (key, value) in self.flatten(param):
+            if only_configurable and not (key in schema.traits or
+                                          key in schema.prefixes):
+                raise TraitsCLIAttributeError(
+                    'Non-configurable key is given: {0}'.format(key))
+            self.set(key, value, index, locations.get(key))
+
+    def current(self, name):
+        if name in self.values:
+            return self.values[name]
+        if isinstance(self.obj, type):
+            return class_default(self.obj, name)
+        return getsubobject(self.obj, name)
+
+    def add_dict_like_options(self, dopts):
+        """
+        Evaluate dict-like options `dopts` and add them as a new source.
+
+        Each option modifies a copy of the value resolved so far (or
+        the current value of the object), so that the object itself is
+        not touched.
+
+        """
+        if not dopts:
+            return
+        import ast
+        traits = self.schema.traits
+        unknown = set(names_in_dict_like_options(dopts)) - set(traits)
+        if unknown:
+            unknown = tuple(unknown)
+            clargs = ' '.join(
+                '--{0}={1}'.format(k, v) for (k, v) in dopts
+                if k.startswith(unknown))
+            raise InvalidDictLikeOptionError(
+                "Unknown dict-like options {0}".format(clargs))
+
+        def value_trait(trait_type):
+            if isinstance(trait_type, Dict):
+                return trait_type.value_trait.trait_type
+            elif isinstance(trait_type, List):
+                return trait_type.item_trait.trait_type
+
+        index = self.add_source('dict-like')
+        namespace = _DictLikeNamespace(self)
+        copied = set()
+        for (lhs, rhs) in dopts:
+            opt = DictLikeOption(lhs, rhs)
+            name = opt.name
+            trait_type = value_trait(traits[name].trait_type)
+            assert_expr(lhs, ast.Subscript)
+            if isinstance(trait_type, (Str, CStr, Unicode, CUnicode)):
+                rhs = repr(rhs)
+            else:
+                assert_expr(rhs)
+            if name not in copied:
+                self.set(name, _plain_copy(self.current(name)), index)
+                copied.add(name)
+            self.origins[name] = (index, lhs)
+            namespace.target = self.values[name]
+            try:
+                exec '{0}{1} = {2}'.format(
+                    _DictLikeNamespace.target_name, opt.subscript, rhs
+                ) in {}, namespace
+            except NameError as e:
+                raise TraitsCLIAttributeError(
+                    'Got {0!r} wile evaluating --{1}={2}'.format(
+                        e, lhs, rhs))
+
+    def origin(self, key):
+        """
+        Return a description of where the value of `key` comes from.
+        """
+        while key not in self.origins:
+            if '.' not in key:
+                return 'default'
+            key = key.rsplit('.', 1)[0]
+        (index, detail) = self.origins[key]
+        (kind, location) = self.sources[index]
+        if kind == 'paramfile':
+            if detail is None:
+                return 'paramfile {0}'.format(location)
+            return 'paramfile {0}:{1}'.format(location, detail)
+        elif kind == 'environ':
+            return 'environment variable {0}{1}'.format(
+                location, key.replace('.', '__').upper())
+        elif kind == 'argument':
+            return 'option --{0}'.format(key)
+        elif kind == 'dict-like':
+            return 'dict-like option --{0}'.format(detail)
+        return kind if location is None else '{0} {1}'.format(kind, location)
+
+
+class _DictLikeNamespace(object):
+
+    """
+    Namespace to evaluate dict-like options.
+
+    Names are looked up in the resolved values and then in the
+    configurable attributes of the object (only when needed).
+
+    """
+
+    target_name = '__traitscli_target'
+
+    def __init__(self, resolver):
+        self.resolver = resolver
+        self.target = None
+
+    def __getitem__(self, name):
+        if name == self.target_name:
+            return self.target
+        resolver = self.resolver
+        if name in resolver.values:
+            return resolver.values[name]
+        if name in resolver.schema.names:
+            return resolver.current(name)
+        raise KeyError(name)
+
+
+_shared_paramfiles = []
+
+
+@contextmanager
+def shared_paramfiles():
+    """
+    Load each parameter file only once within this context.
+
+    Commands of a pipeline (see :func:`multi_command_cli`) often take
+    the same large parameter files.  Within this context, the value
+    returned by a loader is reused while the modification time and
+    the size of the file are unchanged.  Each user gets a copy of the
+    dicts and lists in it (see :func:`load_shared_paramfile`).
+    Results of loaders defined as classmethods (e.g.,
+    :meth:`TraitsCLIBase.loader_conf`) are shared only among the
+    users of the same class.
+
+    """
+    if _shared_paramfiles:  # nested; use the outer one
+        yield
+        return
+    _shared_paramfiles.append({})
+    try:
+        yield
+    finally:
+        _shared_paramfiles.pop()
+
+
+def load_shared_paramfile(loader, path):
+    """
+    Call ``loader(path)``, sharing the result in :func:`shared_paramfiles`.
+
+    >>> calls = []
+    >>> def loader(path):
+    ...     calls.append(path)
+    ...     return {'a': [1]}
+    ...
+    >>> with shared_paramfiles():
+    ...     p1 = load_shared_paramfile(loader, __file__)
+    ...     p2 = load_shared_paramfile(loader, __file__)
+    ...
+    >>> (p1 == p2, p1['a'] is p2['a'], len(calls))
+    (True, False, 1)
+
+    """
+    if not _shared_paramfiles:
+        return loader(path)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return loader(path)
+    cache = _shared_paramfiles[-1]
+    key = (os.path.abspath(path), stat.st_mtime, stat.st_size,
+           _loader_key(loader))
+    if key in cache:
+        param = cache[key]
+    else:
+        param = cache[key] = loader(path)
+    copied = _plain_copy(param)
+    if isinstance(param, LocatedParam):
+        copied = LocatedParam(copied)
+        copied.locations = param.locations
+    return copied
+
+
+def _loader_key(loader):
+    """
+    Return a hashable key identifying what `loader` does.
+
+    Bound methods and :func:`functools.partial` objects are made for
+    each call of :meth:`TraitsCLIBase.dispatch_paramfile_loader`, and
+    they do not compare equal even when they wrap the same function.
+
+    >>> key = lambda: _loader_key(functools.partial(
+    ...     TraitsCLIBase.loader_json, _open=open))
+    >>> key() == key()
+    True
+
+    """
+    if isinstance(loader, functools.partial):
+        return (_loader_key(loader.func), loader.args,
+                tuple(sorted((loader.keywords or {}).items())))
+    return (getattr(loader, 'im_func', loader),
+            getattr(loader, 'im_self', None))
+
+
+def encode_strings(obj):
+    """
+    Encode unicode strings in `obj` decoded from JSON to `str`.
+
+    >>> encode_strings({u'a': [u'b', 1]})
+    {'a': ['b', 1]}
+
+    """
+    if isinstance(obj, unicode):
+        return obj.encode('utf-8')
+    elif isinstance(obj, list):
+        return map(encode_strings, obj)
+    elif isinstance(obj, dict):
+        return dict((encode_strings(k), encode_strings(v))
+                    for (k, v) in obj.iteritems())
+    return obj
+
+
+def _plain_copy(value):
+    """
+    Copy (possibly nested) dicts and lists in `value`.
+
+    >>> value = {'a': [1, {'b': 2}]}
+    >>> copied = _plain_copy(value)
+    >>> copied == value
+    True
+    >>> copied['a'][1] is value['a'][1]
+    False
+
+    """
+    if isinstance(value, dict):
+        return dict((k, _plain_copy(v)) for (k, v) in value.iteritems())
+    elif isinstance(value, list):
+        return map(_plain_copy, value)
+    return value
+
+
+def read_conf(lines, cls, path='<conf>'):
+    """
+    Read conf/ini formatted `lines` and return converted parameters.
+
+    This is a single-pass reader specialized for traitscli.  Each value
+    is converted using a converter in :func:`config_schema` of `cls` as
+    soon as its line (and continuation lines) is read.  Errors are
+    reported with the location ``path:lineno``.
+
+    The syntax is the one `ConfigParser` accepts, including
+    continuation lines, inline ``;`` comments and the ``[DEFAULT]``
+    section, except that ``%(name)s`` interpolation is not supported.
+    Values of string traits can be written as quoted Python string
+    literals (as :meth:`TraitsCLIBase.dumper_conf` does for strings
+    with newlines, ``%``, etc.).  The returned dictionary is a
+    :class:`LocatedParam`.
+
+    >>> class SampleCLI(TraitsCLIBase):
+    ...     a = Int(config=True)
+    ...     b = Bool(config=True)
+    ...
+    >>> read_conf(['[root]', 'a = 1', 'b: yes'], SampleCLI) == {
+    ...     'a': 1, 'b': True}
+    True
+    >>> class StringCLI(TraitsCLIBase):
+    ...     s = Str(config=True)
+    ...
+    >>> read_conf(['[root]', r"s = 'a\\nb;c'"], StringCLI)['s']
+    'a\\nb;c'
+    >>> read_conf(['[root]', 'a = x'], SampleCLI)
+    ... # doctest: +NORMALIZE_WHITESPACE
+    Traceback (most recent call last):
+      ...
+    TraitsCLIAttributeError: <conf>:2: invalid value 'x' for 'a':
+    invalid literal for int() with base 10: 'x'
+    >>> read_conf(['[root]', '', 'c = 1'], SampleCLI)
+    ... # doctest: +NORMALIZE_WHITESPACE
+    Traceback (most recent call last):
+      ...
+    TraitsCLIAttributeError: <conf>:3: Key 'c' is not configurable
+    attribute of class SampleCLI.
+
+    """
+    converters = config_schema(cls).converters
+    root = getattr(cls, 'cli_conf_root_section', 'root')
+    param = LocatedParam()
+    locations = param.locations
+    defaults = []
+    sections = {}
+    # `current` is [prefix, option, value lines, lineno] of the option
+    # being read (it can continue to the next lines).
+    current = None
+    prefix = None
+
+    def store(prefix, option, value, lineno):
+        key = prefix + option
+        try:
+            convert = converters[key]
+        except KeyError:
+            raise TraitsCLIAttributeError(
+                "{0}:{1}: Key '{2}' is not configurable attribute of "
+                "class {3}.".format(path, lineno, key, cls.__name__))
+        try:
+            if convert in (str, unicode):
+                value = _conf_unquote(value)
+            param[key] = convert(value)
+        except (ValueError, TypeError) as e:
+            raise TraitsCLIAttributeError(
+                "{0}:{1}: invalid value {2!r} for '{3}': {4}".format(
+                    path, lineno, value, key, e))
+        locations[key] = lineno
+        sections[prefix].add(option)
+
+    def flush(current):
+        (prefix, option, value, lineno) = current
+        value = '\n'.join(value)
+        if value == '""':
+            value = ''
+        if prefix is _conf_default_section:
+            defaults.append((option, value, lineno))
+        else:
+            store(prefix, option, value, lineno)
+
+    for (lineno, line) in enumerate(lines, 1):
+        line = line.rstrip('\r\n')
+        stripped = line.strip()
+        if not stripped or line[0] in '#;' or \
+           (line[0] in 'rR' and line.split(None, 1)[0].lower() == 'rem'):
+            continue
+        if current is not None and line[0].isspace():
+            current[2].append(stripped)
+            continue
+        if current is not None:
+            flush(current)
+            current = None
+        if stripped[0] == '[' and ']' in stripped:
+            section = stripped[1:stripped.index(']')]
+            if section == 'DEFAULT':
+                prefix = _conf_default_section
+            else:
+                prefix = '' if section == root else section + '.'
+                sections.setdefault(prefix, set())
+            continue
+        if prefix is None:
+            raise TraitsCLIAttributeError(
+                "{0}:{1}: file contains no section headers.".format(
+                    path, lineno))
+        match = _conf_option_re.match(line)
+        if not match:
+            raise TraitsCLIAttributeError(
+                "{0}:{1}: parsing error: {2!r}".format(path, lineno, line))
+        (option, vi, value) = match.group('option', 'vi', 'value')
+        if ';' in value:
+            pos = value.find(';')
+            if pos != -1 and value[pos - 1].isspace():
+                value = value[:pos]
+        current = [prefix, option.rstrip().lower(), [value.strip()], lineno]
+    if current is not None:
+        flush(current)
+
+    for (option, value, lineno) in defaults:
+        for (prefix, options) in sections.iteritems():
+            if option not in options:
+                store(prefix, option, value, lineno)
+    return param
+
+
+def _conf_unquote(value):
+    if len(value) >= 2 and value[0] in '\'"' and value[-1] == value[0]:
+        unquoted = literal_or_string(value)
+        if isinstance(unquoted, basestring):
+            return unquoted
+    return value
+
+
+def _conf_plain_string(value):
+    """Return true if `value` can be written to conf file as is."""
+    return (value and value == value.strip() and value[0] not in '\'"' and
+            not any(c in value for c in '\n\r%;#'))
+
+
+_conf_default_section = object()
+_conf_option_re = LazyRegexp(
+    r'(?P<option>[^:=\s][^:=]*)\s*(?P<vi>[:=])\s*(?P<value>.*)$')
+
+
+def cleanup_dict(dct,
+                 allow=LazyRegexp('^[a-zA-Z_][a-zA-Z0-9_]*$'),
+                 deny=LazyRegexp('^_.*_$')):
+    """
+    Clean up dictionary using allowed and denied regular expression of
+    keys.
+
+    >>> d = {'a':1, 'b':2, '0':3 , '__hidden__':4}
+    >>> dnew = cleanup_dict(d)
+    >>> sorted(dnew)
+    ['a', 'b']
+    >>> [dnew[k] for k in sorted(dnew)]
+    [1, 2]
+    >>> dnew = cleanup_dict(d, allow=None)
+    >>> sorted(dnew)
+    ['0', 'a', 'b']
+    >>> [dnew[k] for k in sorted(dnew)]
+    [3, 1, 2]
+    >>> dnew = cleanup_dict(d, deny=None)
+    >>> sorted(dnew)
+    ['__hidden__', 'a', 'b']
+    >>> [dnew[k] for k in sorted(dnew)]
+    [4, 1, 2]
+    >>> dnew = cleanup_dict(d, allow='a|0')
+    >>> sorted(dnew)
+    ['0', 'a']
+    >>> [dnew[k] for k in sorted(dnew)]
+    [3, 1]
+
+    """
+    if isinstance(allow, basestring):
+        allow = re.compile(allow)
+    if isinstance(deny, basestring):
+        deny = re.compile(deny)
+    if allow is None:
+        isallowed = lambda x: True
+    else:
+        isallowed = allow.match
+    if deny is None:
+        isdenied = lambda x: False
+    else:
+        isdenied = deny.match
+
+    return dict([
+        (k, dct[k]) for k in dct
+        if isinstance(k, basestring) and isallowed(k) and not isdenied(k)])
+
+
+def cache_dir(*names):
+    """
+    Return (and create) a cache directory for traitscli.
+
+    The base directory is ``$TRAITSCLI_CACHE_DIR`` if defined, or else
+    ``traitscli`` under ``$XDG_CACHE_HOME`` (``~/.cache`` by default).
+    `names` are joined to it.
+
+    """
+    path = _cache_path(*names)
+    if not os.path.isdir(path):
+        try:
+            os.makedirs(path)
+        except OSError:
+            if not os.path.isdir(path):
+                raise
+    return path
+
+
+def _cache_path(*names):
+    """Return the path of :func:`cache_dir` without creating it."""
+    base = os.environ.get('TRAITSCLI_CACHE_DIR') or os.path.join(
+        os.environ.get('XDG_CACHE_HOME') or
+        os.path.join(os.path.expanduser('~'), '.cache'),
+        'traitscli')
+    return os.path.join(base, *names)
+
+
+def write_atomic(path, data):
+    """
+    Write `data` to `path` via a temporary file and rename.
+
+    The file gets the mode of the existing `path`, or the default mode
+    of new files (``0666`` masked by umask) when `path` does not exist.
+
+    """
+    import tempfile
+    try:
+        mode = os.stat(path).st_mode & 0o7777
+    except OSError:
+        umask = os.umask(0)
+        os.umask(umask)
+        mode = 0o666 & ~umask
+    (fd, tmppath) = tempfile.mkstemp(dir=os.path.dirname(path),
+                                     prefix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(data)
+        os.chmod(tmppath, mode)
+        os.rename(tmppath, path)
+    except:
+        os.unlink(tmppath)
+        raise
+
+
+def compile_cached(path):
+    """
+    Compile Python file at `path` using on-disk cache of code objects.
+
+    Code objects are stored by `marshal` like ``.pyc`` files, with a
+    header made of the magic number of the interpreter, the
+    modification time and the size of the file.
+
+    """
+    import imp
+    import struct
+    import marshal
+    import hashlib
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    header = imp.get_magic() + struct.pack('<dq', stat.st_mtime,
+                                           stat.st_size)
+    try:
+        cachepath = os.path.join(cache_dir('pycode'),
+                                 hashlib.sha1(path).hexdigest() + '.pyc')
+    except OSError:
+        cachepath = None
+    else:
+        try:
+            with open(cachepath, 'rb') as file:
+                if file.read(len(header)) == header:
+                    return marshal.load(file)
+        except (IOError, EOFError, ValueError, TypeError):
+            pass
+
+    with open(path) as file:
+        code = compile(file.read(), path, 'exec')
+    if cachepath:
+        try:
+            write_atomic(cachepath, header + marshal.dumps(code))
+        except (IOError, OSError):
+            pass  # cache is not writable; just don't cache
+    return code
+
+
+_sweep_index_magic = 'TRAITSCLI-NDJSON-INDEX-1\n'
+_sweep_index_header = '<dqQ'  # mtime, size and number of records
+
+
+def sweep_index(path):
+    """
+    Return ``(index_path, num_records)`` of NDJSON file at `path`.
+
+    The index is a header (see ``_sweep_index_header``) followed by
+    little-endian 64-bit offsets of the start of each record and the
+    end of the file.  It is stored beside `path` (``path + '.idx'``)
+    or in :func:`cache_dir` when the directory is not writable, and
+    rebuilt when the modification time or the size of `path` changes.
+    Blank lines are not records.
+
+    The index file is locked (:func:`fcntl.flock`) exclusively while
+    it is built and shared while it is read, so that when many
+    processes (e.g., tasks of a job array) start at once, only one of
+    them scans `path` and the others wait and read the index it wrote.
+
+    """
+    import fcntl
+    import struct
+    import hashlib
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    header = _sweep_index_magic + struct.pack(
+        _sweep_index_header, stat.st_mtime, stat.st_size, 0)[:-8]
+    cachepath = os.path.join(_cache_path('sweep'),
+                             hashlib.sha1(path).hexdigest() + '.idx')
+    candidates = [path + '.idx', cachepath]
+    for idxpath in candidates:
+        try:
+            file = open(idxpath, 'rb')
+        except IOError:
+            continue
+        with file:
+            fcntl.flock(file, fcntl.LOCK_SH)
+            num = _read_sweep_index(file, header)
+        if num is not None:
+            return (idxpath, num)
+
+    data = None
+    for idxpath in candidates:
+        try:
+            if idxpath == cachepath:
+                cache_dir('sweep')
+            file = os.fdopen(os.open(idxpath, os.O_RDWR | os.O_CREAT,
+                                     0o666), 'r+b')
+        except (IOError, OSError):
+            continue
+        with file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            num = _read_sweep_index(file, header)
+            if num is not None:
+                return (idxpath, num)
+            if data is None:
+                data = _build_sweep_index(path, header)
+            try:
+                # Write the header last, so that a partially written
+                # index (e.g., disk full) is never regarded as valid.
+                file.truncate(0)
+                file.seek(len(header))
+                file.write(data[len(header):])
+                file.flush()
+                file.seek(0)
+                file.write(header)
+                file.flush()
+            except IOError:
+                continue
+        return (idxpath, (len(data) - len(header)) // 8 - 2)
+    raise TraitsCLIAttributeError(
+        'Cannot write index of sweep file {0}'.format(path))
+
+
+def _read_sweep_index(file, header):
+    """Return number of records in index `file` or None if invalid."""
+    import struct
+    file.seek(0)
+    head = file.read(len(header) + 8)
+    if head[:len(header)] == header and len(head) == len(header) + 8:
+        return struct.unpack('<Q', head[len(header):])[0]
+
+
+def _build_sweep_index(path, header):
+    import struct
+    offsets = []
+    pos = 0
+    with open(path, 'rb') as file:
+        for line in file:
+            if not line.isspace():
+                offsets.append(pos)
+            pos += len(line)
+    offsets.append(pos)
+    return (header + struct.pack('<Q', len(offsets) - 1) +
+            struct.pack('<{0}Q'.format(len(offsets)), *offsets))
+
+
+def sweep_record(path, index):
+    """
+    Decode only the `index`-th (0-based) record of NDJSON file at `path`.
+
+    Each non-blank line of the file is a JSON object (a parameter
+    set).  An offset index is built once (see :func:`sweep_index`)
+    and the file is memory-mapped, so that only the selected record
+    is read and decoded.
+
+    >>> from tempfile import NamedTemporaryFile
+    >>> with NamedTemporaryFile(suffix='.ndjson') as f:
+    ...     f.write('{"a": 1}\\n\\n{"a": 2, "b": {"c": 3}}\\n')
+    ...     f.flush()
+    ...     sweep_record(f.name, 1) == {'a': 2, 'b': {'c': 3}}
+    ...     os.remove(f.name + '.idx')
+    True
+
+    """
+    import mmap
+    import struct
+    from cStringIO import StringIO
+    (idxpath, num) = sweep_index(path)
+    if not 0 <= index < num:
+        raise TraitsCLIAttributeError(
+            'Task index {0} is out of range: {1} has {2} records'
+            .format(index, path, num))
+    with open(idxpath, 'rb') as file:
+        file.seek(len(_sweep_index_magic) +
+                  struct.calcsize(_sweep_index_header) + 8 * index)
+        (start, end) = struct.unpack('<2Q', file.read(16))
+    with open(path, 'rb') as file:
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            record = data[start:end]
+        finally:
+            data.close()
+    try:
+        param = paramfile_backend('json').load(StringIO(record))
+    except ValueError as e:
+        raise TraitsCLIAttributeError(
+            'Invalid record {0} in sweep file {1}: {2}'
+            .format(index, path, e))
+    if not isinstance(param, dict):
+        raise TraitsCLIAttributeError(
+            'Record {0} in sweep file {1} is not an object'
+            .format(index, path))
+    return param
+
+
+_ISOLATED_PY_LOADER = r"""
+import os, sys, types, cPickle
+out = os.fdopen(os.dup(1), 'wb')
+os.dup2(2, 1)  # `print` in the parameter file goes to stderr
+param = {}
+execfile(sys.argv[1], param)
+param = dict((k, v) for (k, v) in param.iteritems()
+             if k != '__builtins__' and not isinstance(v, types.ModuleType))
+try:
+    data = cPickle.dumps(param, 2)
+except Exception:
+    dropped = []
+    for (k, v) in param.items():
+        try:
+            cPickle.dumps(v, 2)
+        except Exception:
+            dropped.append(k)
+            del param[k]
+    sys.stderr.write('Values not picklable are ignored: {0}\n'.format(
+        ', '.join(sorted(dropped))))
+    data = cPickle.dumps(param, 2)
+out.write(data)
+"""
+
+
+def exec_paramfile_isolated(path, timeout=None, memory_limit=None):
+    """
+    Execute Python parameter file at `path` in a subprocess.
+
+    Return the namespace (without modules and values which cannot be
+    pickled) after the execution.  The subprocess is killed after
+    `timeout` seconds, and its address space is limited to
+    `memory_limit` bytes.
+
+    >>> from tempfile import NamedTemporaryFile
+    >>> with NamedTemporaryFile(suffix='.py') as f:
+    ...     f.write('import os\\na = 1\\n')
+    ...     f.flush()
+    ...     exec_paramfile_isolated(f.name)
+    {'a': 1}
+
+    """
+    import sys
+    import threading
+    import subprocess
+    import cPickle as pickle
+
+    def limit_memory():
+        import resource
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+    proc = subprocess.Popen(
+        [sys.executable, '-c', _ISOLATED_PY_LOADER, path],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        preexec_fn=limit_memory if memory_limit else None)
+    killed = []
+
+    def kill():
+        killed.append(True)
+        proc.kill()
+
+    timer = threading.Timer(timeout, kill) if timeout else None
+    if timer:
+        timer.start()
+    try:
+        (out, err) = proc.communicate()
+    finally:
+        if timer:
+            timer.cancel()
+    if killed:
+        raise TraitsCLIAttributeError(
+            "Timeout ({0} sec) while loading file {1}".format(timeout, path))
+    if proc.returncode != 0:
+        raise TraitsCLIAttributeError(
+            "Error while loading file {0}:\n{1}".format(path, err))
+    if err:
+        sys.stderr.write(err)
+    return pickle.loads(out)
+
+
+class ParamFileFormat(object):
+
+    """
+    Parameter file format registered by :func:`register_paramfile_format`.
+    """
+
+    def __init__(self, name, extensions, sniff, priority):
+        self.name = name
+        self.extensions = extensions
+        self.sniff = sniff
+        self.priority = priority
+
+
+class ParamFileBackend(object):
+
+    """
+    Decoder registered by :func:`register_paramfile_backend`.
+
+    :attr:`load` is a function which takes a file object and returns
+    decoded data.
+
+    """
+
+    def __init__(self, format, name, factory, priority):
+        self.format = format
+        self.name = name
+        self.factory = factory
+        self.priority = priority
+        self._load = None
+
+    @property
+    def load(self):
+        if self._load is None:
+            self._load = self.factory()
+        return self._load
+
+    def available(self):
+        """Return True if the modules required by this backend exist."""
+        try:
+            self.load
+        except ImportError:
+            return False
+        return True
+
+
+_paramfile_formats = {}
+_paramfile_backends = {}
+_paramfile_backend_cache = {}
+_sniff_size = 4096
+
+
+def register_paramfile_format(name, extensions=(), sniff=None, priority=0):
+    """
+    Register parameter file format called `name`.
+
+    Loader of the format must be defined as ``loader_{name}`` method
+    of :class:`TraitsCLIBase` (or its subclass).
+
+    extensions : list of str
+       File extensions (without dot) of this format.
+
+    sniff : callable
+       Called with the first few kilobytes (str) of a file
+       with unknown extension.  It should return True if the data
+       looks like this format.
+
+    priority : int
+       Sniffers of formats with higher priority are tried first.
+
+    """
+    _paramfile_formats[name] = ParamFileFormat(
+        name, tuple(extensions), sniff, priority)
+
+
+def register_paramfile_backend(format, name, priority=0):
+    """
+    Decorator to register a decoder factory for `format`.
+
+    The decorated function is called without argument when the
+    backend is used first time.  It must return a function which
+    takes a file object and returns decoded data, or raise
+    `ImportError` if the required module is not installed.
+    The available backend with the highest `priority` is used.
+
+    """
+    def decorator(factory):
+        _paramfile_backends.setdefault(format, []).append(
+            ParamFileBackend(format, name, factory, priority))
+        _paramfile_backends[format].sort(key=lambda b: -b.priority)
+        _paramfile_backend_cache.pop(format, None)
+        return factory
+    return decorator
+
+
+def paramfile_backends(format):
+    """
+    Return a list of backends of `format` in order of priority.
+    """
+    return list(_paramfile_backends.get(format, []))
+
+
+def paramfile_backend(format):
+    """
+    Return the available backend of `format` with the highest priority.
+
+    >>> paramfile_backend('json').name in ('ujson', 'json')
+    True
+
+    """
+    try:
+        return _paramfile_backend_cache[format]
+    except KeyError:
+        pass
+    for backend in _paramfile_backends.get(format, []):
+        if backend.available():
+            _paramfile_backend_cache[format] = backend
+            return backend
+    # Raise the ImportError of the lowest priority backend:
+    _paramfile_backends[format][-1].load
+
+
+def sniff_paramfile_format(head):
+    """
+    Guess format of a parameter file from its first bytes `head`.
+
+    Return the name of the format or None.
+
+    >>> sniff_paramfile_format('  {"a": 1}')
+    'json'
+    >>> sniff_paramfile_format('# comment\\n[root]\\na = 1\\n')
+    'conf'
+    >>> sniff_paramfile_format('a:\\n  b: 1\\n')
+    'yaml'
+    >>> sniff_paramfile_format('a = dict(b=1)\\n')
+    'py'
+    >>> sniff_paramfile_format('\\x81\\xa1a\\x01')
+    'msgpack'
+
+    """
+    formats = sorted(_paramfile_formats.itervalues(),
+                     key=lambda f: -f.priority)
+    for fmt in formats:
+        if fmt.sniff and fmt.sniff(head):
+            return fmt.name
+
+
+def _first_significant_line(head, comments='#'):
+    for line in head.splitlines():
+        if line.strip() and line.lstrip()[0] not in comments:
+            return line
+
+
+def _sniff_line(regexp, comments='#'):
+    regexp = LazyRegexp(regexp)
+
+    def sniff(head):
+        line = _first_significant_line(head, comments)
+        return bool(line and regexp.match(line))
+    return sniff
+
+
+register_paramfile_format(
+    'msgpack', ['msgpack', 'mpk'], priority=40,
+    sniff=lambda head: head[:1] and (0x80 <= ord(head[0]) <= 0x8f or
+                                     head[0] in '\xde\xdf'))
+register_paramfile_format(
+    'json', ['json'], priority=30,
+    sniff=lambda head: head.lstrip()[:1] == '{')
+register_paramfile_format(
+    'conf', ['conf', 'ini', 'cfg'], priority=20,
+    sniff=_sniff_line(r'\[[^\]]+\]\s*$', '#;'))
+register_paramfile_format(
+    'yaml', ['yaml', 'yml'], priority=10,
+    sniff=_sniff_line(r'(---|[\w.-]+\s*:(\s|$))'))
+register_paramfile_format(
+    'py', ['py'], priority=0,
+    sniff=_sniff_line(r'(import\s|from\s|[A-Za-z_]\w*\s*=)'))
+
+
+@register_paramfile_backend('json', 'ujson', priority=20)
+def _json_backend_ujson():
+    import ujson
+    return lambda file: ujson.loads(file.read())
+
+
+@register_paramfile_backend('json', 'json')
+def _json_backend_json():
+    import json
+    return json.load
+
+
+@register_paramfile_backend('yaml', 'libyaml', priority=10)
+def _yaml_backend_libyaml():
+    import yaml
+    from yaml import CSafeLoader
+    return lambda file: yaml.load(file, Loader=CSafeLoader)
+
+
+@register_paramfile_backend('yaml', 'pyyaml')
+def _yaml_backend_pyyaml():
+    import yaml
+    return yaml.safe_load
+
+
+@register_paramfile_backend('msgpack', 'msgpack')
+def _msgpack_backend_msgpack():
+    import msgpack
+    return lambda file: msgpack.unpack(file, raw=False)
+
+
+@register_paramfile_backend('msgpack', 'msgpack.fallback', priority=-10)
+def _msgpack_backend_fallback():
+    from msgpack import fallback
+    return lambda file: fallback.unpackb(file.read(), raw=False)
+
+
+class ParamFileCompression(object):
+
+    """
+    Compression registered by :func:`register_paramfile_compression`.
+    """
+
+    def __init__(self, extension, magic, factory):
+        self.extension = extension
+        self.magic = magic
+        self.factory = factory
+        self._open = None
+
+    def open(self, path, mode='rb'):
+        """Open compressed file at `path` as a stream."""
+        if self._open is None:
+            self._open = self.factory()
+        return self._open(path, mode)
+
+    def available(self):
+        """Return True if the modules required for this compression exist."""
+        try:
+            if self._open is None:
+                self._open = self.factory()
+        except ImportError:
+            return False
+        return True
+
+
+_paramfile_compressions = {}
+
+
+def register_paramfile_compression(extension, magic):
+    """
+    Decorator to register a compression of parameter files.
+
+    extension : str
+       File extension (without dot), e.g., ``'gz'``.
+
+    magic : str
+       Bytes at the beginning of compressed files.  It is used to
+       detect compressed files without known extension.
+
+    The decorated function is called without argument when the
+    compression is used first time.  It must return a function
+    ``open(path, mode)`` which returns a file-like object reading
+    (``mode='rb'``) or writing (``mode='wb'``) decompressed stream,
+    or raise `ImportError` if the required module is not installed.
+
+    """
+    def decorator(factory):
+        _paramfile_compressions[extension] = ParamFileCompression(
+            extension, magic, factory)
+        return factory
+    return decorator
+
+
+def sniff_paramfile_compression(head):
+    """
+    Return `open` function of the compression detected from `head`.
+
+    >>> sniff_paramfile_compression('\\x1f\\x8b\\x08') is not None
+    True
+    >>> sniff_paramfile_compression('{}') is None
+    True
+
+    """
+    for comp in _paramfile_compressions.itervalues():
+        if head.startswith(comp.magic):
+            return comp.open
+
+
+@register_paramfile_compression('gz', '\x1f\x8b')
+def _gzip_open():
+    import gzip
+    return gzip.open
+
+
+@register_paramfile_compression('bz2', 'BZh')
+def _bz2_open():
+    import bz2
+    return lambda path, mode: bz2.BZ2File(path, mode[:1])
+
+
+@register_paramfile_compression('xz', '\xfd7zXZ\x00')
+def _xz_open():
+    try:
+        import lzma
+    except ImportError:
+        from backports import lzma
+    return lzma.open
+
+
+@register_paramfile_compression('zst', '\x28\xb5\x2f\xfd')
+def _zstd_open():
+    import io
+    import zstandard
+
+    def open_zstd(path, mode='rb'):
+        file = io.open(path, 'wb' if 'w' in mode else 'rb')
+        if 'w' in mode:
+            return zstandard.ZstdCompressor().stream_writer(file)
+        return io.BufferedReader(
+            zstandard.ZstdDecompressor().stream_reader(file))
+    return open_zstd
+
+
+@contextmanager
+def hidestderr():
+    try:
+        import sys
+        orig = sys.stderr
+        sys.stderr = open(os.devnull, 'w')
+        yield
+        sys.stderr.close()
+    finally:
+        sys.stderr = orig
+
+
+class FastArgumentParser(argparse.ArgumentParser):
+
+    """
+    `argparse.ArgumentParser` for classes with a large number of options.
+
+    argparse spends time proportional to the number of options when
+    adding each option and when parsing arguments.  This parser looks
+    up option strings in a dict and sets all defaults at once.  To use
+    it, set :attr:`TraitsCLIBase.ArgumentParser`:
+
+    >>> class SampleCLI(TraitsCLIBase):
+    ...     ArgumentParser = FastArgumentParser
+    ...     int = Int(config=True)
+    ...     yes = Bool(config=True)
+    ...
+    >>> obj = SampleCLI.cli(['--int', '1', '--yes'])
+    >>> (obj.int, obj.yes)
+    (1, True)
+
+    Options must be given by their full names; abbreviations (e.g.,
+    ``--in`` for ``--int``) are not accepted.  Options and positional
+    arguments with a single value, `store_const` (including
+    `store_true` and `store_false`), help and sub-command actions are
+    handled by this parser.  Parsers using other features (other
+    `nargs`, `append` or `count` actions, combined short options,
+    mutually exclusive groups, etc.) are parsed by argparse as usual.
+    Help, usage and error messages are the ones of argparse.
+
+    """
+
+    _fast_plan_cache = None
+    _adding_argument = False
+    _check_formatter = None
+
+    def add_argument(self, *args, **kwds):
+        self._adding_argument = True
+        try:
+            return super(FastArgumentParser, self).add_argument(*args, **kwds)
+        finally:
+            self._adding_argument = False
+
+    def _get_formatter(self):
+        # `add_argument` makes a formatter just to check metavar.
+        # Formatter is stateless for this purpose, so reuse it.
+        if self._adding_argument:
+            if self._check_formatter is None:
+                self._check_formatter = \
+                    super(FastArgumentParser, self)._get_formatter()
+            return self._check_formatter
+        return super(FastArgumentParser, self)._get_formatter()
+
+    def _fast_plan(self):
+        """
+        Return ``(options, positionals, defaults, checked)`` or `None`.
+
+        `None` means that this parser uses some features not supported
+        by the fast path.  The plan is rebuilt when actions are added.
+
+        """
+        cache = self._fast_plan_cache
+        if cache is not None and cache[0] == len(self._actions):
+            return cache[1]
+        self._fast_plan_cache = (len(self._actions), self._make_fast_plan())
+        return self._fast_plan_cache[1]
+
+    def _make_fast_plan(self):
+        if (self.prefix_chars != '-' or
+                self.fromfile_prefix_chars is not None or
+                self._mutually_exclusive_groups or
+                self._has_negative_number_optionals):
+            return None
+        options = {}
+        positionals = []
+        defaults = {}
+        for action in self._actions:
+            if action.dest is not argparse.SUPPRESS and \
+               action.default is not argparse.SUPPRESS:
+                defaults.setdefault(action.dest, action.default)
+            if isinstance(action, argparse._SubParsersAction):
+                if action.option_strings:
+                    return None
+            elif isinstance(action, (argparse._StoreConstAction,
+                                     argparse._HelpAction)):
+                pass
+            elif not (type(action) is argparse._StoreAction and
+                      action.nargs is None):
+                return None
+            if positionals and isinstance(positionals[-1],
+                                          argparse._SubParsersAction):
+                return None  # sub-command must be the last positional
+            for option_string in action.option_strings:
+                if not option_string.startswith('--') and \
+                   len(option_string) != 2:
+                    return None
+                options[option_string] = action
+            if not action.option_strings:
+                positionals.append(action)
+        for (dest, value) in self._defaults.iteritems():
+            defaults.setdefault(dest, value)
+        # Actions to be checked when they are not given:
+        checked = [a for a in self._actions
+                   if a.required or isinstance(a.default, basestring)]
+        return (options, positionals, defaults, checked)
+
+    def parse_known_args(self, args=None, namespace=None):
+        plan = self._fast_plan()
+        if plan is None or namespace is not None:
+            return super(FastArgumentParser, self).parse_known_args(
+                args, namespace)
+        if args is None:
+            import sys
+            args = sys.argv[1:]
+        namespace = argparse.Namespace()
+        namespace.__dict__.update(plan[2])
+        try:
+            (namespace, args) = self._parse_known_args(list(args), namespace)
+            unrecognized = argparse._UNRECOGNIZED_ARGS_ATTR
+            if hasattr(namespace, unrecognized):
+                args.extend(getattr(namespace, unrecognized))
+                delattr(namespace, unrecognized)
+            return (namespace, args)
+        except argparse.ArgumentError as err:
+            self.error(str(err))
+
+    def _looks_like_option(self, arg, options):
+        # Same rule as `argparse.ArgumentParser._parse_optional`,
+        # except for abbreviations.
+        if not arg or arg[0] != '-' or len(arg) == 1:
+            return False
+        if arg in options or arg.split('=', 1)[0] in options:
+            return True
+        if self._negative_number_matcher.match(arg) or ' ' in arg:
+            return False
+        return True
+
+    def _parse_known_args(self, arg_strings, namespace):
+        plan = self._fast_plan()
+        if plan is None:
+            return super(FastArgumentParser, self)._parse_known_args(
+                arg_strings, namespace)
+        (options, positionals, _, checked) = plan
+        positionals = list(positionals)
+        extras = []
+        actions = []       # [(action, argument strings, option string)]
+        num = len(arg_strings)
+        i = 0
+        while i < num:
+            arg = arg_strings[i]
+            i += 1
+            if arg == '--':
+                rest = arg_strings[i:]
+                if positionals and isinstance(positionals[0],
+                                              argparse._SubParsersAction):
+                    actions.append((positionals.pop(0), rest, None))
+                else:
+                    while rest and positionals:
+                        actions.append((positionals.pop(0), [rest.pop(0)],
+                                        None))
+                    extras.extend(rest)
+                break
+            if not self._looks_like_option(arg, options):
+                if not positionals:
+                    extras.append(arg)
+                elif isinstance(positionals[0], argparse._SubParsersAction):
+                    actions.append((positionals.pop(0),
+                                    arg_strings[i - 1:], None))
+                    break
+                else:
+                    actions.append((positionals.pop(0), [arg], None))
+                continue
+            explicit = None
+            action = options.get(arg)
+            if action is None:
+                if arg.startswith('--') and '=' in arg:
+                    (option_string, explicit) = arg.split('=', 1)
+                    action = options.get(option_string)
+                elif arg[:2] in options:
+                    # Combined short options such as ``-xyz``:
+                    return super(FastArgumentParser, self)._parse_known_args(
+                        arg_strings, namespace)
+                if action is None:
+                    extras.append(arg)
+                    continue
+            else:
+                option_string = arg
+            if action.nargs == 0:
+                if explicit is not None:
+                    raise argparse.ArgumentError(
+                        action, 'ignored explicit argument {0!r}'.format(
+                            explicit))
+                actions.append((action, [], option_string))
+            elif explicit is not None:
+                actions.append((action, [explicit], option_string))
+            elif i < num and arg_strings[i] != '--' and \
+                    not self._looks_like_option(arg_strings[i], options):
+                actions.append((action, [arg_strings[i]], option_string))
+                i += 1
+            else:
+                raise argparse.ArgumentError(action, 'expected one argument')
+
+        seen = set()
+        for (action, strings, option_string) in actions:
+            seen.add(action)
+            values = self._get_values(action, strings)
+            if values is not argparse.SUPPRESS:
+                action(self, namespace, values, option_string)
+
+        if positionals:
+            self.error('too few arguments')
+        for action in checked:
+            if action not in seen:
+                if action.required:
+                    self.error('argument {0} is required'.format(
+                        argparse._get_action_name(action)))
+                elif (isinstance(action.default, basestring) and
+                      getattr(namespace, action.dest, None)
+                      is action.default):
+                    setattr(namespace, action.dest,
+                            self._get_value(action, action.default))
+        return (namespace, extras)
+
+
+def add_parser(cls, parser, prefix=''):
+    """
+    Call `parser.add_argument` based on class traits of `cls`.
+
+    This classmethod is called from :meth:`get_argparser`.
+
+    """
+    traits = cls.class_traits(config=True)
+    for k in sorted(traits):
+        v = traits[k]
+
+        klass = sub_config_class(v.trait_type)
+        if klass is not None:
+            if issubclass(klass, TraitsCLIBase):
+                adder = klass.add_parser
+            else:
+                adder = lambda *args: add_parser(klass, *args)
+            adder(parser, prefix + k + '.')
+            # set_defaults is called here and it's redundant...
+            # but as there is no harm, let it be like this for now.
+            continue
+
+        dest = name = '{0}{1}'.format(prefix, k)
+        argkwds = dict(help=LazyHelp(v))
+        if not v.cli_positional:
+            name = '--{0}'.format(dest)
+        for arg_key in ['required', 'metavar']:
+            attr_val = getattr(v, 'cli_{0}'.format(arg_key))
+            if attr_val is not None:
+                argkwds[arg_key] = attr_val
+        stype = trait_simple_type(v.trait_type)
+        if stype:
+            argkwds['type'] = stype
+        elif isinstance(v.trait_type, (Bool, CBool)) and \
+             not v.cli_positional:
+            argkwds.update(
+                action='store_const',
+                const=not v.trait_type.default_value,
+            )
+        elif isinstance(v.trait_type, Enum):
+            values = v.trait_type.values
+            argkwds['type'] = choices = EnumChoices(values)
+            if len(values) > _large_enum_threshold:
+                argkwds.setdefault('metavar', choices.metavar())
+            else:
+                argkwds.setdefault('metavar', choices.metavar(len(values)))
+        else:
+            argkwds['type'] = eval_for_parser
+        parser.add_argument(name, default=_UNSPECIFIED, **argkwds)
+    if issubclass(cls, TraitsCLIBase):
+        if not prefix:
+            for (name, kwds) in builtin_arguments(cls):
+                add_builtin_argument(parser, name, **kwds)
+        parser.set_defaults(__func=cls.run_options)
+    return parser
+
+
+_large_enum_threshold = 100
+
+
+class EnumChoices(object):
+
+    """
+    Argument type for `Enum` traits.
+
+    `add_parser` uses this instead of argparse's `choices`, which
+    checks values by linear search and compares the given string with
+    non-string values (so ``'10'`` never matches ``10``).  This class
+    looks up a value by a hash table.  When an `Enum` has more than 100
+    values, only a few of them are shown in usage (:meth:`metavar`) and
+    similar values are suggested when an invalid value is given.
+
+    >>> choices = EnumChoices(['ds{0:04}'.format(i) for i in range(5000)])
+    >>> choices('ds0042')
+    'ds0042'
+    >>> choices.metavar()
+    '{ds0000,ds0001,ds0002,...}'
+    >>> print ' '.join(choices.complete('ds499'))
+    ds4990 ds4991 ds4992 ds4993 ds4994 ds4995 ds4996 ds4997 ds4998 ds4999
+    >>> choices('dz0042')                              # doctest: +ELLIPSIS
+    Traceback (most recent call last):
+      ...
+    ArgumentTypeError: invalid choice: 'dz0042' (did you mean 'ds0042', ...?)
+
+    Values are matched by their string representation and the
+    original (e.g., integer) value is returned.
+
+    >>> EnumChoices(range(1000))('10')
+    10
+    >>> EnumChoices(range(3))('1')
+    1
+    >>> EnumChoices(range(3))('3')
+    Traceback (most recent call last):
+      ...
+    ArgumentTypeError: invalid choice: '3' (choose from 0, 1, 2)
+
+    """
+
+    def __init__(self, values):
+        self.values = values
+        self._index = None
+        self._sorted = None
+
+    @property
+    def index(self):
+        """Mapping from string representation to value."""
+        if self._index is None:
+            self._index = dict((str(v), v) for v in self.values)
+        return self._index
+
+    def __call__(self, string):
+        try:
+            return self.index[string]
+        except KeyError:
+            raise argparse.ArgumentTypeError(self.error_message(string))
+
+    def __contains__(self, string):
+        return string in self.index
+
+    def metavar(self, num=3):
+        """Return usage text showing only the first `num` values."""
+        shown = map(str, self.values[:num])
+        if len(self.values) > num:
+            shown.append('...')
+        return '{{{0}}}'.format(','.join(shown))
+
+    def complete(self, prefix):
+        """Return sorted list of values (as str) starting with `prefix`."""
+        import bisect
+        if self._sorted is None:
+            self._sorted = sorted(self.index)
+        keys = self._sorted
+        start = bisect.bisect_left(keys, prefix)
+        stop = bisect.bisect_left(keys, prefix + '\xff', start)
+        return [k for k in keys[start:stop] if k.startswith(prefix)]
+
+    def suggest(self, string, num=3, candidates=100):
+        """
+        Return up to `num` values similar to `string`.
+
+        As `difflib` is slow for many values, `candidates` values
+        sharing most trigrams with `string` are chosen first.
+
+        """
+        import difflib
+        import heapq
+        keys = self.index
+        if len(keys) > candidates:
+            query = _trigrams(string)
+            keys = heapq.nlargest(candidates, keys,
+                                  key=lambda k: len(query & _trigrams(k)))
+        return difflib.get_close_matches(string, keys, n=num)
+
+    def error_message(self, string):
+        message = 'invalid choice: {0!r}'.format(string)
+        if len(self.values) <= _large_enum_threshold:
+            return message + ' (choose from {0})'.format(
+                ', '.join(map(repr, self.values)))
+        suggestions = self.suggest(string)
+        if suggestions:
+            message += ' (did you mean {0}?)'.format(
+                ', '.join(map(repr, suggestions)))
+        return message
+
+
+def _trigrams(string):
+    string = ' {0} '.format(string)
+    return set(string[i:i + 3] for i in range(len(string) - 2))
+
+
+class LazyHelp(object):
+
+    """
+    Help string of trait `ctrait`, made only when help is rendered.
+
+    It behaves like the help string ``'{desc} (default: {default})'``
+    for `argparse` (which formats it by the ``%`` operator) but it is
+    not formatted when the parser is just built to parse arguments.
+    Representation of the default value is truncated by
+    :func:`short_repr`.
+
+    >>> class SampleCLI(TraitsCLIBase):
+    ...     a = List(range(1000), desc='numbers', config=True)
+    ...     b = Str('100%', config=True)
+    ...
+    >>> traits = SampleCLI.class_traits()
+    >>> print LazyHelp(traits['a']) % {}
+    numbers (default: [0, 1, 2, 3, 4, 5, ...])
+    >>> print LazyHelp(traits['b']) % {}
+     (default: 100%)
+
+    """
+
+    __slots__ = ('ctrait', '_template')
+
+    def __init__(self, ctrait):
+        self.ctrait = ctrait
+        self._template = None
+
+    def __str__(self):
+        if self._template is None:
+            default = short_repr(self.ctrait.default).replace('%', '%%')
+            self._template = '{0} (default: {1})'.format(
+                self.ctrait.desc or '', default)
+        return self._template
+
+    def __mod__(self, params):
+        return str(self) % params
+
+    def __add__(self, other):
+        return str(self) + other
+
+    def __contains__(self, substring):
+        return substring in str(self)
+
+    def __nonzero__(self):
+        return True
+
+
+def short_repr(value, maxlen=80):
+    """
+    Return `str` of `value` but truncated to about `maxlen` characters.
+
+    Large containers are not converted to string as a whole.
+
+    >>> short_repr(1)
+    '1'
+    >>> short_repr(range(100))
+    '[0, 1, 2, 3, 4, 5, ...]'
+    >>> short_repr({'a': range(100)})
+    "{'a': [0, 1, 2, 3, 4, 5, ...]}"
+    >>> len(short_repr('x' * 1000))
+    80
+
+    """
+    if isinstance(value, (list, tuple, dict, set, frozenset)):
+        text = _short_repr_class()(maxlen).repr(value)
+    else:
+        text = str(value)
+    if len(text) > maxlen:
+        text = text[:maxlen - 3] + '...'
+    return text
+
+
+_ShortRepr = None
+
+
+def _short_repr_class():
+    global _ShortRepr
+    if _ShortRepr is not None:
+        return _ShortRepr
+    from repr import Repr
+    from itertools import islice
+
+    class ShortRepr(Repr):
+
+        def __init__(self, maxlen):
+            Repr.__init__(self)
+            self.maxstring = self.maxother = maxlen
+
+        def repr_dict(self, x, level):
+            # Same as `Repr.repr_dict` but do not sort all the keys.
+            if not x:
+                return '{}'
+            if level <= 0:
+                return '{...}'
+            pieces = ['{0}: {1}'.format(self.repr1(k, level - 1),
+                                        self.repr1(v, level - 1))
+                      for (k, v) in islice(x.iteritems(), self.maxdict)]
+            if len(x) > self.maxdict:
+                pieces.append('...')
+            return '{{{0}}}'.format(', '.join(pieces))
+
+    _ShortRepr = ShortRepr
+    return ShortRepr
+
+
+def _paramfile_paths(value):
+    """
+    List of paths in the value of a parameter file attribute.
+
+    >>> _paramfile_paths('a.json'), _paramfile_paths(['a', 'b'])
+    (['a.json'], ['a', 'b'])
+    >>> _paramfile_paths(None)
+    []
+
+    """
+    if not value:
+        return []
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [value]
+
+
+def builtin_arguments(cls):
+    """
+    Return builtin options of `cls` as a list of ``(name, kwds)``.
+
+    Each of them is added by ``add_builtin_argument(parser, name,
+    **kwds)``.  Options taking a file have ``metavar='PATH'``.  This
+    list is also used for shell completion (:mod:`traitscli_completion`).
+
+    >>> [name for (name, _) in builtin_arguments(TraitsCLIBase)]
+    ['--show-config-origins', '--check']
+
+    """
+    flag = dict(action='store_const', const=True)
+    arguments = [
+        ('--show-config-origins', dict(
+            flag, dest='__show_config_origins',
+            help='print where each attribute is configured and exit')),
+    ]
+    if cls.cli_sweep:
+        arguments += [
+            ('--sweep-file', dict(
+                dest='__sweep_file', metavar='PATH',
+                help='newline-delimited JSON file of parameter sets')),
+            ('--task-index', dict(
+                dest='__task_index', type=int, metavar='N',
+                help='use the N-th (0-based) parameter set of'
+                ' --sweep-file')),
+        ]
+    arguments.append(('--check', dict(
+        flag, dest='__check', help='validate the configuration and exit')))
+    return arguments
+
+
+def add_builtin_argument(parser, name, **kwds):
+    """
+    Add an option provided by traitscli itself to `parser`.
+
+    The option is shown in the "traitscli options" group of the help.
+    Options such as ``--show-config-origins`` are added by this
+    function so that they never shadow options defined by users: if
+    `name` is already taken, the option is added as ``--__{name}``
+    (e.g., ``--__show-config-origins``) instead.  Builtin options
+    cannot be abbreviated, so that ``--show`` is never taken as
+    ``--show-config-origins``.
+
+    >>> parser = argparse.ArgumentParser()
+    >>> _ = parser.add_argument('--check', type=int)
+    >>> add_builtin_argument(parser, '--check', dest='__check',
+    ...                      action='store_const', const=True)
+    '--__check'
+    >>> add_builtin_argument(parser, '--show-config-origins',
+    ...                      action='store_const', const=True)
+    '--show-config-origins'
+    >>> with hidestderr():
+    ...     parser.parse_args(['--show'])
+    Traceback (most recent call last):
+      ...
+    SystemExit: 2
+
+    Return the option string actually added.
+
+    """
+    kwds.setdefault('default', _UNSPECIFIED)
+    kwds.setdefault('help', argparse.SUPPRESS)
+    group = getattr(parser, '_traitscli_builtin_group', None)
+    if group is None:
+        group = parser._traitscli_builtin_group = parser.add_argument_group(
+            'traitscli options')
+    try:
+        group.add_argument(name, **kwds)
+    except argparse.ArgumentError:
+        name = '--__' + name.lstrip('-')
+        group.add_argument(name, **kwds)
+    _forbid_abbreviation(parser, name)
+    return name
+
+
+def _forbid_abbreviation(parser, option_string):
+    exact = getattr(parser, '_traitscli_exact_options', None)
+    if exact is None:
+        exact = parser._traitscli_exact_options = set()
+        get_option_tuples = parser._get_option_tuples
+
+        # Abbreviations are resolved by this (private) method only.
+        def _get_option_tuples(option_string):
+            return [t for t in get_option_tuples(option_string)
+                    if t[1] not in exact]
+
+        parser._get_option_tuples = _get_option_tuples
+    exact.add(option_string)
+
+
+def config_traits(cls, **metadata):
+    """
+    Return configurable traits as a (possibly nested) dict.
+
+    The returned dict can be nested if this class has `Instance`
+    trait of :class:`TraitsCLIBase`.  Use :func:`flattendict` to
+    get a flat dictionary with dotted keys.
+
+    It is equivalent to ``cls.class_traits(config=True)`` if
+    ``cls`` has no `Instance` trait.
+
+    >>> class SubObject(TraitsCLIBase):
+    ...     int = Int(config=True)
+    ...
+    >>> class SampleCLI(TraitsCLIBase):
+    ...     nonconfigurable = Int()
+    ...     int = Int(config=True)
+    ...     sub = Instance(SubObject, args=(), config=True)
+    ...
+    >>> traits = SampleCLI.config_traits()
+    >>> traits                                         # doctest: +SKIP
+    {'int': <traits.traits.CTrait at ...>,
+     'sub': {'int': <traits.traits.CTrait at ...>}}
+    >>> traits['int'].trait_type                   # doctest: +ELLIPSIS
+    <traits.trait_types.Int object at ...>
+    >>> traits['sub']['int'].trait_type            # doctest: +ELLIPSIS
+    <traits.trait_types.Int object at ...>
+
+    """
+    traits = {}
+    for (k, v) in cls.class_traits(config=True).iteritems():
+        klass = sub_config_class(v.trait_type)
+        if klass is not None:
+            if issubclass(klass, TraitsCLIBase):
+                traits[k] = klass.config_traits()
+            else:
+                traits[k] = config_traits(klass)
+        else:
+            traits[k] = v
+    return traits
+
+
+class TraitsCLIBase(HasTraits):
+
+    """
+    CLI generator base class.
+
+    Usage.  You will need to define:
+
+    1. Parameters (traits).  When it has ``config=True`` metadata, it is
+       configurable via command line argument.
+       See: `Defining Traits: Initialization and Validation`_
+       section in `Traits user manual`_.
+
+    2. :meth:`do_run` method.  This method gets no argument (except `self`).
+       Do whatever this class needs to do based on its attributes.
+       :meth:`cli` function sets attributes based on command line options
+       and then call :meth:`do_run` method.
+
+
+    **Examples**
+
+    To make class attribute configurable from command line options,
+    set metadata ``config=True``:
+
+    >>> class SampleCLI(TraitsCLIBase):
+    ...     int = Int(config=True)
+    ...
+    >>> obj = SampleCLI.cli(['--int', '1'])
+    >>> obj.int
+    1
+
+
+    For dict and list type attribute, you can modify it using
+    subscript access:
+
+    >>> class SampleCLI(TraitsCLIBase):
+    ...     dict = Dict(config=True)
+    ...
+    >>> obj = SampleCLI.cli(['--dict["k"]', '1'])
+    >>> obj.dict['k']
+    1
+
+
+    You don't need to quote string if dict/list attribute set
     its value trait to str-like trait:
 
     >>> class SampleCLI(TraitsCLIBase):
@@ -617,6 +2901,21 @@ class TraitsCLIBase(HasTraits):
     >>> obj.sub.int
     1
 
+    Sub-objects are created lazily: with ``args=()``, when it is
+    accessed first time and, without ``args``, only when some of its
+    attribute is configured (otherwise it stays `None`).  Options are
+    enumerated from the class, so tools with many optional sub-objects
+    do not pay for creating them.  The class can also be given as a
+    dotted string (e.g., ``Instance('mypkg.models.SubObject')``).
+
+    >>> class SampleCLI(TraitsCLIBase):
+    ...     sub = Instance(SubObject, config=True)
+    ...
+    >>> SampleCLI.cli([]).sub is None
+    True
+    >>> SampleCLI.cli(['--sub.int', '1']).sub.int
+    1
+
 
     **Metadata for traits**
 
@@ -650,12 +2949,13 @@ class TraitsCLIBase(HasTraits):
        ...     b = Float(desc='help string for attribute b', config=True)
        ...
        >>> SampleCLI.get_argparser().print_help()  # doctest: +ELLIPSIS
-       usage: ... [-h] [--a A] [--b B]
+       usage: ... [-h] [--a A] [--b B] ...
        <BLANKLINE>
        optional arguments:
-         -h, --help  show this help message and exit
-         --a A       help string for attribute a (default: 0)
-         --b B       help string for attribute b (default: 0.0)
+         -h, --help            show this help message and exit
+         --a A                 help string for attribute a (default: 0)
+         --b B                 help string for attribute b (default: 0.0)
+       ...
 
     cli_positional : bool
        If True, corresponding command line argument is interpreted
@@ -691,11 +2991,12 @@ class TraitsCLIBase(HasTraits):
        ...     int = Int(cli_metavar='NUM', config=True)
        ...
        >>> SampleCLI.get_argparser().print_help()  # doctest: +ELLIPSIS
-       usage: ... [-h] [--int NUM]
+       usage: ... [-h] [--int NUM] ...
        <BLANKLINE>
        optional arguments:
-         -h, --help  show this help message and exit
-         --int NUM   (default: 0)
+         -h, --help            show this help message and exit
+         --int NUM             (default: 0)
+       ...
 
     cli_paramfile : bool
        This attribute has special meaning.  When this metadata is
@@ -719,6 +3020,28 @@ class TraitsCLIBase(HasTraits):
        >>> obj.int
        1
 
+    cli_pipe : bool
+       When commands run as a pipeline (see :func:`multi_command_cli`),
+       this attribute is set to the latest instance made by the earlier
+       commands which is a valid value for it.  Its
+       :attr:`cli_result` is the value returned by its :meth:`do_run`.
+       See :meth:`connect_pipeline`.
+
+       >>> class Prepare(TraitsCLIBase):
+       ...     def do_run(self):
+       ...         return 'data'
+       ...
+       >>> class Train(TraitsCLIBase):
+       ...     prepared = Instance(Prepare, cli_pipe=True)
+       ...     def do_run(self):
+       ...         return self.prepared.cli_result + ' trained'
+       ...
+       >>> [_, train] = multi_command_cli(
+       ...     [('prepare', Prepare), ('train', Train)],
+       ...     ['prepare', '--', 'train'], pipeline=True)
+       >>> train.cli_result
+       'data trained'
+
 
     **Idioms**
 
@@ -762,6 +3085,30 @@ class TraitsCLIBase(HasTraits):
 
     """
 
+    cli_result = None
+    """
+    The value returned by :meth:`do_run` (set by :meth:`run`).
+    """
+
+    cli_memo = None
+    """
+    Store for memoizing results of :meth:`do_run` or `None` (default).
+
+    When it is set to a store object such as :class:`DirectoryMemoStore`
+    or :class:`SQLiteMemoStore`, :meth:`run` does not call
+    :meth:`do_run` if the result for the same configuration is stored.
+    See :meth:`memoized_do_run`.
+
+    """
+
+    cli_code_version = None
+    """
+    Version of the code in :meth:`do_run`, used as a part of memo key.
+
+    Change this value to invalidate results memoized by older code.
+
+    """
+
     def __init__(self, **kwds):
         super(TraitsCLIBase, self).__init__()
         self.setattrs(kwds)
@@ -774,9 +3121,13 @@ class TraitsCLIBase(HasTraits):
         In this case, nested attribute will be set to its attribute.
 
         The values of `attrs` can be a dict.  If the corresponding
-        attribute is an instance of :class:`TraitsCLIBase`, attributes
-        of this instance is set using this dictionary.  Otherwise,
-        it will issue an error.
+        attribute is an instance of :class:`TraitsCLIBase` (or
+        `HasTraits`), attributes of this instance is set using this
+        dictionary.  Otherwise, it will issue an error.
+
+        Sub-objects are not touched unless some attributes under them
+        are given.  Configurable sub-objects which are `None` are
+        created when needed (see :func:`getsubobject`).
 
         >>> obj = TraitsCLIBase()
         >>> obj.b = TraitsCLIBase()
@@ -817,11 +3168,19 @@ class TraitsCLIBase(HasTraits):
                 raise TraitsCLIAttributeError(
                     'Non-configurable key is given: {0}'.format(name))
 
-            current = getattr(self, name, None)
+            names = splitdottedname(name)
+            parent = getsubobject(self, names[:-1])
+            if isinstance(value, dict):
+                current = getsubobject(parent, names[-1:])
+            else:
+                current = None
             if isinstance(value, dict) and isinstance(current, TraitsCLIBase):
                 current.setattrs(value)
+            elif isinstance(value, dict) and isinstance(current, HasTraits):
+                self.setattrs(dict(('{0}.{1}'.format(name, k), v)
+                                   for (k, v) in value.iteritems()))
             else:
-                setdottedattr(self, name, value)
+                setattr(parent, names[-1], value)
 
     @classmethod
     def get_argparser(cls):
@@ -866,18 +3225,311 @@ class TraitsCLIBase(HasTraits):
     def run(cls, **kwds):
         """
         Make an instance with args `kwds` and call :meth:`do_run`.
+
+        Attributes are resolved from the following sources (later
+        ones override earlier ones): parameter files, environment
+        variables (see :attr:`cli_env_prefix`), a record of a sweep
+        file, `kwds` (normal command line options) and dict-like
+        options.  See :meth:`resolve_config`.
+
+        When :attr:`cli_sweep` is True, the command line options
+        ``--sweep-file PATH --task-index N`` (e.g., ``--task-index
+        $SLURM_ARRAY_TASK_ID`` in a job array) select the `N`-th
+        (0-based) parameter set of the newline-delimited JSON file at
+        `PATH`.  Only that record is read from the file (see
+        :func:`sweep_record`).
+
+        The value returned by :meth:`do_run` is stored in
+        :attr:`cli_result`.  See also :attr:`cli_memo`.
+
+        When the command line option ``--show-config-origins``
+        is given, where each configurable attribute comes from is
+        printed (see :meth:`print_config_origins`) instead of calling
+        :meth:`do_run`.
+
+        When the hidden command line option ``--check`` is given, the
+        configuration is only validated by :meth:`validate_config`;
+        no instance is made.  All invalid values are reported at once
+        (as an error) and an empty list is returned if there are none.
+
+        Return the instance made, except with ``--check``, where the
+        empty list returned by :meth:`check_options` is returned
+        instead.  Code using the result of :meth:`cli` should be
+        prepared for that if its users may pass ``--check``.
+
+        """
+        return cls.run_options(ParsedOptions.from_dict(kwds))
+
+    @classmethod
+    @takes_parsed_options
+    def run_options(cls, options):
         """
-        dopts = kwds.pop('__dict_like_options', [])
-        (kwds_paramfile, kwds_rest) = cls.__classify_kwds(kwds)
+        Do what :meth:`run` does, given a :class:`ParsedOptions`.
 
-        self = cls(**kwds_paramfile)
-        self.load_all_paramfiles()             # from file
-        self.setattrs(kwds_rest)               # normal command line options
-        self.__eval_dict_like_options(dopts)   # dict-like options
+        This is the function called by :func:`parse_and_run`.  It
+        returns what :meth:`run` returns.  With ``--check``, it prints
+        ``OK`` and exits with status 0 if the configuration is valid
+        (see :meth:`check_options`).
 
-        self.do_run()
+        """
+        builtins = options.builtins
+        if builtins.get('check'):
+            import sys
+            cls.check_options(options)
+            print 'OK'
+            sys.exit(0)
+        self = cls()
+        resolver = self.resolve_config(options.kwds,
+                                       options.dict_like_options,
+                                       builtins.get('sweep_file'),
+                                       builtins.get('task_index'),
+                                       builtins.get('config'))
+        self.setattrs(resolver.values)
+        self.cli_origins = resolver
+        self.connect_pipeline(options.previous)
+        if builtins.get('show_config_origins'):
+            self.print_config_origins()
+            return self
+
+        self.cli_result = self.memoized_do_run()
         return self
 
+    def connect_pipeline(self, previous):
+        """
+        Set attributes with ``cli_pipe=True`` metadata using `previous`.
+
+        Each of such attributes is set to the last object in
+        `previous` (instances made by the earlier commands of a
+        pipeline) which is a valid value for it.  Attributes for which
+        no valid object is found are not touched.
+
+        """
+        if not previous:
+            return
+        from traits.api import TraitError
+        for name in self.class_trait_names(cli_pipe=True):
+            for obj in reversed(previous):
+                try:
+                    setattr(self, name, obj)
+                except TraitError:
+                    continue
+                break
+
+    cli_origins = None
+    """
+    :class:`ConfigResolver` used by :meth:`run` (`None` otherwise).
+
+    Use :meth:`config_origin` to query it.
+
+    """
+
+    def resolve_config(self, kwds={}, dict_like_options=(),
+                       sweep_file=None, task_index=None, config=None):
+        """
+        Resolve configuration without setting attributes of this object.
+
+        All sources (see :meth:`run`) are merged into one flat mapping
+        and returned as a :class:`ConfigResolver`.  Each attribute
+        appears in the mapping only once, with its final value.
+
+        Only the parameter file attributes (``cli_paramfile=True``) are
+        set, and then :meth:`load_all_paramfiles` is called.  While it
+        runs, :meth:`load_paramfile` adds each file to the resolver
+        instead of setting attributes.  Overrides of these methods are
+        therefore used.
+
+        >>> class SampleCLI(TraitsCLIBase):
+        ...     int = Int(config=True)
+        ...     dict = Dict(config=True)
+        ...
+        >>> obj = SampleCLI()
+        >>> resolver = obj.resolve_config(
+        ...     {'int': 1}, [("dict['a']", '2')])
+        >>> sorted(resolver.values.items())
+        [('dict', {'a': 2}), ('int', 1)]
+        >>> obj.dict
+        {}
+
+        `sweep_file` and `task_index` must be given together.  See
+        :meth:`run`.
+
+        `config` is a (possibly nested) dict given by a program rather
+        than by the user, e.g., the parameters of a task of
+        :mod:`traitscli_queue`.  It overrides a sweep record and is
+        overridden by `kwds`.  Unlike `kwds`, it is an error if it has
+        a key which is not configurable.
+
+        >>> obj.resolve_config(config={'x': 1})
+        Traceback (most recent call last):
+          ...
+        TraitsCLIAttributeError: Non-configurable key is given: x
+
+        """
+        return self.__resolve_config(ConfigResolver(self), kwds,
+                                     dict_like_options, sweep_file,
+                                     task_index, config)
+
+    @classmethod
+    def __resolve_config(cls, resolver, kwds, dict_like_options,
+                         sweep_file, task_index, config=None, strict=True):
+        if (sweep_file is None) != (task_index is None):
+            raise TraitsCLIAttributeError(
+                '--sweep-file and --task-index must be given together')
+        environ = cls.config_from_environ()
+        names = sorted(cls.class_trait_names(cli_paramfile=True))
+        paths = {}
+        config = config or {}
+        for name in names:
+            if name in kwds:
+                paths[name] = kwds[name]
+            elif name in config:
+                paths[name] = config[name]
+            elif name in environ:
+                paths[name] = environ[name]
+        obj = resolver.obj
+        if isinstance(obj, type):
+            for name in names:
+                value = paths[name] if name in paths else \
+                    resolver.current(name)
+                for path in _paramfile_paths(value):
+                    cls.__add_paramfile(resolver, path, strict)
+        else:
+            obj.trait_set(**paths)
+            obj.__paramfile_resolver = resolver
+            try:
+                obj.load_all_paramfiles()
+            finally:
+                obj.__paramfile_resolver = None
+        resolver.add('environ', cls.cli_env_prefix, environ)
+        if sweep_file is not None:
+            resolver.add('sweep file', '{0} (record {1})'.format(
+                sweep_file, task_index),
+                sweep_record(sweep_file, task_index),
+                only_configurable=strict)
+        if config:
+            resolver.add('config', None, config, only_configurable=strict)
+        resolver.add('argument', None, kwds)
+        resolver.add_dict_like_options(dict_like_options)
+        return resolver
+
+    __paramfile_resolver = None
+
+    @classmethod
+    def __add_paramfile(cls, resolver, path, only_configurable=True):
+        param = load_shared_paramfile(cls.dispatch_paramfile_loader(path),
+                                      path)
+        try:
+            resolver.add('paramfile', path, param,
+                         only_configurable=only_configurable)
+        except TraitsCLIAttributeError as e:
+            raise TraitsCLIAttributeError(
+                "Error while loading file {0}: {1}".format(path, e.message))
+
+    @classmethod
+    def validate_config(cls, params):
+        """
+        Validate configuration `params` without making an instance.
+
+        `params` is a (possibly nested) dictionary of values of the
+        configurable attributes, as given to :meth:`setattrs`.  Values
+        are checked by the validators compiled from the trait types
+        (see :func:`trait_validator`), so that no listener is called
+        and no sub-object is created.  A sorted list of ``(dotted_name,
+        message)`` for all invalid values (and non-configurable keys)
+        is returned.
+
+        >>> class SubObject(TraitsCLIBase):
+        ...     lr = Float(config=True)
+        ...
+        >>> class SampleCLI(TraitsCLIBase):
+        ...     n_iter = Int(config=True)
+        ...     sub = Instance(SubObject, config=True)
+        ...
+        >>> SampleCLI.validate_config({'n_iter': 1, 'sub': {'lr': 0.1}})
+        []
+        >>> for error in SampleCLI.validate_config(
+        ...         {'n_iter': 'x', 'sub': {'lr': 'y', 'a': 1}}):
+        ...     print error
+        ('n_iter', "must be an integer (int or long), but 'x' was given")
+        ('sub.a', 'not a configurable attribute')
+        ('sub.lr', "must be a float, but 'y' was given")
+
+        """
+        schema = config_schema(cls)
+        validators = schema.validators
+        errors = []
+        for (key, value) in flatten_param(params, schema.prefixes):
+            check = validators.get(key)
+            if check is None:
+                errors.append((key, 'not a configurable attribute'))
+                continue
+            message = check(value)
+            if message:
+                errors.append((key, message))
+        return sorted(errors)
+
+    @classmethod
+    def check_options(cls, options):
+        """
+        Validate configuration given by `options` (``--check``).
+
+        Configuration is resolved from all sources as :meth:`run`
+        does and validated by :meth:`validate_config`.  Invalid values
+        are reported with their origins by raising
+        :class:`TraitsCLIAttributeError`.
+
+        """
+        builtins = options.builtins
+        resolver = cls.__resolve_config(ConfigResolver(cls), options.kwds,
+                                        options.dict_like_options,
+                                        builtins.get('sweep_file'),
+                                        builtins.get('task_index'),
+                                        builtins.get('config'),
+                                        strict=False)
+        errors = cls.validate_config(resolver.values)
+        if errors:
+            raise TraitsCLIAttributeError('\n'.join(
+                ['Invalid configuration:'] +
+                ['  {0}: {1} ({2})'.format(key, message, resolver.origin(key))
+                 for (key, message) in errors]))
+
+    def config_origin(self, name):
+        """
+        Return a description of where the value of attribute `name` is from.
+
+        `name` can be a dotted name.  It returns `None` if this object
+        is not made by :meth:`run`.
+
+        >>> class SubObject(TraitsCLIBase):
+        ...     lr = Float(config=True)
+        >>> class SampleCLI(TraitsCLIBase):
+        ...     n_iter = Int(config=True)
+        ...     sub = Instance(SubObject, args=(), config=True)
+        ...
+        >>> obj = SampleCLI.cli(['--sub.lr', '0.1'])
+        >>> obj.config_origin('sub.lr')
+        'option --sub.lr'
+        >>> obj.config_origin('n_iter')
+        'default'
+
+        """
+        if self.cli_origins is None:
+            return None
+        return self.cli_origins.origin(name)
+
+    def print_config_origins(self, file=None):
+        """
+        Print configurable attributes and where their values are from.
+        """
+        if file is None:
+            import sys
+            file = sys.stdout
+        keys = sorted(config_schema(type(self)).traits)
+        width = max(map(len, keys)) if keys else 0
+        for key in keys:
+            file.write('{0:{1}} : {2}\n'.format(
+                key, width, self.config_origin(key)))
+
     def load_all_paramfiles(self):
         """
         Load attributes from all parameter files set in paramfile attributes.
@@ -908,14 +3560,9 @@ class TraitsCLIBase(HasTraits):
         u'a'
 
         """
-        for v in self.trait_get(cli_paramfile=True).itervalues():
-            if not v:
-                continue
-            if isinstance(v, (list, tuple)):
-                for path in v:
-                    self.load_paramfile(path)
-            else:
-                self.load_paramfile(v)
+        for name in sorted(self.class_trait_names(cli_paramfile=True)):
+            for path in _paramfile_paths(getattr(self, name)):
+                self.load_paramfile(path)
 
     def load_paramfile(self, path, only_configurable=True):
         """
@@ -952,7 +3599,15 @@ class TraitsCLIBase(HasTraits):
         >>> obj.nonconfigurable
         1
 
+        When called while :meth:`run` resolves the configuration (see
+        :meth:`resolve_config`), the file is added as a source of the
+        configuration instead and no attribute is set here.
+
         """
+        if self.__paramfile_resolver is not None:
+            self.__add_paramfile(self.__paramfile_resolver, path,
+                                 only_configurable)
+            return
         param = self.dispatch_paramfile_loader(path)(path)
         try:
             self.setattrs(param, only_configurable=only_configurable)
@@ -974,9 +3629,88 @@ class TraitsCLIBase(HasTraits):
         Call signature of the loader function must be ``loader(path)``
         where ``path`` is a string file path to the parameter file.
 
+        If there is no such method, the format registered by
+        :func:`register_paramfile_format` for the extension is used.
+        When the extension is unknown or missing, the format is guessed
+        from the first bytes of the file (:func:`sniff_paramfile_format`)
+        and ``loader_{format}`` is returned.
+
+        >>> from tempfile import NamedTemporaryFile
+        >>> with NamedTemporaryFile(suffix='') as f:
+        ...     f.write('{"int": 1}')
+        ...     f.flush()
+        ...     TraitsCLIBase.dispatch_paramfile_loader(f.name)(f.name)
+        {u'int': 1}
+
+        Compressed files (e.g., ``param.json.gz``; see
+        :func:`register_paramfile_compression`) are loaded by the loader
+        for the inner extension.  It is called with the `_open`
+        argument which opens a decompressing stream.
+
+        """
+        (root, ext) = os.path.splitext(path)
+        ext = ext[1:].lower()
+        loader = cls.__loader_for_extension(ext)
+        if loader is not None:
+            return loader
+
+        opener = None
+        if ext in _paramfile_compressions:
+            opener = _paramfile_compressions[ext].open
+            ext = os.path.splitext(root)[-1][1:].lower()
+            loader = cls.__loader_for_extension(ext)
+        if loader is None:
+            with open(path, 'rb') as file:
+                head = file.read(_sniff_size)
+            if opener is None:
+                opener = sniff_paramfile_compression(head)
+            if opener is not None:
+                with opener(path) as file:
+                    head = file.read(_sniff_size)
+            name = sniff_paramfile_format(head)
+            if name is None:
+                raise TraitsCLIAttributeError(
+                    "Cannot determine the format of parameter file {0}"
+                    .format(path))
+            loader = getattr(cls, 'loader_{0}'.format(name))
+
+        if opener is None:
+            return loader
+        return functools.partial(loader, _open=opener)
+
+    @classmethod
+    def __loader_for_extension(cls, ext):
+        if not ext:
+            return None
+        loader = getattr(cls, 'loader_{0}'.format(ext), None)
+        if loader is not None:
+            return loader
+        for fmt in _paramfile_formats.itervalues():
+            if ext in fmt.extensions:
+                return getattr(cls, 'loader_{0}'.format(fmt.name))
+
+    @classmethod
+    def paramfile_extensions(cls):
+        """
+        Return a sorted list of extensions of loadable parameter files.
+
+        It includes extensions of ``loader_{ext}`` methods, extensions
+        registered by :func:`register_paramfile_format` and their
+        compressed variants (e.g., ``json.gz``).
+
+        >>> exts = TraitsCLIBase.paramfile_extensions()
+        >>> ('json' in exts, 'ini' in exts, 'json.gz' in exts)
+        (True, True, True)
+
         """
-        ext = os.path.splitext(path)[-1][1:].lower()
-        return getattr(cls, 'loader_{0}'.format(ext))
+        exts = set(name[len('loader_'):] for name in dir(cls)
+                   if name.startswith('loader_'))
+        for fmt in _paramfile_formats.itervalues():
+            if hasattr(cls, 'loader_{0}'.format(fmt.name)):
+                exts.update(fmt.extensions)
+        exts.update(['{0}.{1}'.format(e, c)
+                     for e in list(exts) for c in _paramfile_compressions])
+        return sorted(exts)
 
     def __footnote_loader_func(func):
         func.__doc__ += """
@@ -997,12 +3731,16 @@ class TraitsCLIBase(HasTraits):
         """
         Load JSON file located at `path`.
 
-        It is equivalent to ``json.load(open(path))``.
+        It is equivalent to ``json.load(open(path))``, but faster
+        decoder ujson_ is used when installed.
+        See :func:`paramfile_backend`.
+
+        .. _ujson: http://pypi.python.org/pypi/ujson
 
         """
-        import json
+        load = paramfile_backend('json').load
         with _open(path) as file:
-            return json.load(file)
+            return load(file)
 
     @staticmethod
     @__footnote_loader_func
@@ -1010,15 +3748,17 @@ class TraitsCLIBase(HasTraits):
         """
         Load YAML file located at `path`.
 
-        It is equivalent to ``yaml.load(open(path))``.
-        You need PyYAML_ module to use this loader.
+        It is equivalent to ``yaml.safe_load(open(path))``.
+        You need PyYAML_ module to use this loader.  LibYAML based
+        `CSafeLoader` is used if PyYAML is built with it.
+        Python-specific tags (e.g., ``!!python/tuple``) are rejected.
 
         .. _PyYAML: http://pypi.python.org/pypi/PyYAML
 
         """
-        import yaml
+        load = paramfile_backend('yaml').load
         with _open(path) as file:
-            return yaml.load(file)
+            return load(file)
 
     loader_yml = loader_yaml
     """Alias to :meth:`loader_yaml`."""
@@ -1031,6 +3771,73 @@ class TraitsCLIBase(HasTraits):
 
     """
 
+    cli_env_prefix = None
+    """
+    Prefix of environment variables to configure this class.
+
+    If this is set to, e.g., ``'MYAPP_'``, environment variable
+    ``MYAPP_SUB__LR=0.1`` sets ``sub.lr`` to 0.1.  See
+    :meth:`config_from_environ`.
+
+    """
+
+    cli_sweep = False
+    """
+    Add ``--sweep-file`` and ``--task-index`` options if True.
+
+    See :meth:`run`.
+
+    """
+
+    @classmethod
+    def config_from_environ(cls, environ=None):
+        """
+        Return parameters defined by environment variables.
+
+        Variable name is :attr:`cli_env_prefix` followed by the upper
+        case attribute name, where dots for nested attributes are
+        replaced by ``__``.  Values are converted in the same way as
+        :meth:`loader_conf`.  Variables with the prefix but not
+        corresponding to configurable attributes are ignored.
+
+        >>> class SubObject(TraitsCLIBase):
+        ...     lr = Float(config=True)
+        >>> class SampleCLI(TraitsCLIBase):
+        ...     n_iter = Int(config=True)
+        ...     sub = Instance(SubObject, args=(), config=True)
+        ...     cli_env_prefix = 'MYAPP_'
+        ...
+        >>> param = SampleCLI.config_from_environ({
+        ...     'MYAPP_N_ITER': '10', 'MYAPP_SUB__LR': '0.1',
+        ...     'MYAPP_HOME': '/unrelated', 'PATH': '/bin'})
+        >>> param == {'n_iter': 10, 'sub.lr': 0.1}
+        True
+
+        """
+        prefix = cls.cli_env_prefix
+        if not prefix:
+            return {}
+        if environ is None:
+            environ = os.environ
+        schema = config_schema(cls)
+        envkeys = schema.environ_keys
+        converters = schema.converters
+        start = len(prefix)
+        param = {}
+        for (name, value) in environ.iteritems():
+            if not name.startswith(prefix):
+                continue
+            key = envkeys.get(name[start:])
+            if key is None:
+                continue
+            try:
+                param[key] = converters[key](value)
+            except (ValueError, TypeError) as e:
+                raise TraitsCLIAttributeError(
+                    "Environment variable {0}: invalid value {1!r}: {2}"
+                    .format(name, value, e))
+        return param
+
     @classmethod
     @__footnote_loader_func
     def loader_conf(cls, path, _open=open):
@@ -1038,7 +3845,9 @@ class TraitsCLIBase(HasTraits):
         Load parameter from conf/ini file.
 
         As conf file has no type information, class traits will be
-        used at load time.
+        used at load time.  Values are converted while the file is
+        read (see :func:`read_conf`) and errors are reported with the
+        line number.
 
         >>> class SubObject(TraitsCLIBase):
         ...     c = Int(config=True)
@@ -1085,47 +3894,42 @@ class TraitsCLIBase(HasTraits):
         True
 
         """
-        import ConfigParser
-        config = ConfigParser.ConfigParser()
         with _open(path) as file:
-            config.readfp(file)
-        sections = config.sections()
-        traits = flattendict(cls.config_traits())
-        param = {}
+            return read_conf(file, cls, path)
 
-        def getoptions(section, prefix=''):
-            for option in config.options(section):
-                key = prefix + option
-                if key in traits:
-                    trait_type = traits[key].trait_type
-                    if isinstance(trait_type, (Bool, CBool)):
-                        param[key] = config.getboolean(section, option)
-                    else:
-                        val = config.get(section, option)
-                        stype = trait_simple_type(trait_type)
-                        if stype:
-                            param[key] = stype(val)
-                        else:
-                            param[key] = val
-                else:
-                    raise TraitsCLIAttributeError(
-                        "Key '{0}' is not configurable attribute of "
-                        "class {1}.".format(key, cls.__name__))
+    loader_ini = loader_conf
+    """Alias to :meth:`loader_conf`."""
 
-        for sect in sections:
-            if cls.cli_conf_root_section == sect:
-                getoptions(sect)
-            else:
-                getoptions(sect, sect + '.')
+    cli_py_cache = False
+    """
+    Cache compiled Python parameter files (:meth:`loader_py`) on disk.
 
-        return param
+    Code objects are stored in the ``pycode`` directory under
+    :func:`cache_dir` and reused while the file modification time and
+    size are unchanged.  This is off by default as the cache grows
+    with every distinct file loaded and nothing removes old entries;
+    turn it on for large Python parameter files loaded many times.
 
-    loader_ini = loader_conf
-    """Alias to :meth:`loader_conf`."""
+    """
 
-    @staticmethod
+    cli_py_isolated = False
+    """
+    Execute Python parameter files (:meth:`loader_py`) in a subprocess.
+
+    See also :attr:`cli_py_timeout`, :attr:`cli_py_memory_limit` and
+    :func:`exec_paramfile_isolated`.
+
+    """
+
+    cli_py_timeout = None
+    """Timeout in seconds for :attr:`cli_py_isolated` mode."""
+
+    cli_py_memory_limit = None
+    """Address space limit in bytes for :attr:`cli_py_isolated` mode."""
+
+    @classmethod
     @__footnote_loader_func
-    def loader_py(path, _open=open):
+    def loader_py(cls, path, _open=open):
         """
         Load parameter from Python file located at `path`.
 
@@ -1142,53 +3946,153 @@ class TraitsCLIBase(HasTraits):
         >>> param == {'a': 1, 'b': {'c': 2}}
         True
 
+        If :attr:`cli_py_isolated` is true, the file is executed in a
+        subprocess and `_open` is not used.  Otherwise, compiled code
+        is cached if :attr:`cli_py_cache` is true and `_open` is not
+        specified.
+
         """
+        if cls.cli_py_isolated:
+            return cleanup_dict(exec_paramfile_isolated(
+                path, cls.cli_py_timeout, cls.cli_py_memory_limit))
+        if cls.cli_py_cache and _open is open:
+            code = compile_cached(path)
+        else:
+            with _open(path) as file:
+                code = compile(file.read(), path, 'exec')
         param = {}
-        with _open(path) as file:
-            exec file.read() in param
+        exec code in param
         return cleanup_dict(param)
 
+    @staticmethod
+    @__footnote_loader_func
+    def loader_msgpack(path, _open=open):
+        """
+        Load MessagePack file located at `path`.
+
+        You need msgpack_ module to use this loader.
+
+        .. _msgpack: http://pypi.python.org/pypi/msgpack
+
+        """
+        load = paramfile_backend('msgpack').load
+        with _open(path) as file:
+            return load(file)
+
+    def dump_config(self, path, _open=None):
+        """
+        Write :meth:`config_snapshot` to a parameter file at `path`.
+
+        The file format is chosen by :meth:`dispatch_paramfile_dumper`
+        and the written file can be read by :meth:`load_paramfile`.
+
+        >>> import os
+        >>> from tempfile import mkdtemp
+        >>> class SampleCLI(TraitsCLIBase):
+        ...     int = Int(config=True)
+        ...
+        >>> path = os.path.join(mkdtemp(), 'param.json')
+        >>> SampleCLI(int=1).dump_config(path)
+        >>> obj = SampleCLI()
+        >>> obj.load_paramfile(path)
+        >>> obj.int
+        1
+
+        """
+        dumper = self.dispatch_paramfile_dumper(path)
+        kwds = {} if _open is None else {'_open': _open}
+        dumper(path, self.config_snapshot(), **kwds)
+
     @classmethod
-    def __classify_kwds(cls, kwds):
-        kwds_paramfile = {}
-        kwds_rest = kwds.copy()
-        for k in cls.class_trait_names(cli_paramfile=True):
-            if k in kwds_rest:
-                kwds_paramfile[k] = kwds_rest.pop(k)
-        return (kwds_paramfile, kwds_rest)
-
-    def __eval_dict_like_options(self, dopts):
-        traits = flattendict(self.config_traits())
-        unknown = set(names_in_dict_like_options(dopts)) - set(traits)
-        if unknown:
-            unknown = tuple(unknown)
-            clargs = ' '.join(
-                '--{0}={1}'.format(k, v) for (k, v) in dopts
-                if k.startswith(unknown))
-            raise InvalidDictLikeOptionError(
-                "Unknown dict-like options {0}".format(clargs))
+    def dispatch_paramfile_dumper(cls, path):
+        """
+        Return a parameter file dumper function based on `path`.
 
-        def value_trait(trait_type):
-            if isinstance(trait_type, Dict):
-                return trait_type.value_trait.trait_type
-            elif isinstance(trait_type, List):
-                return trait_type.item_trait.trait_type
+        This is the counterpart of :meth:`dispatch_paramfile_loader`.
+        It returns a method named ``dumper_{ext}`` and its call
+        signature must be ``dumper(path, param, _open=open)``.
+        Compressed files are supported as well.
 
-        namespace = self.trait_get(config=True)
-        for (lhs, rhs) in dopts:
-            name = lhs.split('[', 1)[0]
-            trait_type = value_trait(traits[name].trait_type)
-            assert_expr(lhs, ast.Subscript)
-            if isinstance(trait_type, (Str, CStr, Unicode, CUnicode)):
-                rhs = repr(rhs)
+        """
+        (root, ext) = os.path.splitext(path)
+        ext = ext[1:].lower()
+        if ext in _paramfile_compressions:
+            opener = _paramfile_compressions[ext].open
+            ext = os.path.splitext(root)[-1][1:].lower()
+            return functools.partial(
+                getattr(cls, 'dumper_{0}'.format(ext)), _open=opener)
+        return getattr(cls, 'dumper_{0}'.format(ext))
+
+    @staticmethod
+    def dumper_json(path, param, _open=open):
+        """
+        Write `param` to JSON file at `path` in :func:`canonical_json` form.
+        """
+        with _open(path, 'w') as file:
+            file.write(canonical_json(param))
+            file.write('\n')
+
+    @staticmethod
+    def dumper_yaml(path, param, _open=open):
+        """
+        Write `param` to YAML file at `path`.
+        """
+        import yaml
+        with _open(path, 'w') as file:
+            yaml.safe_dump(dict(param), file, default_flow_style=False)
+
+    dumper_yml = dumper_yaml
+
+    @classmethod
+    def dumper_conf(cls, path, param, _open=open):
+        """
+        Write `param` to conf/ini file at `path`.
+
+        Dotted keys are grouped into sections so that :meth:`loader_conf`
+        can read them back.  Values of non-simple types are written
+        using `repr`.  So are strings which cannot be written as is
+        (e.g., ones with newlines, ``%`` or ``;``) and strings of
+        non-string traits (otherwise ``'1'`` would be read as ``1``).
+
+        """
+        converters = config_schema(cls).converters
+        sections = {}
+        for (key, value) in param.iteritems():
+            if '.' in key:
+                (sect, option) = key.rsplit('.', 1)
             else:
-                assert_expr(rhs)
-            try:
-                exec '{0} = {1}'.format(lhs, rhs) in namespace
-            except NameError as e:
-                raise TraitsCLIAttributeError(
-                    'Got {0!r} wile evaluating --{1}={2}'.format(
-                        e, lhs, rhs))
+                (sect, option) = (cls.cli_conf_root_section, key)
+            text = value
+            if isinstance(text, unicode):
+                text = text.encode('utf-8')
+            if isinstance(value, bool):
+                value = str(value).lower()
+            elif (converters.get(key) in (str, unicode) and
+                  isinstance(text, str) and _conf_plain_string(text)):
+                value = text
+            else:
+                # ";" starts an inline comment.  In a repr, it appears
+                # only in string literals, where it can be escaped.
+                value = repr(value).replace(';', '\\x3b')
+            sections.setdefault(sect, []).append((option, value))
+
+        root = cls.cli_conf_root_section
+        with _open(path, 'w') as file:
+            for sect in sorted(sections, key=lambda x: (x != root, x)):
+                file.write('[{0}]\n'.format(sect))
+                for (option, value) in sorted(sections[sect]):
+                    file.write('{0} = {1}\n'.format(option, value))
+
+    dumper_ini = dumper_conf
+
+    @staticmethod
+    def dumper_msgpack(path, param, _open=open):
+        """
+        Write `param` to MessagePack file at `path`.
+        """
+        import msgpack
+        with _open(path, 'wb') as file:
+            msgpack.pack(param, file, use_bin_type=True)
 
     @classmethod
     def is_configurable(cls, dottedname):
@@ -1200,14 +4104,123 @@ class TraitsCLIBase(HasTraits):
         if len(names) == 1:
             return True
         tail = names[1]
-        trait_type = traits[head].trait_type
-        if (isinstance(trait_type, Instance) and
-            issubclass(trait_type.klass, TraitsCLIBase)):
-            return trait_type.klass.is_configurable(tail)
+        klass = sub_config_class(traits[head].trait_type)
+        if klass is not None:
+            if issubclass(klass, TraitsCLIBase):
+                return klass.is_configurable(tail)
+            return tail in flattendict(config_traits(klass))
         return False
 
     config_traits = classmethod(config_traits)
 
+    def config_snapshot(self):
+        """
+        Return configurable values as a flat, canonically ordered dict.
+
+        Keys are dotted names (see :func:`flattendict`) sorted
+        alphabetically and values are converted by
+        :func:`canonical_value`.  Paths to parameter files
+        (``cli_paramfile=True``) are not included, as their contents
+        are already reflected in the other values.
+
+        >>> class SubObject(TraitsCLIBase):
+        ...     c = Int(config=True)
+        ...
+        >>> class SampleCLI(TraitsCLIBase):
+        ...     b = List([1], config=True)
+        ...     a = Instance(SubObject, args=(), config=True)
+        ...     paramfile = Str(cli_paramfile=True, config=True)
+        ...
+        >>> SampleCLI().config_snapshot()
+        OrderedDict([('a.c', 0), ('b', [1])])
+
+        """
+        from collections import OrderedDict
+        traits = flattendict(self.config_traits())
+        snapshot = OrderedDict()
+        for k in sorted(traits):
+            if traits[k].cli_paramfile:
+                continue
+            parent = self
+            names = k.split('.')
+            for name in names[:-1]:
+                parent = getattr(parent, name)
+                if parent is None:  # sub-object which is not created
+                    break
+            else:
+                snapshot[k] = canonical_value(getattr(parent, names[-1]))
+        return snapshot
+
+    def config_fingerprint(self):
+        """
+        Return a stable hash (hex string) of :meth:`config_snapshot`.
+
+        It is the SHA-256 digest of the :func:`canonical_json` form of
+        the snapshot, i.e., of the file written by ``dump_config``
+        to a JSON file, except for the trailing newline.
+
+        >>> class SampleCLI(TraitsCLIBase):
+        ...     a = Int(config=True)
+        ...     b = Int(config=True)
+        ...
+        >>> fp = SampleCLI(a=1).config_fingerprint()
+        >>> fp == SampleCLI(b=0, a=1).config_fingerprint()
+        True
+        >>> fp == SampleCLI(a=2).config_fingerprint()
+        False
+
+        """
+        import hashlib
+        return hashlib.sha256(
+            canonical_json(self.config_snapshot())).hexdigest()
+
+    def memo_key(self):
+        """
+        Return the key of :meth:`do_run` result for :attr:`cli_memo`.
+
+        It is made of the class name, :attr:`cli_code_version` and
+        :meth:`config_fingerprint`.
+
+        """
+        import hashlib
+        cls = self.__class__
+        return hashlib.sha256(canonical_json([
+            '{0}.{1}'.format(cls.__module__, cls.__name__),
+            self.cli_code_version,
+            self.config_fingerprint(),
+        ])).hexdigest()
+
+    def memoized_do_run(self):
+        """
+        Call :meth:`do_run` unless its result is stored in :attr:`cli_memo`.
+
+        >>> from tempfile import mkdtemp
+        >>> class SampleCLI(TraitsCLIBase):
+        ...     int = Int(config=True)
+        ...     cli_memo = DirectoryMemoStore(mkdtemp())
+        ...     def do_run(self):
+        ...         print 'Running with int={0}'.format(self.int)
+        ...         return self.int * 2
+        ...
+        >>> SampleCLI.cli(['--int', '1']).cli_result
+        Running with int=1
+        2
+        >>> SampleCLI.cli(['--int', '1']).cli_result  # memoized
+        2
+
+        """
+        memo = self.cli_memo
+        if memo is None:
+            return self.do_run()
+        key = self.memo_key()
+        try:
+            return memo.get(key)
+        except KeyError:
+            pass
+        result = self.do_run()
+        memo.set(key, result)
+        return result
+
     def do_run(self):
         """
         Actual implementation of :meth:`run`.
@@ -1217,7 +4230,8 @@ class TraitsCLIBase(HasTraits):
         """
 
 
-def multi_command_cli(command_class_pairs, args=None, ArgumentParser=None):
+def multi_command_cli(command_class_pairs, args=None, ArgumentParser=None,
+                      pipeline=False):
     """
     Launch CLI to call multiple classes.
 
@@ -1252,15 +4266,440 @@ def multi_command_cli(command_class_pairs, args=None, ArgumentParser=None):
     >>> isinstance(obj, SampleInit)   # used CLI object is returned.
     True
 
+    Instead of a class, a list of ``(name, class)`` pairs can be given
+    to make a nested command group (e.g., ``tool data import ...``)
+    and a class can be given as a ``'package.module:ClassName'``
+    string (see :func:`import_object`).  Only the class of the
+    selected command is imported, so that a tool with many commands
+    starts as fast as the command actually used:
+
+    >>> obj = multi_command_cli(
+    ...     [('init', SampleInit),
+    ...      ('data', [('import', SampleBranch),
+    ...                ('export', 'no_such_module:SampleExport')]),
+    ...     ],
+    ...     ['data', 'import', '--a', '2'])
+    ...
+    Running SampleBranch(a=2)
+
     If `ArgumentParser` is not specified, `ArgumentParser` of the first
-    class will be used.
+    class will be used (`argparse.ArgumentParser` if it is not
+    imported yet).
+
+    When `pipeline` is True, `args` can contain several commands
+    separated by ``--`` (e.g., ``prepare --a 1 -- train -- evaluate``;
+    write ``---`` for a literal ``--``, see :func:`split_pipeline`).
+    They are run in order in this process and the list of used CLI
+    objects is returned.  Later commands receive instances of the
+    earlier ones via attributes with ``cli_pipe=True`` metadata (see
+    :class:`TraitsCLIBase`) and parameter files used by several
+    commands are loaded only once (see :func:`shared_paramfiles`).
+
+    >>> objs = multi_command_cli(
+    ...     [('init', SampleInit), ('branch', SampleBranch)],
+    ...     ['init', '--a', '1', '--', 'branch', '--', 'branch'],
+    ...     pipeline=True)
+    Running SampleInit(a=1)
+    Running SampleBranch(a=0)
+    Running SampleBranch(a=0)
+    >>> len(objs)
+    3
+
+    """
+    if args is None:
+        import sys
+        args = sys.argv[1:]
+    if pipeline:
+        objs = []
+        with shared_paramfiles():
+            for stage in split_pipeline(args):
+                parser = multi_command_argparser(
+                    command_class_pairs, ArgumentParser, args=stage)
+                objs.append(parse_and_run(parser, stage, tuple(objs)))
+        return objs
+    parser = multi_command_argparser(command_class_pairs, ArgumentParser,
+                                     args=args)
+    return parse_and_run(parser, args)
+
+
+def split_pipeline(args, separator='--'):
+    """
+    Split command line arguments `args` of a pipeline by `separator`.
+
+    >>> split_pipeline(['a', '--x', '1', '--', 'b', '--', 'c'])
+    [['a', '--x', '1'], ['b'], ['c']]
+
+    To pass a literal ``--`` to a command (e.g., to end its options),
+    write ``---``.  In general, an argument made of the `separator`
+    followed by more dashes is passed with one dash removed.
+
+    >>> split_pipeline(['a', '---', '-1', '--', 'b', '----'])
+    [['a', '--', '-1'], ['b', '---']]
+
+    """
+    stages = [[]]
+    for arg in args:
+        if arg == separator:
+            stages.append([])
+        elif arg.startswith(separator) and \
+                not arg[len(separator):].strip('-'):
+            stages[-1].append(arg[1:])
+        else:
+            stages[-1].append(arg)
+    return stages
+
+
+def multi_command_argparser(command_class_pairs, ArgumentParser=None,
+                            args=None):
+    """
+    Return an argument parser used by :func:`multi_command_cli`.
+
+    Use this function to build the parser once and call
+    :func:`parse_and_run` many times (see also :mod:`traitscli_server`).
+
+    When command line arguments `args` are given, parsers (and
+    classes given as strings) of commands other than the one selected
+    by `args` are left empty; the returned parser is only good for
+    parsing `args`.
 
     """
     if ArgumentParser is None:
-        ArgumentParser = command_class_pairs[0][1].ArgumentParser
+        first = command_class_pairs[0][1]
+        ArgumentParser = getattr(first, 'ArgumentParser',
+                                 TraitsCLIBase.ArgumentParser)
     parser = ArgumentParser(
         formatter_class=argparse.RawDescriptionHelpFormatter)
-    subpersers = parser.add_subparsers()
-    for (name, cls) in command_class_pairs:
-        cls.add_parser(subpersers.add_parser(name))
-    return parse_and_run(parser, args)
+    add_command_parsers(parser, command_class_pairs, args)
+    return parser
+
+
+def add_command_parsers(parser, command_class_pairs, args=None):
+    """
+    Add sub-parsers of (possibly nested) `command_class_pairs` to `parser`.
+
+    See :func:`multi_command_argparser` for `args`.
+
+    """
+    (selected, rest) = (None, None)
+    if args is not None:
+        for (i, arg) in enumerate(args):
+            if arg == '--':
+                break
+            if not arg.startswith('-'):
+                (selected, rest) = (arg, args[i + 1:])
+                break
+    subparsers = parser.add_subparsers()
+    for (name, target) in command_class_pairs:
+        subparser = subparsers.add_parser(name)
+        if args is not None and name != selected:
+            continue
+        if isinstance(target, (list, tuple)):
+            subparser.formatter_class = parser.formatter_class
+            add_command_parsers(subparser, target, rest)
+        else:
+            import_object(target).add_parser(subparser)
+
+
+def discover_commands(group, path=None):
+    """
+    Return ``(name, 'module:Class')`` pairs registered as entry points.
+
+    Packages register their :class:`TraitsCLIBase` subclasses in the
+    entry point `group` of their ``setup.py``::
+
+      setup(
+          ...
+          entry_points={
+              'mytool.commands': ['train = mypackage.train:TrainCLI'],
+          },
+      )
+
+    and a tool collects them by::
+
+      multi_command_cli(discover_commands('mytool.commands'))
+
+    Classes are not imported here (see :func:`multi_command_cli`).
+
+    Scanning installed distributions (using `pkg_resources`) is slow,
+    so the result is cached in :func:`cache_dir`.  The cache is
+    invalidated when modification time of any distribution metadata
+    (``*.dist-info`` or ``*.egg-info``, etc.) in `path` changes or
+    when a distribution is added to or removed from `path`.  `path`
+    is ``sys.path`` by default.
+
+    """
+    import sys
+    import json
+    import hashlib
+    if path is None:
+        path = sys.path
+    path = [os.path.abspath(p or os.curdir) for p in path]
+    stamp = _distributions_stamp(path)
+    try:
+        cachepath = os.path.join(
+            cache_dir('entry_points'),
+            hashlib.sha1('\0'.join([group] + path)).hexdigest() + '.json')
+    except OSError:
+        cachepath = None
+    else:
+        try:
+            with open(cachepath) as file:
+                cache = json.load(file)
+            if cache['stamp'] == stamp:
+                return [(str(n), str(t)) for (n, t) in cache['commands']]
+        except (IOError, ValueError, KeyError, TypeError):
+            pass
+
+    import pkg_resources
+    commands = {}
+    for ep in pkg_resources.WorkingSet(path).iter_entry_points(group):
+        commands.setdefault(ep.name, '{0}:{1}'.format(
+            ep.module_name, '.'.join(ep.attrs)))
+    commands = sorted(commands.iteritems())
+    if cachepath:
+        try:
+            write_atomic(cachepath, json.dumps(
+                dict(stamp=stamp, commands=commands)))
+        except (IOError, OSError):
+            pass  # cache is not writable; just don't cache
+    return commands
+
+
+_distribution_suffixes = ('.dist-info', '.egg-info', '.egg', '.egg-link')
+
+
+def _distributions_stamp(path):
+    """
+    Return modification times of distribution metadata in `path`.
+    """
+    stamp = []
+    for entry in path:
+        try:
+            names = os.listdir(entry)
+        except OSError:
+            continue  # not a directory (zipped eggs, missing entries)
+        stamp.append([entry, os.stat(entry).st_mtime])
+        for name in sorted(names):
+            if not name.endswith(_distribution_suffixes):
+                continue
+            meta = os.path.join(entry, name)
+            for p in [meta, os.path.join(meta, 'entry_points.txt'),
+                      os.path.join(meta, 'EGG-INFO', 'entry_points.txt')]:
+                try:
+                    stamp.append([p, os.stat(p).st_mtime])
+                except OSError:
+                    pass
+    return stamp
+
+
+class DirectoryMemoStore(object):
+
+    """
+    Memo store for :attr:`TraitsCLIBase.cli_memo` using a directory.
+
+    Each value is pickled into its own file.  Files are written to a
+    temporary file first and then renamed (see :func:`write_atomic`),
+    so that concurrent processes never see partially written files.
+    Files which cannot be unpickled are removed and regarded as
+    missing.
+
+    max_size : int or None
+       When the total size (in bytes) of the stored files exceeds
+       this value, least recently used files are removed.
+
+    max_age : float or None
+       Values stored more than this many seconds ago are ignored and
+       removed.
+
+    >>> from tempfile import mkdtemp
+    >>> store = DirectoryMemoStore(mkdtemp())
+    >>> store.set('key', {'a': 1})
+    >>> store.get('key')
+    {'a': 1}
+    >>> store.get('unknown')
+    Traceback (most recent call last):
+      ...
+    KeyError: 'unknown'
+
+    """
+
+    suffix = '.pickle'
+
+    def __init__(self, path, max_size=None, max_age=None):
+        self.path = path
+        self.max_size = max_size
+        self.max_age = max_age
+
+    def _path(self, key):
+        return os.path.join(self.path, key[:2], key + self.suffix)
+
+    def _expired(self, mtime, now):
+        return self.max_age is not None and now - mtime > self.max_age
+
+    def get(self, key):
+        import time
+        import cPickle as pickle
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as file:
+                stat = os.fstat(file.fileno())
+                if self._expired(stat.st_mtime, time.time()):
+                    raise KeyError(key)
+                try:
+                    value = pickle.load(file)
+                except (EOFError, ValueError, TypeError, AttributeError,
+                        ImportError, IndexError, pickle.UnpicklingError):
+                    # Corrupt file (e.g., a disk got full); drop it.
+                    self._remove(path)
+                    raise KeyError(key)
+            # Record access time for LRU eviction:
+            os.utime(path, (time.time(), stat.st_mtime))
+        except (IOError, OSError):
+            raise KeyError(key)
+        return value
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.unlink(path)
+        except OSError:  # removed by other process
+            pass
+
+    def set(self, key, value):
+        import cPickle as pickle
+        path = self._path(key)
+        dirpath = os.path.dirname(path)
+        if not os.path.isdir(dirpath):
+            try:
+                os.makedirs(dirpath)
+            except OSError:
+                if not os.path.isdir(dirpath):  # not a race
+                    raise
+        write_atomic(path, pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        if self.max_size is not None or self.max_age is not None:
+            self.evict()
+
+    def evict(self):
+        """
+        Remove expired values and then least recently used values.
+        """
+        import time
+        now = time.time()
+        entries = []
+        for (dirpath, _, filenames) in os.walk(self.path):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                    if not name.endswith(self.suffix):
+                        # Leftover of a killed writer?
+                        if now - stat.st_mtime > 3600:
+                            os.unlink(path)
+                    elif self._expired(stat.st_mtime, now):
+                        os.unlink(path)
+                    else:
+                        entries.append((stat.st_atime, stat.st_size, path))
+                except OSError:  # removed by other process
+                    pass
+        if self.max_size is None:
+            return
+        total = sum(size for (_, size, _) in entries)
+        for (_, size, path) in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            total -= size
+
+
+class SQLiteMemoStore(object):
+
+    """
+    Memo store for :attr:`TraitsCLIBase.cli_memo` using SQLite.
+
+    Arguments `max_size` and `max_age` are the same as in
+    :class:`DirectoryMemoStore`.  Each process opens its own
+    connection; SQLite transactions make concurrent writes safe.
+
+    >>> import os
+    >>> from tempfile import mkdtemp
+    >>> store = SQLiteMemoStore(os.path.join(mkdtemp(), 'memo.sqlite'))
+    >>> store.set('key', [1, 2])
+    >>> store.get('key')
+    [1, 2]
+
+    """
+
+    def __init__(self, path, max_size=None, max_age=None, timeout=60):
+        self.path = path
+        self.max_size = max_size
+        self.max_age = max_age
+        self.timeout = timeout
+        self._conn = None
+        self._pid = None
+
+    @property
+    def conn(self):
+        if self._conn is None or self._pid != os.getpid():
+            import sqlite3
+            self._conn = sqlite3.connect(self.path, timeout=self.timeout)
+            self._pid = os.getpid()
+            with self._conn:
+                self._conn.execute(
+                    'CREATE TABLE IF NOT EXISTS memo ('
+                    ' key TEXT PRIMARY KEY, value BLOB, size INTEGER,'
+                    ' created REAL, accessed REAL)')
+        return self._conn
+
+    def get(self, key):
+        import time
+        import cPickle as pickle
+        now = time.time()
+        with self.conn as conn:
+            row = conn.execute(
+                'SELECT value, created FROM memo WHERE key = ?',
+                (key,)).fetchone()
+            if row is None or (self.max_age is not None and
+                               now - row[1] > self.max_age):
+                raise KeyError(key)
+            conn.execute('UPDATE memo SET accessed = ? WHERE key = ?',
+                         (now, key))
+        return pickle.loads(str(row[0]))
+
+    def set(self, key, value):
+        import time
+        import sqlite3
+        import cPickle as pickle
+        now = time.time()
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self.conn as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO memo VALUES (?, ?, ?, ?, ?)',
+                (key, sqlite3.Binary(data), len(data), now, now))
+        if self.max_size is not None or self.max_age is not None:
+            self.evict()
+
+    def evict(self):
+        """
+        Remove expired values and then least recently used values.
+        """
+        import time
+        with self.conn as conn:
+            if self.max_age is not None:
+                conn.execute('DELETE FROM memo WHERE created < ?',
+                             (time.time() - self.max_age,))
+            if self.max_size is None:
+                return
+            (total,) = conn.execute(
+                'SELECT COALESCE(SUM(size), 0) FROM memo').fetchone()
+            if total <= self.max_size:
+                return
+            rows = conn.execute(
+                'SELECT key, size FROM memo ORDER BY accessed').fetchall()
+            for (key, size) in rows:
+                if total <= self.max_size:
+                    break
+                conn.execute('DELETE FROM memo WHERE key = ?', (key,))
+                total -= size
@@ -0,0 +1,406 @@
+"""
+Static shell completion scripts for command line tools made by traitscli.
+
+Dynamic completion (calling the command itself at each TAB) is too
+slow for traitscli based tools, as it needs to start Python and import
+`traits`.  This module generates self-contained bash, zsh or fish
+scripts which have all option names (including dotted options of
+nested classes), sub-commands, `Enum` choices and parameter file
+extensions baked in.
+
+Generate a script for a :class:`TraitsCLIBase` subclass or a command
+table for :func:`multi_command_cli` (specified as ``'module:name'``)::
+
+  python -m traitscli_completion bash sample:SampleCLI --prog sample.py \\
+      --output ~/.bash_completion.d/sample.py
+
+and load it from your shell startup file (``source FILE`` for bash and
+zsh -- after ``compinit`` for zsh -- or put it in
+``~/.config/fish/completions/`` for fish).  Generated script starts
+with the command which regenerates it; re-run it when classes change.
+Files given by ``--output`` are not rewritten when nothing changed.
+
+"""
+
+import re
+import sys
+from pipes import quote
+
+
+SHELLS = ('bash', 'zsh', 'fish')
+
+
+class Command(object):
+
+    """
+    Completion data of a command (or a sub-command).
+
+    options : list of ``(option, kind, arg)``
+       `kind` is one of ``'flag'`` (takes no value), ``'choice'``
+       (`arg` is the list of choices), ``'file'`` (`arg` is the list of
+       file extensions, or None for any file) and ``'value'`` (any
+       value).
+
+    words : list of str
+       Candidates of positional arguments.
+
+    commands : list of ``(name, Command)``
+       Sub-commands.
+
+    """
+
+    def __init__(self, options=(), words=(), commands=()):
+        self.options = list(options)
+        self.words = list(words)
+        self.commands = list(commands)
+
+    def walk(self, path=''):
+        """
+        Yield ``(path, command)`` of this command and sub-commands.
+
+        `path` is the names of sub-commands each of which is preceded
+        by ``/`` (e.g., ``'/train'``).  It is ``''`` for this command.
+
+        """
+        yield (path, self)
+        for (name, command) in self.commands:
+            for item in command.walk('{0}/{1}'.format(path, name)):
+                yield item
+
+    def candidates(self):
+        """Option names, positional words and sub-command names."""
+        return ([o for (o, _, _) in self.options] + self.words +
+                [name for (name, _) in self.commands])
+
+
+def class_spec(cls):
+    """
+    Return :class:`Command` for a subclass `cls` of :class:`TraitsCLIBase`.
+
+    Builtin options such as ``--show-config-origins`` are taken from
+    :func:`traitscli.builtin_arguments`.
+
+    >>> from sample import SampleCLI
+    >>> spec = class_spec(SampleCLI)
+    >>> spec.options                                   # doctest: +ELLIPSIS
+    [('--help', 'flag', None), ('--choice', 'choice', ['a', 'b', 'c']), ...]
+    >>> spec.options[-2:]
+    [('--show-config-origins', 'flag', None), ('--check', 'flag', None)]
+    >>> class_spec(object)
+    Traceback (most recent call last):
+      ...
+    TypeError: Not a subclass of TraitsCLIBase: <type 'object'>
+
+    """
+    from traits.api import Bool, CBool, Enum
+    from traitscli import TraitsCLIBase, config_schema, builtin_arguments
+    if not (isinstance(cls, type) and issubclass(cls, TraitsCLIBase)):
+        raise TypeError(
+            'Not a subclass of TraitsCLIBase: {0!r}'.format(cls))
+    options = [('--help', 'flag', None)]
+    words = []
+    for (key, trait) in sorted(config_schema(cls).traits.iteritems()):
+        trait_type = trait.trait_type
+        if trait.cli_positional:
+            if isinstance(trait_type, Enum):
+                words.extend(map(str, trait_type.values))
+            continue
+        name = '--' + key
+        if trait.cli_paramfile:
+            options.append((name, 'file', cls.paramfile_extensions()))
+        elif isinstance(trait_type, (Bool, CBool)):
+            options.append((name, 'flag', None))
+        elif isinstance(trait_type, Enum):
+            options.append((name, 'choice', map(str, trait_type.values)))
+        else:
+            options.append((name, 'value', None))
+    taken = set(o for (o, _, _) in options)
+    for (name, kwds) in builtin_arguments(cls):
+        if name in taken:  # see traitscli.add_builtin_argument
+            name = '--__' + name.lstrip('-')
+        if 'action' in kwds:
+            options.append((name, 'flag', None))
+        elif kwds.get('metavar') == 'PATH':
+            options.append((name, 'file', None))
+        else:
+            options.append((name, 'value', None))
+    return Command(options, words)
+
+
+def command_spec(target):
+    """
+    Return :class:`Command` for `target`.
+
+    `target` is a subclass of :class:`traitscli.TraitsCLIBase`, a list
+    of ``(name, class)`` pairs for :func:`traitscli.multi_command_cli`,
+    or a ``'module:name'`` string pointing to one of them.  Classes in
+    the list can be nested lists (command groups) or strings as well.
+
+    """
+    from traitscli import import_object
+    target = import_object(target)
+    if isinstance(target, (list, tuple)):
+        return Command(
+            [('--help', 'flag', None)],
+            commands=[(name, command_spec(cls)) for (name, cls) in target])
+    return class_spec(target)
+
+
+def funcname(prog):
+    """
+    Return the name of completion function for `prog`.
+
+    >>> funcname('my-tool.py')
+    '_traitscli_my_tool_py'
+
+    """
+    return '_traitscli_' + re.sub(r'\W', '_', prog)
+
+
+def words(strings):
+    """
+    Quote `strings` as one shell word (for ``compgen -W``, etc.).
+
+    >>> print words(['--a', "it's"])
+    '--a '"'"'it'"'"'"'"'"'"'"'"'s'"'"''
+    >>> print words(['--a', '--b'])
+    '--a --b'
+
+    """
+    return quote(' '.join(map(quote, strings)))
+
+
+def _path_patterns(spec):
+    return '|'.join('"{0}"'.format(path) for (path, _) in spec.walk()
+                    if path)
+
+
+def bash_script(spec, prog):
+    """Return bash completion script for `spec` (a :class:`Command`)."""
+    func = funcname(prog)
+    lines = [
+        '{0}_files() {{'.format(func),
+        '    local cur="$1" ext',
+        '    shift',
+        '    compgen -d -- "$cur"',
+        '    for ext in "$@"; do',
+        '        compgen -f -X "!*.$ext" -- "$cur"',
+        '    done',
+        '}',
+        '',
+        '{0}() {{'.format(func),
+        '    local cur prev cmdpath i',
+        '    COMPREPLY=()',
+        '    cur="${COMP_WORDS[COMP_CWORD]}"',
+        '    prev="${COMP_WORDS[COMP_CWORD-1]}"',
+        '    cmdpath=""',
+    ]
+    if spec.commands:
+        lines += [
+            '    for ((i = 1; i < COMP_CWORD; i++)); do',
+            '        case "$cmdpath/${COMP_WORDS[i]}" in',
+            '            {0}) cmdpath="$cmdpath/${{COMP_WORDS[i]}}";;'
+            .format(_path_patterns(spec)),
+            '        esac',
+            '    done',
+        ]
+    lines.append('    case "$cmdpath" in')
+    for (path, command) in spec.walk():
+        lines += [
+            '    "{0}")'.format(path),
+            '        case "$prev" in',
+        ]
+        values = []
+        for (option, kind, arg) in command.options:
+            if kind == 'choice':
+                lines.append(
+                    '            {0}) COMPREPLY=($(compgen -W {1} -- "$cur"));'
+                    ' return;;'.format(option, words(arg)))
+            elif kind == 'file' and arg is None:
+                lines.append(
+                    '            {0}) COMPREPLY=($(compgen -f -- "$cur"));'
+                    ' return;;'.format(option))
+            elif kind == 'file':
+                lines.append(
+                    '            {0}) COMPREPLY=($({1}_files "$cur" {2}));'
+                    ' return;;'.format(option, func, ' '.join(arg)))
+            elif kind == 'value':
+                values.append(option)
+        if values:
+            lines.append('            {0}) return;;'.format('|'.join(values)))
+        lines += [
+            '        esac',
+            '        COMPREPLY=($(compgen -W {0} -- "$cur"))'.format(
+                words(command.candidates())),
+            '        ;;',
+        ]
+    lines += [
+        '    esac',
+        '}',
+        '',
+        'complete -o filenames -F {0} {1}'.format(func, quote(prog)),
+    ]
+    return lines
+
+
+def zsh_script(spec, prog):
+    """Return zsh completion script for `spec` (a :class:`Command`)."""
+    func = funcname(prog)
+    lines = [
+        '{0}() {{'.format(func),
+        '    local cmdpath="" i prev="${words[CURRENT-1]}"',
+    ]
+    if spec.commands:
+        lines += [
+            '    for ((i = 2; i < CURRENT; i++)); do',
+            '        case "$cmdpath/${words[i]}" in',
+            '            {0}) cmdpath="$cmdpath/${{words[i]}}";;'
+            .format(_path_patterns(spec)),
+            '        esac',
+            '    done',
+        ]
+    lines.append('    case "$cmdpath" in')
+    for (path, command) in spec.walk():
+        lines += [
+            '    "{0}")'.format(path),
+            '        case "$prev" in',
+        ]
+        values = []
+        for (option, kind, arg) in command.options:
+            if kind == 'choice':
+                lines.append('            {0}) compadd -- {1}; return;;'
+                             .format(option, ' '.join(map(quote, arg))))
+            elif kind == 'file' and arg is None:
+                lines.append('            {0}) _files; return;;'
+                             .format(option))
+            elif kind == 'file':
+                lines.append('            {0}) _files -g {1}; return;;'
+                             .format(option,
+                                     quote('*.({0})'.format('|'.join(arg)))))
+            elif kind == 'value':
+                values.append(option)
+        if values:
+            lines.append('            {0}) _message value; return;;'
+                         .format('|'.join(values)))
+        lines += [
+            '        esac',
+            '        compadd -- {0}'.format(
+                ' '.join(map(quote, command.candidates()))),
+            '        ;;',
+        ]
+    lines += [
+        '    esac',
+        '}',
+        '',
+        'compdef {0} {1}'.format(func, quote(prog)),
+    ]
+    return lines
+
+
+def fish_script(spec, prog):
+    """Return fish completion script for `spec` (a :class:`Command`)."""
+    func = funcname(prog)
+    prog = quote(prog)
+    lines = [
+        'function {0}_path'.format(func),
+        '    set -l p ""',
+    ]
+    if spec.commands:
+        lines += [
+            '    for w in (commandline -opc)[2..-1]',
+            '        switch "$p/$w"',
+            '            case {0}'.format(' '.join(
+                quote(path) for (path, _) in spec.walk() if path)),
+            '                set p "$p/$w"',
+            '        end',
+            '    end',
+        ]
+    lines += [
+        '    echo $p',
+        'end',
+        '',
+        'function {0}_files'.format(func),
+        '    for ext in $argv',
+        '        __fish_complete_suffix .$ext',
+        '    end',
+        'end',
+        '',
+        'complete -c {0} -f'.format(prog),
+    ]
+    for (path, command) in spec.walk():
+        cond = quote('test ({0}_path) = "{1}"'.format(func, path))
+        head = 'complete -c {0} -n {1}'.format(prog, cond)
+        for (option, kind, arg) in command.options:
+            long = '-l ' + quote(option[2:])
+            if kind == 'flag':
+                lines.append('{0} {1}'.format(head, long))
+            elif kind == 'choice':
+                lines.append('{0} {1} -x -a {2}'.format(
+                    head, long, words(arg)))
+            elif kind == 'file' and arg is None:
+                lines.append('{0} {1} -x -a {2}'.format(
+                    head, long,
+                    quote('(__fish_complete_path (commandline -ct))')))
+            elif kind == 'file':
+                lines.append('{0} {1} -x -a {2}'.format(
+                    head, long, quote('({0}_files {1})'.format(
+                        func, ' '.join(arg)))))
+            else:
+                lines.append('{0} {1} -x'.format(head, long))
+        rest = command.words + [name for (name, _) in command.commands]
+        if rest:
+            lines.append('{0} -a {1}'.format(head, words(rest)))
+    return lines
+
+
+def completion_script(shell, target, prog, command=None):
+    """
+    Return completion script (a string) of `shell` for `target`.
+
+    See :func:`command_spec` for `target`.  `command` is the command
+    line which regenerates the script; it is written in the header.
+
+    """
+    generate = dict(bash=bash_script, zsh=zsh_script, fish=fish_script)
+    lines = ['# {0} completion for {1} generated by traitscli_completion.'
+             .format(shell, prog)]
+    if command:
+        lines += ['# Regenerate it by:', '#   ' + command]
+    lines.append('')
+    lines += generate[shell](command_spec(target), prog)
+    return '\n'.join(lines) + '\n'
+
+
+def main(args=None):
+    """
+    Entry point of ``python -m traitscli_completion``.
+    """
+    import os
+    import argparse
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description=__doc__)
+    parser.add_argument('shell', choices=SHELLS)
+    parser.add_argument('target', help="'module:name' of the CLI")
+    parser.add_argument('--prog', help='command name (default: module)')
+    parser.add_argument('--output', help='write to this file')
+    if args is None:
+        args = sys.argv[1:]
+    ns = parser.parse_args(args)
+    prog = ns.prog or ns.target.split(':', 1)[0].rsplit('.', 1)[-1]
+    command = ' '.join(map(quote, ['python', '-m', 'traitscli_completion']
+                           + list(args)))
+    script = completion_script(ns.shell, ns.target, prog, command)
+    if not ns.output:
+        sys.stdout.write(script)
+        return
+    if os.path.exists(ns.output):
+        with open(ns.output) as file:
+            if file.read() == script:
+                return
+    from traitscli import write_atomic
+    write_atomic(ns.output, script)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,665 @@
+"""
+Resumable work queue for running many configurations of a CLI class.
+
+Configurations (parameter dicts, as in a sweep file) are stored in a
+SQLite database.  Any number of worker processes -- on one host or on
+several hosts sharing a file system which supports SQLite locking --
+claim a configuration, run it and mark it done or failed.  A claimed
+configuration is leased to the worker for a while and the worker
+extends the lease (heartbeat) while it is running, so that tasks of
+killed or crashed workers are reclaimed by others after the lease
+expires.  Enqueueing the same configurations again skips the ones
+already done; failed ones are retried.
+
+Fill a queue from newline-delimited JSON files (one configuration per
+line; see also :func:`traitscli.sweep_record`)::
+
+  python -m traitscli_queue enqueue queue.sqlite configs.ndjson
+
+Run workers (as many as you want, anywhere)::
+
+  python -m traitscli_queue work queue.sqlite sample:SampleCLI
+
+and check the progress::
+
+  python -m traitscli_queue status queue.sqlite
+
+With ``--workers N``, tasks run in `N` forked worker processes
+supervised by the ``work`` process (see :func:`supervise`), which kills
+tasks running longer than ``--timeout``, limits the address space of
+the workers by ``--memory-limit`` and replaces workers after
+``--max-tasks-per-child`` tasks or above ``--max-rss``.  Killed tasks
+are recorded with the reason and shown by ``status --failures``.
+
+"""
+
+import os
+import sys
+import socket
+import threading
+from collections import namedtuple
+
+
+Task = namedtuple('Task', ['key', 'params', 'attempts'])
+"""A configuration claimed by :meth:`WorkQueue.claim`."""
+
+STATES = ('pending', 'running', 'done', 'failed', 'killed')
+
+
+def task_key(params):
+    """
+    Return the key of configuration `params` (a hash of its canonical form).
+
+    >>> task_key({'a': 1, 'b': [2]}) == task_key({'b': [2], 'a': 1})
+    True
+
+    """
+    import hashlib
+    from traitscli import canonical_json
+    return hashlib.sha256(canonical_json(params)).hexdigest()
+
+
+def default_worker_id():
+    """Return ``'HOSTNAME:PID'`` of this process."""
+    return '{0}:{1}'.format(socket.gethostname(), os.getpid())
+
+
+class WorkQueue(object):
+
+    """
+    Work queue of configurations stored in a SQLite database at `path`.
+
+    lease : float
+       Seconds a claimed task is kept by a worker without heartbeat.
+
+    >>> from tempfile import mkdtemp
+    >>> queue = WorkQueue(os.path.join(mkdtemp(), 'queue.sqlite'))
+    >>> queue.enqueue([{'a': 1}, {'a': 2}, {'a': 1}])
+    2
+    >>> task = queue.claim('worker-1')
+    >>> task.params
+    {u'a': 1}
+    >>> queue.complete(task.key, 'worker-1')
+    True
+    >>> queue.enqueue([{'a': 1}])  # already done
+    0
+    >>> sorted(queue.counts().items())
+    [('done', 1), ('failed', 0), ('killed', 0), ('pending', 1), ('running', 0)]
+
+    """
+
+    def __init__(self, path, lease=300, timeout=60):
+        self.path = path
+        self.lease = lease
+        self.timeout = timeout
+        self._conn = None
+        self._pid = None
+
+    @property
+    def conn(self):
+        if self._conn is None or self._pid != os.getpid():
+            import sqlite3
+            self._conn = sqlite3.connect(self.path, timeout=self.timeout)
+            self._pid = os.getpid()
+            with self._conn:
+                self._conn.execute(
+                    'CREATE TABLE IF NOT EXISTS tasks ('
+                    ' key TEXT PRIMARY KEY, params TEXT, state TEXT,'
+                    ' worker TEXT, lease_until REAL, attempts INTEGER,'
+                    ' created REAL, started_at REAL, finished_at REAL,'
+                    ' error TEXT)')
+                self._conn.execute(
+                    'CREATE INDEX IF NOT EXISTS tasks_state'
+                    ' ON tasks (state)')
+        return self._conn
+
+    def enqueue(self, configs, retry_failed=True, chunk_size=10000):
+        """
+        Add configurations (dicts) `configs`; return the number added.
+
+        Configurations already in the queue are skipped.  Failed ones
+        (and killed ones; see :func:`supervise`) are set back to
+        pending when `retry_failed` is True; they are counted as
+        added.  `configs` can be an iterator; every `chunk_size`
+        configurations are added in one transaction.
+
+        """
+        import time
+        import hashlib
+        import itertools
+        from traitscli import canonical_json
+        now = time.time()
+        conn = self.conn
+        added = 0
+        configs = iter(configs)
+        while True:
+            rows = []
+            for params in itertools.islice(configs, chunk_size):
+                params = canonical_json(params)
+                rows.append((hashlib.sha256(params).hexdigest(), params))
+            if not rows:
+                break
+            with conn:
+                cur = conn.executemany(
+                    'INSERT OR IGNORE INTO tasks'
+                    ' (key, params, state, attempts, created)'
+                    ' VALUES (?, ?, ?, 0, ?)',
+                    ((key, params, 'pending', now)
+                     for (key, params) in rows))
+                added += cur.rowcount
+                if retry_failed:
+                    cur = conn.executemany(
+                        'UPDATE tasks SET state = ?, worker = NULL'
+                        ' WHERE key = ? AND state IN (?, ?)',
+                        (('pending', key, 'failed', 'killed')
+                         for (key, _) in rows))
+                    added += cur.rowcount
+        return added
+
+    def claim(self, worker):
+        """
+        Lease a pending (or expired) task to `worker`; return a :class:`Task`.
+
+        `None` is returned when there is nothing to do.  Tasks are
+        claimed in the order they were enqueued.
+
+        """
+        import json
+        import time
+        while True:
+            now = time.time()
+            with self.conn as conn:
+                row = conn.execute(
+                    'SELECT key, params, attempts FROM tasks'
+                    ' WHERE state = ? ORDER BY rowid LIMIT 1',
+                    ('pending',)).fetchone()
+                if row is None:
+                    row = conn.execute(
+                        'SELECT key, params, attempts FROM tasks'
+                        ' WHERE state = ? AND lease_until < ? LIMIT 1',
+                        ('running', now)).fetchone()
+                if row is None:
+                    return None
+                (key, params, attempts) = row
+                # Another worker may have claimed it in the meantime:
+                cur = conn.execute(
+                    'UPDATE tasks SET state = ?, worker = ?,'
+                    ' lease_until = ?, attempts = ?, started_at = ?'
+                    ' WHERE key = ? AND attempts = ? AND (state = ? OR'
+                    ' (state = ? AND lease_until < ?))',
+                    ('running', worker, now + self.lease, attempts + 1,
+                     now, key, attempts, 'pending', 'running', now))
+                if cur.rowcount:
+                    return Task(key, json.loads(params), attempts + 1)
+
+    def heartbeat(self, key, worker):
+        """
+        Extend the lease of task `key`; return False if it was lost.
+        """
+        import time
+        with self.conn as conn:
+            cur = conn.execute(
+                'UPDATE tasks SET lease_until = ?'
+                ' WHERE key = ? AND worker = ? AND state = ?',
+                (time.time() + self.lease, key, worker, 'running'))
+        return bool(cur.rowcount)
+
+    def _finish(self, key, worker, state, error=None):
+        import time
+        with self.conn as conn:
+            cur = conn.execute(
+                'UPDATE tasks SET state = ?, finished_at = ?, error = ?'
+                ' WHERE key = ? AND worker = ? AND state = ?',
+                (state, time.time(), error, key, worker, 'running'))
+        return bool(cur.rowcount)
+
+    def complete(self, key, worker):
+        """
+        Mark task `key` as done; return False if the lease was lost.
+        """
+        return self._finish(key, worker, 'done')
+
+    def fail(self, key, worker, error):
+        """
+        Mark task `key` as failed with message `error`.
+        """
+        return self._finish(key, worker, 'failed', error)
+
+    def kill(self, key, worker, reason):
+        """
+        Mark task `key` as killed (by :func:`supervise`) for `reason`.
+        """
+        return self._finish(key, worker, 'killed', reason)
+
+    def release(self, key, worker):
+        """
+        Give task `key` back to the queue (e.g., on KeyboardInterrupt).
+        """
+        with self.conn as conn:
+            cur = conn.execute(
+                'UPDATE tasks SET state = ?, worker = NULL'
+                ' WHERE key = ? AND worker = ? AND state = ?',
+                ('pending', key, worker, 'running'))
+        return bool(cur.rowcount)
+
+    def reclaim(self):
+        """
+        Set tasks whose lease expired back to pending; return the number.
+
+        Workers claim expired tasks anyway; this is for bookkeeping
+        (e.g., to see correct :meth:`counts`).
+
+        """
+        import time
+        with self.conn as conn:
+            cur = conn.execute(
+                'UPDATE tasks SET state = ?, worker = NULL'
+                ' WHERE state = ? AND lease_until < ?',
+                ('pending', 'running', time.time()))
+        return cur.rowcount
+
+    def counts(self):
+        """
+        Return a dict mapping states to the number of tasks.
+        """
+        counts = dict((state, 0) for state in STATES)
+        counts.update(self.conn.execute(
+            'SELECT state, COUNT(*) FROM tasks GROUP BY state').fetchall())
+        return dict((str(k), v) for (k, v) in counts.iteritems())
+
+    def failures(self):
+        """
+        Return a list of ``(params, error)`` of failed tasks.
+        """
+        import json
+        return [(json.loads(params), error)
+                for (params, error) in self.conn.execute(
+                    'SELECT params, error FROM tasks WHERE state = ?'
+                    ' ORDER BY rowid', ('failed',))]
+
+    def killed(self):
+        """
+        Return a list of dicts describing killed tasks.
+
+        Each dict has `key`, `params`, `reason`, `worker`, `attempts`,
+        `started_at` and `finished_at` (seconds since the epoch).
+
+        """
+        import json
+        fields = ['key', 'params', 'reason', 'worker', 'attempts',
+                  'started_at', 'finished_at']
+        rows = self.conn.execute(
+            'SELECT key, params, error, worker, attempts, started_at,'
+            ' finished_at FROM tasks WHERE state = ? ORDER BY rowid',
+            ('killed',))
+        killed = [dict(zip(fields, row)) for row in rows]
+        for task in killed:
+            task['params'] = json.loads(task['params'])
+        return killed
+
+
+def _keep_alive(queue, key, worker, stop):
+    # Use own connection; SQLite connections are per thread.
+    queue = WorkQueue(queue.path, queue.lease, queue.timeout)
+    interval = queue.lease / 3.0
+    while not stop.wait(interval):
+        if not queue.heartbeat(key, worker):
+            return
+
+
+def run_task(cls, params):
+    """
+    Run `cls` (a :class:`traitscli.TraitsCLIBase` subclass) with `params`.
+
+    `params` is a (possibly nested) dict of configurable attributes.
+    It overrides parameter files and environment variables but, unlike
+    command line options, it is an error if it has a key which is not
+    configurable (see :meth:`traitscli.TraitsCLIBase.resolve_config`).
+
+    """
+    from traitscli import ParsedOptions, encode_strings
+    return cls.run_options(ParsedOptions(
+        builtins=dict(config=encode_strings(params))))
+
+
+def current_rss():
+    """
+    Return the resident set size of this process in bytes.
+
+    The peak value is returned where the current value is not
+    available (i.e., other than Linux).
+
+    """
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError, IndexError):
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def work(queue, cls, worker=None, max_tasks=None, max_rss=None,
+         notify=None):
+    """
+    Claim and run tasks of `queue` using `cls` until the queue is empty.
+
+    Tasks raising an exception are marked as failed with the
+    traceback and the worker goes on.  At most `max_tasks` tasks are
+    run if it is given, and no more task is claimed once the RSS of
+    this process exceeds `max_rss` bytes after running a task.
+    `notify` is called with the key of a task before running it and
+    with `None` after it.
+    Return the number of tasks run.
+
+    """
+    import traceback
+    from traitscli import import_object
+    cls = import_object(cls)
+    worker = worker or default_worker_id()
+    done = 0
+    while max_tasks is None or done < max_tasks:
+        if max_rss is not None and done and current_rss() > max_rss:
+            break
+        task = queue.claim(worker)
+        if task is None:
+            break
+        if notify:
+            notify(task.key)
+        stop = threading.Event()
+        thread = threading.Thread(target=_keep_alive,
+                                  args=(queue, task.key, worker, stop))
+        thread.daemon = True
+        thread.start()
+        try:
+            run_task(cls, task.params)
+        except (KeyboardInterrupt, SystemExit):
+            queue.release(task.key, worker)
+            raise
+        except Exception:
+            queue.fail(task.key, worker, traceback.format_exc())
+        else:
+            queue.complete(task.key, worker)
+        finally:
+            stop.set()
+            thread.join()
+        if notify:
+            notify(None)
+        done += 1
+    return done
+
+
+RECYCLE = 3
+"""Exit status of a worker process which wants to be replaced."""
+
+
+class _Child(object):
+
+    def __init__(self, pid, rfd):
+        self.pid = pid
+        self.rfd = rfd
+        self.worker = '{0}:{1}'.format(socket.gethostname(), pid)
+        self.buffer = ''
+        self.task = None
+        self.started = None
+        self.reason = None
+
+
+def _child_main(queue, cls, wfd, memory_limit, max_tasks, max_rss):
+    status = 1
+    try:
+        if memory_limit:
+            import resource
+            resource.setrlimit(resource.RLIMIT_AS,
+                               (memory_limit, memory_limit))
+
+        def notify(key):
+            os.write(wfd, '{0}\n'.format(key or ''))
+
+        done = work(queue, cls, default_worker_id(), max_tasks, max_rss,
+                    notify)
+        if done and (max_tasks is not None and done >= max_tasks or
+                     max_rss is not None and current_rss() > max_rss):
+            status = RECYCLE
+        else:
+            status = 0
+    except BaseException:
+        import traceback
+        traceback.print_exc()
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(status)
+
+
+def _describe_status(status):
+    if os.WIFSIGNALED(status):
+        return 'killed by signal {0}'.format(os.WTERMSIG(status))
+    return 'exited with status {0}'.format(os.WEXITSTATUS(status))
+
+
+def supervise(queue, cls, workers=1, timeout=None, memory_limit=None,
+              max_tasks_per_child=None, max_rss=None, poll_interval=0.1,
+              max_crashes=5):
+    """
+    Run tasks of `queue` in `workers` forked worker processes.
+
+    timeout : float
+       A worker running a task longer than this many seconds
+       (wall-clock) is killed.
+
+    memory_limit : int
+       Address space of workers is limited to this many bytes
+       (``RLIMIT_AS``), so that tasks allocating too much memory fail
+       with `MemoryError` rather than make the machine swap or OOM.
+
+    max_tasks_per_child, max_rss : int
+       A worker is replaced by a new one after running this many
+       tasks or when its resident set size exceeds `max_rss` bytes.
+
+    max_crashes : int
+       Give up (raise `RuntimeError`) when workers exit abnormally
+       this many times in a row without starting any task.
+
+    A task whose worker is killed (by the timeout, a signal such as
+    the OOM killer's or a crash) is marked as ``'killed'`` with the
+    reason (see :meth:`WorkQueue.killed`) and other tasks go on.
+    Workers which crash while not running a task are logged to stderr
+    and replaced.  No more worker is started once one exits because
+    the queue is empty.  Return a list of dicts (`key`, `reason`,
+    `worker` and `elapsed`) of the tasks killed in this call.
+
+    """
+    import time
+    import select
+    import signal
+    from traitscli import import_object
+    cls = import_object(cls)  # import errors are raised here, once
+    children = {}
+    killed = []
+    exhausted = False
+    crashes = 0
+    try:
+        while True:
+            while not exhausted and len(children) < workers:
+                (rfd, wfd) = os.pipe()
+                pid = os.fork()
+                if pid == 0:
+                    os.close(rfd)
+                    _child_main(queue, cls, wfd, memory_limit,
+                                max_tasks_per_child, max_rss)
+                os.close(wfd)
+                children[pid] = _Child(pid, rfd)
+            if not children:
+                break
+
+            fds = dict((c.rfd, c) for c in children.itervalues())
+            (readable, _, _) = select.select(list(fds), [], [],
+                                             poll_interval)
+            now = time.time()
+            for fd in readable:
+                child = fds[fd]
+                child.buffer += os.read(fd, 4096)
+                while '\n' in child.buffer:
+                    (line, child.buffer) = child.buffer.split('\n', 1)
+                    (child.task, child.started) = (line or None, now)
+                    crashes = 0
+
+            for child in children.values():
+                if (timeout is not None and child.task and
+                        child.reason is None and
+                        now - child.started > timeout):
+                    child.reason = 'timeout ({0} sec)'.format(timeout)
+                    os.kill(child.pid, signal.SIGKILL)
+                (pid, status) = os.waitpid(child.pid, os.WNOHANG)
+                if pid == 0:
+                    continue
+                del children[pid]
+                child.buffer += _read_all(child.rfd)
+                for line in child.buffer.split('\n')[:-1]:
+                    child.task = line or None
+                os.close(child.rfd)
+                if child.task:
+                    reason = child.reason or _describe_status(status)
+                    queue.kill(child.task, child.worker, reason)
+                    killed.append(dict(key=child.task, reason=reason,
+                                       worker=child.worker,
+                                       elapsed=now - child.started))
+                elif os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0:
+                    exhausted = True  # queue is empty
+                elif not (os.WIFEXITED(status) and
+                          os.WEXITSTATUS(status) == RECYCLE):
+                    crashes += 1
+                    sys.stderr.write('Worker {0} {1}\n'.format(
+                        child.worker, _describe_status(status)))
+                    if crashes >= max_crashes:
+                        raise RuntimeError(
+                            'Workers crashed {0} times in a row'
+                            .format(crashes))
+    finally:
+        for child in children.itervalues():
+            os.kill(child.pid, signal.SIGTERM)
+            os.waitpid(child.pid, 0)
+    return killed
+
+
+def _read_all(fd):
+    chunks = []
+    while True:
+        chunk = os.read(fd, 4096)
+        if not chunk:
+            return ''.join(chunks)
+        chunks.append(chunk)
+
+
+def parse_size(size):
+    """
+    Parse a size in bytes with an optional suffix (K, M or G).
+
+    >>> parse_size('512')
+    512
+    >>> parse_size('2G') == 2 * 1024 ** 3
+    True
+
+    """
+    units = dict(K=1024, M=1024 ** 2, G=1024 ** 3)
+    size = size.strip().upper()
+    if size[-1:] in units:
+        return int(float(size[:-1]) * units[size[-1]])
+    return int(size)
+
+
+def read_configs(paths):
+    """
+    Yield configurations in newline-delimited JSON files at `paths`.
+    """
+    import json
+    for path in paths:
+        with open(path) as file:
+            for line in file:
+                if not line.isspace():
+                    yield json.loads(line)
+
+
+def main(args=None):
+    """
+    Entry point of ``python -m traitscli_queue``.
+    """
+    import argparse
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description=__doc__)
+    subparsers = parser.add_subparsers()
+
+    p = subparsers.add_parser('enqueue', help='add configurations')
+    p.add_argument('queue')
+    p.add_argument('files', nargs='+', help='newline-delimited JSON')
+    p.add_argument('--no-retry-failed', dest='retry_failed',
+                   action='store_false')
+    p.set_defaults(func=lambda ns: sys.stdout.write('{0} added\n'.format(
+        WorkQueue(ns.queue).enqueue(read_configs(ns.files),
+                                    ns.retry_failed))))
+
+    p = subparsers.add_parser('work', help='run tasks')
+    p.add_argument('queue')
+    p.add_argument('target', help="'module:name' of the CLI class")
+    p.add_argument('--lease', type=float, default=300)
+    p.add_argument('--max-tasks', type=int,
+                   help='run at most this many tasks in this process')
+    p.add_argument('--workers', type=int,
+                   help='run tasks in this many supervised processes')
+    p.add_argument('--timeout', type=float,
+                   help='kill tasks running longer (seconds)')
+    p.add_argument('--memory-limit', type=parse_size,
+                   help='address space limit of workers (e.g., 4G)')
+    p.add_argument('--max-tasks-per-child', type=int,
+                   help='replace workers after this many tasks')
+    p.add_argument('--max-rss', type=parse_size,
+                   help='replace workers using more memory (e.g., 2G)')
+
+    def run_work(ns):
+        queue = WorkQueue(ns.queue, lease=ns.lease)
+        if not (ns.workers or ns.timeout or ns.memory_limit or
+                ns.max_tasks_per_child or ns.max_rss):
+            work(queue, ns.target, max_tasks=ns.max_tasks)
+            return
+        for task in supervise(queue, ns.target, ns.workers or 1,
+                              ns.timeout, ns.memory_limit,
+                              ns.max_tasks_per_child, ns.max_rss):
+            sys.stderr.write('Killed {0} ({1}): {2}\n'.format(
+                task['key'], task['worker'], task['reason']))
+
+    p.set_defaults(func=run_work)
+
+    p = subparsers.add_parser(
+        'status', help='show number of tasks (tasks whose lease expired'
+        ' are counted as running until a worker reclaims them)')
+    p.add_argument('queue')
+    p.add_argument('--failures', action='store_true',
+                   help='show errors of failed tasks')
+
+    def status(ns, parser=p):
+        if not os.path.isfile(ns.queue):  # do not create a new queue
+            parser.error('no such queue: {0}'.format(ns.queue))
+        queue = WorkQueue(ns.queue)
+        for (state, num) in sorted(queue.counts().items()):
+            print '{0:8} {1}'.format(state, num)
+        if ns.failures:
+            for (params, error) in queue.failures():
+                print
+                print params
+                print error
+            for task in queue.killed():
+                print
+                print task['params']
+                print 'Killed ({0}): {1}'.format(task['worker'],
+                                                 task['reason'])
+
+    p.set_defaults(func=status)
+
+    ns = parser.parse_args(args)
+    ns.func(ns)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+"""
+Pre-forking server for command line tools made by traitscli.
+
+Importing `traits.api` and building argument parsers takes much longer
+than what small command line tools actually do.  This module provides
+a server which does all of that only once and then forks a child
+process per request, and a tiny client which does not import `traits`
+at all.
+
+Start a server for :class:`TraitsCLIBase` subclass or a command table
+for :func:`multi_command_cli` (specified as ``'module:name'``)::
+
+  python -m traitscli_server --serve sample:SampleCLI /tmp/sample.sock
+
+Then call it with the client::
+
+  python -m traitscli_server /tmp/sample.sock --yes
+
+The client passes its current directory, environment variables,
+command line arguments and standard input/output/error (as file
+descriptors) to the server.  Exit status of the command is used as
+the exit status of the client.  SIGINT and SIGTERM sent to the client
+are forwarded to the forked child.
+
+"""
+
+import os
+import sys
+import json
+import socket
+import signal
+
+from _multiprocessing import sendfd, recvfd
+
+
+STDIO_FDS = (0, 1, 2)
+
+
+def call(path, args=None, prog=None, fds=STDIO_FDS):
+    """
+    Run command at server listening on `path`; return exit status.
+
+    When `args` is not given, ``sys.argv[2:]`` is used (i.e., this
+    module is executed as ``python -m traitscli_server SOCKET ...``).
+
+    """
+    if args is None:
+        args = sys.argv[2:]
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(path)
+    for fd in fds:
+        sendfd(sock.fileno(), fd)
+    header = dict(args=list(args), prog=prog, cwd=os.getcwd(),
+                  env=dict(os.environ))
+    sock.sendall(json.dumps(header) + '\n')
+
+    reply = sock.makefile('rb')
+    pid = reply.readline()
+    if not pid:
+        return 1
+    pid = int(pid)
+
+    def forward(signum, frame):
+        os.kill(pid, signum)
+
+    handlers = [(s, signal.signal(s, forward))
+                for s in (signal.SIGINT, signal.SIGTERM)]
+    try:
+        status = reply.readline()
+    finally:
+        for (s, h) in handlers:
+            signal.signal(s, h)
+        sock.close()
+    # Empty status means that the child died without reporting.
+    return int(status) if status else 1
+
+
+def prepare(target):
+    """
+    Build and return the argument parser for `target`.
+
+    `target` is a subclass of :class:`traitscli.TraitsCLIBase`, a list
+    of ``(name, class)`` pairs for :func:`traitscli.multi_command_cli`,
+    or a ``'module:name'`` string pointing to one of them.
+
+    """
+    from traitscli import import_object, multi_command_argparser
+    target = import_object(target)
+    if isinstance(target, (list, tuple)):
+        return multi_command_argparser(target)
+    else:
+        return target.get_argparser()
+
+
+def serve(target, path, backlog=128):
+    """
+    Listen on a Unix socket at `path` and run `target` per request.
+
+    See :func:`prepare` for `target`.  This function never returns.
+
+    """
+    parser = prepare(target)
+    # Clients may connect as soon as `path` exists; bind to a temporary
+    # path and move it into place only after the socket is listening.
+    tmppath = '{0}.{1}.tmp'.format(path, os.getpid())
+    if os.path.exists(tmppath):
+        os.unlink(tmppath)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(tmppath)
+    server.listen(backlog)
+    os.rename(tmppath, path)
+    # Let the kernel reap the children:
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    while True:
+        (conn, _) = server.accept()
+        if os.fork() == 0:
+            server.close()
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            status = 1
+            try:
+                status = handle(conn, parser)
+            finally:
+                os._exit(status)
+        conn.close()
+
+
+def handle(conn, parser):
+    """
+    Serve a request from a client connected via `conn` (forked child).
+    """
+    from traitscli import parse_and_run, encode_strings
+    fds = [recvfd(conn.fileno()) for _ in STDIO_FDS]
+    header = encode_strings(json.loads(conn.makefile('rb').readline()))
+    conn.sendall('{0}\n'.format(os.getpid()))
+
+    for (fd, target) in zip(fds, STDIO_FDS):
+        os.dup2(fd, target)
+        os.close(fd)
+    os.chdir(header['cwd'])
+    os.environ.clear()
+    os.environ.update(header['env'])
+    if header['prog']:
+        parser.prog = header['prog']
+    sys.argv = [parser.prog] + header['args']
+
+    status = 0
+    try:
+        parse_and_run(parser, header['args'])
+    except SystemExit as e:
+        status = exit_status(e.code)
+    except BaseException:
+        import traceback
+        traceback.print_exc()
+        status = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+    conn.sendall('{0}\n'.format(status))
+    return status
+
+
+def exit_status(code):
+    """
+    Convert `SystemExit.code` to an integer exit status.
+
+    >>> exit_status(None)
+    0
+    >>> exit_status(2)
+    2
+
+    Other objects are printed to stderr and 1 is returned, as Python
+    does for `sys.exit`.
+
+    """
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    sys.stderr.write('{0}\n'.format(code))
+    return 1
+
+
+def main(args=None):
+    """
+    Entry point of ``python -m traitscli_server``.
+    """
+    if args is None:
+        args = sys.argv[1:]
+    if not args or args[0] in ('-h', '--help'):
+        print __doc__
+        return
+    if args[0] == '--serve':
+        serve(args[1], args[2])
+    else:
+        sys.exit(call(args[0], args[1:]))
+
+
+if __name__ == '__main__':
+    main()
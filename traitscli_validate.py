@@ -0,0 +1,154 @@
+"""
+Validate all parameter files under a directory for a CLI class.
+
+Every file whose extension is loadable by the class (see
+:meth:`traitscli.TraitsCLIBase.paramfile_extensions`) is loaded once
+and checked by :meth:`traitscli.TraitsCLIBase.validate_config`; no
+instance of the class is made.  Files are distributed to a pool of
+worker processes, each of which imports the class and compiles its
+validators only once.
+
+Validate files under ``configs/`` for a :class:`TraitsCLIBase`
+subclass (specified as ``'module:name'``)::
+
+  python -m traitscli_validate configs sample:SampleCLI --jobs 8
+
+A result per file is written to stdout as soon as it is ready, as a
+line of JSON (in no particular order)::
+
+  {"path": "configs/a.json", "ok": false, "errors": [
+      {"name": "inum", "message": "must be ...", "line": null}]}
+
+Errors of loading a file have ``null`` as the name.  Exit status is 1
+if any file is invalid.  Directories starting with ``.`` are skipped.
+
+"""
+
+import os
+import sys
+
+
+def iter_paramfiles(root, extensions):
+    """
+    Yield paths of files under `root` ending with one of `extensions`.
+
+    Directories are visited in sorted order and hidden directories
+    (e.g., ``.git``) are skipped.
+
+    """
+    suffixes = tuple('.' + ext.lower() for ext in extensions)
+    for (dirpath, dirnames, filenames) in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith('.'))
+        for name in sorted(filenames):
+            if name.lower().endswith(suffixes):
+                yield os.path.join(dirpath, name)
+
+
+def check_file(cls, path):
+    """
+    Load parameter file at `path` and validate it for `cls`.
+
+    Return a dict with keys ``path``, ``ok`` and ``errors`` (a list of
+    dicts with keys ``name``, ``message`` and ``line``).  The file is
+    loaded by the loader chosen by
+    :meth:`traitscli.TraitsCLIBase.dispatch_paramfile_loader`; the line
+    numbers are known only for the formats which record them (e.g.,
+    conf/ini files).
+
+    """
+    try:
+        param = cls.dispatch_paramfile_loader(path)(path)
+        if not isinstance(param, dict):
+            raise ValueError('Parameter file must be a mapping, not {0}'
+                             .format(type(param).__name__))
+        locations = getattr(param, 'locations', {})
+        errors = [dict(name=name, message=message,
+                       line=locations.get(name))
+                  for (name, message) in cls.validate_config(param)]
+    except Exception as e:
+        errors = [dict(name=None, message='{0}: {1}'.format(
+            type(e).__name__, e), line=None)]
+    return dict(path=path, ok=not errors, errors=errors)
+
+
+_worker_class = []
+
+
+def prepare(target):
+    """
+    Import `target` and compile its validators; return the class.
+    """
+    from traitscli import import_object, config_schema
+    cls = import_object(target)
+    config_schema(cls).validators
+    return cls
+
+
+def _init_worker(target):
+    _worker_class[:] = [prepare(target)]
+
+
+def _check_path(path):
+    return check_file(_worker_class[0], path)
+
+
+def validate_tree(root, target, jobs=None, chunksize=64):
+    """
+    Validate parameter files under `root`; yield results of :func:`check_file`.
+
+    `target` is a subclass of :class:`traitscli.TraitsCLIBase` or a
+    ``'module:name'`` string pointing to it.  Files are checked in
+    `jobs` processes (default: number of CPUs) and results are yielded
+    in the order of completion.  When `jobs` is 1, files are checked in
+    this process.
+
+    """
+    cls = prepare(target)  # import errors are raised here, once
+    paths = iter_paramfiles(root, cls.paramfile_extensions())
+    if jobs == 1:
+        for path in paths:
+            yield check_file(cls, path)
+        return
+    import multiprocessing
+    pool = multiprocessing.Pool(jobs, _init_worker, (cls,))
+    try:
+        for result in pool.imap_unordered(_check_path, paths, chunksize):
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def main(args=None):
+    """
+    Entry point of ``python -m traitscli_validate``.
+    """
+    import json
+    import argparse
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description=__doc__)
+    parser.add_argument('root', help='directory of parameter files')
+    parser.add_argument('target', help="'module:name' of the CLI class")
+    parser.add_argument('--jobs', '-j', type=int,
+                        help='number of processes (default: CPUs)')
+    parser.add_argument('--only-failures', action='store_true',
+                        help='write results of invalid files only')
+    ns = parser.parse_args(args)
+    (total, failed) = (0, 0)
+    for result in validate_tree(ns.root, ns.target, ns.jobs):
+        total += 1
+        if not result['ok']:
+            failed += 1
+        elif ns.only_failures:
+            continue
+        sys.stdout.write(json.dumps(result) + '\n')
+        sys.stdout.flush()
+    sys.stderr.write('{0} of {1} files are invalid\n'.format(failed, total))
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()